@@ -0,0 +1,130 @@
+"""
+batch_engine.py - Concurrent batch engine with separate download and transcode pools
+
+Downloads are mostly network wait, so they run on a wider pool. FFmpeg work is
+CPU bound and gets its own pool sized to the machine, so a burst of finished
+downloads can't oversubscribe the CPU.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+
+def default_transcode_workers():
+    """One FFmpeg process per CPU"""
+    return max(1, os.cpu_count() or 1)
+
+
+def failure(url, error):
+    """Standard failed-job result"""
+    return {'success': False, 'error': str(error), 'url': url}
+
+
+class BatchEngine:
+    """
+    Run (download -> transcode) jobs over a list of URLs
+
+    Args:
+        download_workers: Concurrent download stages
+        transcode_workers: Concurrent transcode stages (default: CPU count)
+        ordered: Yield results in input order instead of completion order
+        max_pending: Jobs in flight or waiting to be yielded at once (default:
+                     4x download workers), so long or lazy URL sources are
+                     consumed incrementally
+    """
+
+    def __init__(self, download_workers=DEFAULT_DOWNLOAD_WORKERS, transcode_workers=None,
+                 ordered=True, max_pending=None):
+        self.download_workers = max(1, int(download_workers))
+        self.transcode_workers = max(1, int(transcode_workers or default_transcode_workers()))
+        self.ordered = ordered
+        self.max_pending = max_pending or self.download_workers * 4
+
+    def run(self, urls, download, transcode=None):
+        """
+        Process URLs, yielding one result dict per URL
+
+        Args:
+            urls: Any iterable of URLs
+            download: Callable(url) -> dict. Its result is final unless a
+                      transcode stage is given and the download succeeded
+                      without being marked 'skipped'.
+            transcode: Optional callable(download_result) -> dict, run on the
+                       transcode pool
+
+        Yields:
+            dict: {'success', 'filename', 'title', 'url', ...} per job
+        """
+        download_pool = ThreadPoolExecutor(self.download_workers, thread_name_prefix='download')
+        transcode_pool = None
+        if transcode is not None:
+            transcode_pool = ThreadPoolExecutor(self.transcode_workers, thread_name_prefix='transcode')
+
+        source = enumerate(urls)
+        in_flight = {}
+        finished = {}
+        next_index = 0
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(in_flight) + len(finished) < self.max_pending:
+                    try:
+                        index, url = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    job = self._submit(url, download, transcode, download_pool, transcode_pool)
+                    in_flight[job] = index
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for job in done:
+                    index = in_flight.pop(job)
+                    if self.ordered:
+                        finished[index] = job.result()
+                    else:
+                        yield job.result()
+
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+        finally:
+            download_pool.shutdown(wait=True, cancel_futures=True)
+            if transcode_pool is not None:
+                transcode_pool.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, url, download, transcode, download_pool, transcode_pool):
+        """Chain the stages for one URL into a single future"""
+        job = Future()
+
+        def finish(stage, fallback_url):
+            try:
+                result = stage.result()
+            except Exception as e:
+                result = failure(fallback_url, e)
+            if not isinstance(result, dict):
+                result = failure(fallback_url, f'Unexpected result: {result!r}')
+            return result
+
+        def after_transcode(stage):
+            job.set_result(finish(stage, url))
+
+        def after_download(stage):
+            result = finish(stage, url)
+            if transcode_pool is None or not result.get('success') or result.get('skipped'):
+                job.set_result(result)
+                return
+            try:
+                transcode_pool.submit(transcode, result).add_done_callback(after_transcode)
+            except RuntimeError as e:
+                job.set_result(failure(url, e))
+
+        try:
+            download_pool.submit(download, url).add_done_callback(after_download)
+        except RuntimeError as e:
+            job.set_result(failure(url, e))
+        return job
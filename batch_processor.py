@@ -3,52 +3,241 @@ batch_processor.py - Handle batch downloads from files
 """
 import os
 import json
+import re
+import sys
+from array import array
+from binascii import a2b_base64
+
+import url_parser
 
 def read_urls_from_file(filepath):
     """Read URLs from text file"""
-    urls = []
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    urls.append(line)
-        return urls
+        return list(iter_urls_from_file(filepath))
     except Exception as e:
         print(f"Error reading file: {e}")
         return []
 
+def iter_urls(lines):
+    """
+    Yield URLs from lines (or a text blob), skipping blanks and # comments
+    
+    A string is walked line by line without splitting it into a list.
+    """
+    if isinstance(lines, str):
+        lines = (match.group() for match in _LINE_PATTERN.finditer(lines))
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+_LINE_PATTERN = re.compile(r'[^\r\n]+')
+
+def iter_urls_from_file(filepath):
+    """Yield URLs from a text file one line at a time ('-' reads stdin)"""
+    if filepath == '-':
+        yield from iter_urls(sys.stdin)
+        return
+    with open(filepath, 'r', encoding='utf-8') as f:
+        yield from iter_urls(f)
+
+def canonical_url(url, allow_collections=True):
+    """
+    Normalize a URL (see url_parser): videos become a watch URL on their ID,
+    playlists and channels their plain URL. None if it isn't a YouTube
+    video/collection.
+    """
+    parsed = url_parser.parse(url)
+    if parsed is None or (not allow_collections and parsed.kind != url_parser.VIDEO):
+        return None
+    return parsed.canonical
+
+def ingest_urls(urls, allow_collections=True, on_invalid=None):
+    """
+    Validate and normalize URLs lazily, in input order
+    
+    Pair with iter_urls_from_file/iter_urls/iter_urls_from_text so a batch
+    of any size is read as the worker queue pulls from it. Duplicates are
+    dropped later, by video ID, in playlist.expand_urls.
+    
+    Args:
+        urls: Iterable of URLs
+        allow_collections: Pass playlist/channel URLs through
+        on_invalid: Optional callable(url) for each rejected URL
+    """
+    for url in urls:
+        canonical = canonical_url(url, allow_collections)
+        if canonical is not None:
+            yield canonical
+        elif on_invalid is not None:
+            on_invalid(url)
+
 def save_batch_results(results, output_file="batch_results.json"):
-    """Save batch download results to JSON file"""
+    """
+    Save batch download results to JSON file
+    
+    results can be any iterable; it is written one result at a time (the
+    same layout json.dump gives a list), so a generator over a journal
+    never has to be held in memory.
+    """
     try:
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+            separator = '[\n  '
+            for result in results:
+                f.write(separator)
+                f.write(json.dumps(result, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+                separator = ',\n  '
+            f.write('[]' if separator == '[\n  ' else '\n]')
         return True
     except Exception as e:
         print(f"Error saving results: {e}")
         return False
 
-def validate_urls(urls):
-    """Validate YouTube URLs"""
+def validate_urls(urls, check_available=False, allow_collections=True):
+    """
+    Validate YouTube URLs
+    
+    Playlist and channel URLs are valid too; expand them with
+    playlist.expand_urls. Valid URLs are returned in canonical form
+    (see canonical_url), invalid ones as given.
+    
+    Args:
+        urls: List of URLs
+        allow_collections: Accept playlist/channel URLs (False treats them as invalid)
+        check_available: Also look each URL up (through the metadata cache)
+                         and reject videos that can't be extracted
+    """
     validated = []
     invalid = []
     
     for url in urls:
-        if 'youtube.com/watch' in url or 'youtu.be/' in url:
-            validated.append(url)
+        canonical = canonical_url(url, allow_collections)
+        if canonical is not None:
+            validated.append(canonical)
         else:
             invalid.append(url)
     
+    if check_available and validated:
+        from converter import get_video_info
+        available = []
+        for url in validated:
+            if is_collection_url(url):
+                available.append(url)
+            elif 'error' in get_video_info(url):
+                invalid.append(url)
+            else:
+                available.append(url)
+        validated = available
+    
     return validated, invalid
 
+def extract_video_id(url):
+    """Return the 11-character YouTube video ID in a URL, or None"""
+    return url_parser.video_id(url)
+
+def is_collection_url(url):
+    """True for a playlist or channel URL (something to expand into videos)"""
+    # A watch URL with &list= is a single video
+    parsed = url_parser.parse(url)
+    return parsed is not None and parsed.kind != url_parser.VIDEO
+
+class VideoIdSet:
+    """
+    Compact set of YouTube video IDs, for deduplicating huge batches
+    
+    An 11-character ID is 64 bits of base64url, so IDs are stored packed in
+    an open-addressing table of unsigned 64-bit slots: about 12-24 bytes
+    per ID, against roughly 100 for a set of str. Anything that isn't a
+    well-formed ID goes in an ordinary set.
+    """
+    
+    _EMPTY = 0
+    _MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing spreads sequential keys
+    
+    def __init__(self, ids=()):
+        self._bits = 10
+        self._slots = _empty_slots(1 << self._bits)
+        self._size = 0
+        self._zero = False  # 'AAAAAAAAAAA' packs to 0, the empty-slot marker
+        self._other = set()
+        for video_id in ids:
+            self.add(video_id)
+    
+    def __len__(self):
+        return self._size + self._zero + len(self._other)
+    
+    def __contains__(self, video_id):
+        key = _pack_video_id(video_id)
+        if key is None:
+            return video_id in self._other
+        if key == self._EMPTY:
+            return self._zero
+        return self._slots[self._probe(key)] == key
+    
+    def add(self, video_id):
+        key = _pack_video_id(video_id)
+        if key is None:
+            self._other.add(video_id)
+        elif key == self._EMPTY:
+            self._zero = True
+        else:
+            index = self._probe(key)
+            if self._slots[index] != key:
+                self._slots[index] = key
+                self._size += 1
+                if self._size * 3 > len(self._slots) * 2:
+                    self._grow()
+    
+    def nbytes(self):
+        """Approximate memory held by the table (not counting _other)"""
+        return self._slots.itemsize * len(self._slots)
+    
+    def _probe(self, key):
+        """Slot holding key, or the empty slot where it would go"""
+        slots = self._slots
+        mask = len(slots) - 1
+        index = ((key * self._MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - self._bits)
+        while slots[index] != self._EMPTY and slots[index] != key:
+            index = (index + 1) & mask
+        return index
+    
+    def _grow(self):
+        old = self._slots
+        self._bits += 1
+        self._slots = _empty_slots(1 << self._bits)
+        for key in old:
+            if key != self._EMPTY:
+                self._slots[self._probe(key)] = key
+
+def _empty_slots(count):
+    # Repeating a one-item array avoids a same-sized temporary bytes object
+    return array('Q', [VideoIdSet._EMPTY]) * count
+
+_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{10}[AEIMQUYcgkosw048]')
+_TO_STANDARD_BASE64 = str.maketrans('-_', '+/')
+
+def _pack_video_id(video_id):
+    """The 64 bits of an 11-character video ID as an int, or None"""
+    # The last character carries 4 bits, so only 16 characters can end an ID
+    if not isinstance(video_id, str) or not _ID_PATTERN.fullmatch(video_id):
+        return None
+    return int.from_bytes(a2b_base64(video_id.translate(_TO_STANDARD_BASE64) + '='), 'big')
+
+# Video and collection URLs inside arbitrary text
+_TEXT_URL_PATTERN = re.compile(
+    r'(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com|youtu\.be)/[^\s<>"\']+')
+
+def iter_urls_from_text(text):
+    """Yield normalized YouTube URLs found anywhere in a block of text"""
+    for match in _TEXT_URL_PATTERN.finditer(text):
+        url = canonical_url(match.group().rstrip('.,;:!?)]'))
+        if url is not None:
+            yield url
+
 # Optional: Additional utility functions
 def extract_urls_from_text(text):
     """Extract URLs from a block of text"""
-    import re
-    # Simple URL regex pattern
-    url_pattern = r'https?://(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/)[\w-]+'
-    urls = re.findall(url_pattern, text)
-    return urls
+    return list(iter_urls_from_text(text))
 
 def create_urls_template(output_file="urls_template.txt"):
     """Create a template file for URLs"""
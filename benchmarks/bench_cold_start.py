@@ -0,0 +1,73 @@
+"""
+bench_cold_start.py - Startup time of the headless entry point
+
+Times fresh interpreter processes importing the headless modules and running
+'cli.py --help', against a bare 'python -c pass' baseline, and reports
+whether any heavy module (yt_dlp, tkinter) was imported on the way. Prints
+one JSON object and exits non-zero if a heavy module shows up.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('yt_dlp', 'tkinter', 'main')
+
+# Imports everything a headless batch touches before the first job starts
+IMPORT_PROBE = (
+    "import sys, json, cli, converter, batch_processor\n"
+    f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+)
+
+SCENARIOS = (
+    ('python_baseline', [sys.executable, '-c', 'pass']),
+    ('import_headless', [sys.executable, '-c', IMPORT_PROBE]),
+    ('cli_help', [sys.executable, os.path.join(REPO_ROOT, 'cli.py'), '--help']),
+)
+
+
+def time_command(cmd, runs):
+    timings = []
+    output = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            raise RuntimeError(f'{cmd!r} failed: {proc.stderr.strip()}')
+        output = proc.stdout
+    return timings, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    heavy = []
+    for label, cmd in SCENARIOS:
+        timings, output = time_command(cmd, args.runs)
+        if label == 'import_headless':
+            heavy = json.loads(output)
+        results.append({'scenario': label, 'best_seconds': round(min(timings), 4),
+                        'mean_seconds': round(sum(timings) / len(timings), 4)})
+
+    baseline = results[0]['best_seconds']
+    for result in results[1:]:
+        result['over_baseline_seconds'] = round(result['best_seconds'] - baseline, 4)
+
+    print(json.dumps({'benchmark': 'cold_start', 'runs': args.runs,
+                      'heavy_modules_imported': heavy, 'results': results}, indent=2))
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+bench_ingest.py - Memory of a streamed batch over large URL files
+
+Writes synthetic URL files (mixed watch/short/youtu.be forms, tracking
+parameters, comments, blank and invalid lines, ~10% duplicates) and runs
+each one through the path `cli.py batch` takes: ingest_urls ->
+JobJournal.feed -> converter.batch_download (playlist expansion, dedup,
+archive lookups, journaling every state change, progress and the closing
+summary) -> write_results. Only the conversion itself is replaced by a
+no-op that reports success at once, so the run measures the batch
+machinery rather than the network or FFmpeg.
+
+Each file size runs twice: once timed, once under tracemalloc for peak
+Python heap (tracing slows it down). The peak may grow only by the
+compact per-video state (the journal's and expand_urls' VideoIdSets),
+so the benchmark fails if the growth between the smallest and largest
+file exceeds --max-bytes-per-video. Caches, archive and journal live in a
+temp directory. Prints one JSON object.
+
+About 1,200 videos a second here, so the full-size check
+(--lines 100000 1000000) runs for the better part of an hour.
+
+Usage:
+    python benchmarks/bench_ingest.py [--lines 10000 100000] [--max-bytes-per-video 256]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import local_media  # noqa: F401  (puts the repo root on sys.path)
+
+import converter
+import download_archive
+import metadata_cache
+import source_cache
+from batch_processor import ingest_urls, iter_urls_from_file
+from job_journal import JobJournal
+
+ALPHABET = string.ascii_letters + string.digits + '-_'
+FORMS = [
+    'https://www.youtube.com/watch?v={}',
+    'https://youtube.com/watch?v={}&list=PLabc&index=3',
+    'https://youtu.be/{}?si=tracking',
+    'https://www.youtube.com/shorts/{}',
+    'https://m.youtube.com/watch?feature=share&v={}',
+]
+
+
+def write_file(path, lines, seed=1):
+    rng = random.Random(seed)
+    recent = []
+    with open(path, 'w', encoding='utf-8') as f:
+        for n in range(lines):
+            roll = rng.random()
+            if roll < 0.01:
+                f.write('# comment\n')
+            elif roll < 0.02:
+                f.write('\n')
+            elif roll < 0.03:
+                f.write(f'https://example.com/not-youtube/{n}\n')
+            else:
+                if recent and roll < 0.13:
+                    video_id = rng.choice(recent)
+                else:
+                    video_id = ''.join(rng.choice(ALPHABET) for _ in range(10)) + rng.choice('AEIMQUYcgkosw048')
+                    recent = (recent + [video_id])[-1000:]
+                f.write(rng.choice(FORMS).format(video_id) + '\n')
+
+
+@contextlib.contextmanager
+def no_op_converter(output):
+    """Replace the download and transcode stages with instant successes"""
+    with open(output, 'wb') as f:
+        f.write(b'\0' * 1024)
+
+    def download_audio(url, output_folder, *args, **kwargs):
+        return {'success': True, 'url': url, 'title': url, 'filename': output, 'size': 1024}
+
+    def transcode_audio(download, *args, **kwargs):
+        return dict(download)
+
+    saved = converter.download_audio, converter.transcode_audio
+    converter.download_audio, converter.transcode_audio = download_audio, transcode_audio
+    try:
+        yield
+    finally:
+        converter.download_audio, converter.transcode_audio = saved
+
+
+def batch(path, workdir):
+    """One `cli.py batch` run over path; returns (jobs, journal bytes)"""
+    journal_path = os.path.join(workdir, 'journal.jsonl')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        urls = ingest_urls(iter_urls_from_file(path))
+        with JobJournal.create((), {'quality': '192'}, journal_path, source=path) as journal:
+            totals = converter.batch_download(journal.feed(urls), workdir, '192', journal=journal,
+                                              show_progress=False, profile=False)
+            journal.write_results(os.path.join(workdir, 'batch_results.json'))
+    size = os.path.getsize(journal_path)
+    os.remove(journal_path)
+    return totals['jobs'], size
+
+
+def sandbox(workdir):
+    """Fresh archive and caches, so every run converts every video"""
+    cache_dir = tempfile.mkdtemp(dir=workdir)
+    download_archive.configure(cache_dir)
+    metadata_cache.configure(cache_dir)
+    source_cache.configure(cache_dir)
+
+
+def measure(path, lines, workdir):
+    sandbox(workdir)
+    start = time.perf_counter()
+    jobs, journal_bytes = batch(path, workdir)
+    elapsed = time.perf_counter() - start
+    sandbox(workdir)
+    tracemalloc.start()
+    batch(path, workdir)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'lines': lines, 'videos': jobs, 'seconds': round(elapsed, 2),
+            'videos_per_second': round(jobs / elapsed), 'journal_mib': round(journal_bytes / 2 ** 20, 1),
+            'peak_heap_mib': round(peak / 2 ** 20, 1), 'peak_heap_bytes': peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--max-bytes-per-video', type=float, default=256,
+                        help='Fail if peak heap grows by more than this per extra video')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        with no_op_converter(os.path.join(workdir, 'output.mp3')):
+            for lines in sorted(args.lines):
+                path = os.path.join(workdir, f'urls-{lines}.txt')
+                write_file(path, lines)
+                results.append(measure(path, lines, workdir))
+                os.remove(path)
+
+    report = {'benchmark': 'ingest', 'results': results}
+    failed = False
+    if len(results) > 1:
+        small, large = results[0], results[-1]
+        growth = (large['peak_heap_bytes'] - small['peak_heap_bytes']) / max(1, large['videos'] - small['videos'])
+        failed = growth > args.max_bytes_per_video
+        report['peak_growth_bytes_per_video'] = round(growth, 1)
+        report['max_bytes_per_video'] = args.max_bytes_per_video
+    print(json.dumps(report, indent=2))
+    if failed:
+        print(f"Peak heap grew by more than {args.max_bytes_per_video:g} bytes per video", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+bench_job_store.py - Several worker processes draining one shared job store
+
+Fills a store with items (including duplicate URL forms of the same video),
+then starts worker processes against it with a simulated conversion that
+sleeps. One worker is killed partway through, so its leased items have to
+expire and be picked up by the others. Checks that every item finished
+exactly once and prints one JSON object.
+
+Usage:
+    python benchmarks/bench_job_store.py [--items 200] [--processes 1 2 4] [--work 0.05]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import local_media  # noqa: F401  (puts the repo root on sys.path)
+
+from job_store import JobStore, StoreWorker, DONE
+
+
+def simulated_convert(work):
+    def convert(url, options):
+        time.sleep(work)
+        return {'success': True, 'url': url, 'title': url}
+    return convert
+
+
+def worker_main(args):
+    store = JobStore(args.store, lease=args.lease)
+    worker = StoreWorker(store, simulated_convert(args.work), concurrency=args.concurrency,
+                         worker_id=args.worker_id, poll_interval=0.05, exit_when_empty=True)
+    print(json.dumps(worker.run()))
+    store.close()
+
+
+def held_by(path, worker_id):
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        return db.execute('SELECT COUNT(*) FROM items WHERE owner = ?', (worker_id,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def run_round(processes, args, workdir):
+    path = os.path.join(workdir, f'store-{processes}.sqlite3')
+    store = JobStore(path, lease=args.lease)
+    urls = [f'https://www.youtube.com/watch?v=vid{i:08d}' for i in range(args.items)]
+    # Same videos again in short form: must be deduplicated, not converted twice
+    duplicates = [f'https://youtu.be/vid{i:08d}' for i in range(0, args.items, 10)]
+    added, skipped = store.add(urls + duplicates, {'codec': 'mp3', 'quality': '192'})
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--role', 'worker', '--store', path,
+           '--work', str(args.work), '--lease', str(args.lease),
+           '--concurrency', str(args.concurrency)]
+    start = time.perf_counter()
+    workers = [subprocess.Popen(cmd + ['--worker-id', f'bench-{i}'], stdout=subprocess.PIPE, text=True)
+               for i in range(processes)]
+    killed = False
+    if processes > 1:
+        # Kill the first worker while it holds leases, without releasing them
+        while not killed and workers[0].poll() is None:
+            if held_by(path, 'bench-0'):
+                workers[0].kill()
+                killed = True
+            time.sleep(0.01)
+    stats = []
+    for proc in workers:
+        out, _ = proc.communicate()
+        if out.strip():
+            stats.append(json.loads(out.strip().splitlines()[-1]))
+    elapsed = time.perf_counter() - start
+
+    counts = store.counts()
+    retried = sum(1 for r in store.results() if r.get('attempts', 1) > 1)
+    store.close()
+    return {
+        'processes': processes,
+        'items': added,
+        'deduplicated': skipped,
+        'seconds': round(elapsed, 4),
+        'items_per_second': round(added / elapsed, 1),
+        'killed_worker': killed,
+        'retried_after_lease_expiry': retried,
+        'all_done_once': counts.get(DONE, 0) == added and sum(s['done'] for s in stats) == added,
+        'counts': counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=4, help='Threads per worker process')
+    parser.add_argument('--work', type=float, default=0.05, help='Simulated seconds per item')
+    parser.add_argument('--lease', type=float, default=1.0)
+    parser.add_argument('--role', default='bench', choices=['bench', 'worker'])
+    parser.add_argument('--store')
+    parser.add_argument('--worker-id')
+    args = parser.parse_args()
+
+    if args.role == 'worker':
+        return worker_main(args)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_round(n, args, workdir) for n in args.processes]
+    print(json.dumps({'benchmark': 'job_store', 'work_seconds': args.work,
+                      'lease': args.lease, 'results': results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
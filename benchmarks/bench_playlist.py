@@ -0,0 +1,71 @@
+"""
+bench_playlist.py - Lazy vs eager playlist enumeration against a stub
+
+The local media server serves a paged playlist (each page taking a fixed
+delay, as YouTube's continuation requests do). Entries are enumerated once
+lazily, the way batch_download consumes them, and once eagerly into a list.
+Reports the time until the first entry is available, the total time, and
+peak Python heap while enumerating. Prints one JSON object.
+
+Usage:
+    python benchmarks/bench_playlist.py [--entries 5000] [--page-size 100] [--page-delay 0.05]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from local_media import LocalMediaServer, local_youtube_dl_factory
+
+import playlist
+import session_pool
+
+
+def lazy(url):
+    """Consume entries one at a time, as the batch engine's feeder does"""
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in playlist.iter_entries(url):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return first, time.perf_counter() - start, count
+
+
+def eager(url):
+    """Materialize the whole playlist before the first conversion could start"""
+    start = time.perf_counter()
+    entries = list(playlist.iter_entries(url))
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(entries)
+
+
+def measure(label, fn, url):
+    tracemalloc.start()
+    first, total, count = fn(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'strategy': label, 'entries': count, 'first_entry_seconds': round(first, 3),
+            'total_seconds': round(total, 3), 'peak_heap_kib': round(peak / 1024)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--page-delay', type=float, default=0.05, help='Seconds per page request')
+    args = parser.parse_args()
+
+    session_pool.configure(local_youtube_dl_factory)
+    with LocalMediaServer(playlist_size=args.entries, page_size=args.page_size,
+                          page_delay=args.page_delay) as server:
+        url = f'{server.base_url}/playlist/bench'
+        results = [measure('lazy', lazy, url), measure('eager', eager, url)]
+
+    print(json.dumps({'benchmark': 'playlist', 'entries': args.entries, 'page_size': args.page_size,
+                      'page_delay': args.page_delay, 'results': results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
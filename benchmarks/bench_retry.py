@@ -0,0 +1,96 @@
+"""
+bench_retry.py - Retry policy and adaptive per-host rate limiting against a stub
+
+Two offline checks against the local media server:
+
+* scripted: the server answers with scripted error codes before serving
+  normally. Transient codes must be retried and permanent ones must not.
+* adaptive: the server answers with 429 above max_rps requests per second.
+  It compares retrying alone with retrying plus the adaptive token bucket,
+  by how many 429s the server had to send and the total time taken.
+
+Prints one JSON object.
+
+Usage:
+    python benchmarks/bench_retry.py [--requests 100] [--threads 8] [--max-rps 10]
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_media import LocalMediaServer
+
+import retry_policy
+import streaming
+
+MEDIA = b'x' * 64 * 1024
+
+
+def fetch(url, attempts):
+    return sum(len(block) for block in streaming.iter_http(url, attempts=attempts))
+
+
+def scripted(errors, max_attempts):
+    retry_policy.configure(max_attempts=max_attempts, base_delay=0.01, max_delay=0.05, rate=1000, burst=1000)
+    attempts = retry_policy.Attempts()
+    with LocalMediaServer(media=MEDIA, errors=errors) as server:
+        try:
+            size = fetch(f'{server.base_url}/media/scripted', attempts)
+            outcome = 'ok' if size == len(MEDIA) else 'short'
+        except Exception as e:
+            outcome = f'failed: {retry_policy.classify(e)}'
+        requests = server.requests
+    return {'errors': errors, 'outcome': outcome, 'requests': requests,
+            **attempts.annotate({})}
+
+
+def adaptive(label, rate, args):
+    retry_policy.configure(max_attempts=50, base_delay=0.05, max_delay=1.0, rate=rate, burst=2)
+    counters = []
+    with LocalMediaServer(media=MEDIA, max_rps=args.max_rps) as server:
+        url = f'{server.base_url}/media/adaptive'
+
+        def one(_):
+            attempts = retry_policy.Attempts()
+            fetch(url, attempts)
+            counters.append(attempts)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+        rejected = server.rejected
+
+    return {
+        'strategy': label,
+        'seconds': round(elapsed, 3),
+        'server_429s': rejected,
+        'retries': sum(a.retries for a in counters),
+        'throttled_waits': sum(a.throttled for a in counters),
+        'final_rate': round(retry_policy.get_limiter().rates().get('127.0.0.1', rate), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--max-rps', type=int, default=10, help='Server-side 429 threshold')
+    args = parser.parse_args()
+
+    checks = [
+        scripted([429, 503, 500], max_attempts=4),
+        scripted([502, 502, 502, 502], max_attempts=3),
+        scripted([404], max_attempts=4),
+    ]
+    comparison = [
+        adaptive('retry_only', 1e9, args),
+        adaptive('adaptive_bucket', args.max_rps * 4, args),
+    ]
+    print(json.dumps({'benchmark': 'retry', 'scripted': checks, 'max_rps': args.max_rps,
+                      'requests': args.requests, 'adaptive': comparison}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+bench_segmented.py - Single-stream vs multi-connection range downloading
+
+Serves a random file from the local media server, throttled per connection,
+and downloads it with 1, 2, 4 and 8 connections. A final run against the
+same server with Range support switched off checks the single-stream
+fallback. Prints one JSON object.
+
+Usage:
+    python benchmarks/bench_segmented.py [--size-mb 16] [--rate 2000000] [--connections 1 2 4 8]
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from local_media import LocalMediaServer
+
+import retry_policy
+import segmented
+
+
+def run(url, path, connections):
+    start = time.perf_counter()
+    fetched = segmented.download(url, path, connections=connections, min_segment=256 * 1024)
+    elapsed = time.perf_counter() - start
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    os.remove(path)
+    return elapsed, fetched, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--rate', type=int, default=2_000_000, help='Per-connection bytes/second')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    # Benchmark requests shouldn't wait on the production per-host rate limit
+    retry_policy.configure(rate=1000, burst=1000)
+    media = os.urandom(args.size_mb * 1024 * 1024)
+    expected = hashlib.sha256(media).hexdigest()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'media.bin')
+        with LocalMediaServer(media=media, rate=args.rate) as server:
+            url = f'{server.base_url}/media/segmented'
+            for connections in args.connections:
+                elapsed, fetched, digest = run(url, path, connections)
+                results.append({'connections': fetched['connections'], 'segmented': fetched['segmented'],
+                                'seconds': round(elapsed, 3),
+                                'mb_per_second': round(len(media) / elapsed / 1e6, 2),
+                                'intact': digest == expected})
+
+        with LocalMediaServer(media=media, rate=args.rate, ranges=False) as server:
+            elapsed, fetched, digest = run(f'{server.base_url}/media/segmented', path, max(args.connections))
+            fallback = {'requested_connections': max(args.connections),
+                        'connections': fetched['connections'], 'segmented': fetched['segmented'],
+                        'seconds': round(elapsed, 3), 'intact': digest == expected}
+
+    print(json.dumps({'benchmark': 'segmented', 'bytes': len(media), 'rate_per_connection': args.rate,
+                      'results': results, 'no_range_fallback': fallback}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+bench_server.py - Job-queue server throughput with concurrent HTTP clients
+
+Runs the job server in-process against the local stand-in extractor and
+media server (no internet), has several clients submit jobs over HTTP,
+retrying on 429 after Retry-After, and polls until every job is done.
+Prints one JSON object. Requires yt-dlp and ffmpeg on PATH.
+
+Usage:
+    python benchmarks/bench_server.py [--clients 4] [--jobs 5] [--urls 4] [--workers 4]
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from local_media import LocalMediaServer, generate_audio, local_youtube_dl_factory
+
+import download_archive
+import metadata_cache
+import session_pool
+from job_server import JobQueue, JobServer
+
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data, {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.load(resp), resp.headers
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e), e.headers
+
+
+def client(base_url, urls_per_job, jobs, submitted, rejections):
+    for _ in range(jobs):
+        body = {'urls': next(urls_per_job)}
+        while True:
+            status, payload, headers = request(f'{base_url}/jobs', body)
+            if status == 202:
+                submitted.append(payload['job'])
+                break
+            if status != 429:
+                raise RuntimeError(f'Submit failed: {status} {payload}')
+            rejections.append(1)
+            time.sleep(float(headers.get('Retry-After', 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--jobs', type=int, default=5, help='Jobs per client')
+    parser.add_argument('--urls', type=int, default=4, help='URLs per job')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-queued', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=30, help='Length of the test audio')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        media_path = generate_audio(os.path.join(workdir, 'media.m4a'), args.seconds)
+        with open(media_path, 'rb') as f:
+            media = f.read()
+        metadata_cache.configure(workdir)
+        download_archive.configure(workdir)
+        session_pool.configure(local_youtube_dl_factory)
+        output = os.path.join(workdir, 'out')
+
+        with LocalMediaServer(media=media) as media_server:
+            counter = iter(range(10 ** 9))
+            lock = threading.Lock()
+
+            def urls_per_job():
+                while True:
+                    with lock:
+                        ids = [next(counter) for _ in range(args.urls)]
+                    yield [media_server.video_url(f'vid{i:08d}') for i in ids]
+
+            jobs = JobQueue(workers=args.workers, max_queued=args.max_queued, defaults={'output': output})
+            with JobServer(jobs, port=0, accept_any_url=True) as server:
+                submitted, rejections = [], []
+                source = urls_per_job()
+                start = time.perf_counter()
+                clients = [threading.Thread(target=client, args=(server.base_url, source, args.jobs,
+                                                                   submitted, rejections))
+                           for _ in range(args.clients)]
+                for thread in clients:
+                    thread.start()
+                for thread in clients:
+                    thread.join()
+
+                pending = set(submitted)
+                failed = 0
+                while pending:
+                    for job_id in list(pending):
+                        _, status, _ = request(f'{server.base_url}/jobs/{job_id}')
+                        if status['state'] == 'done':
+                            pending.discard(job_id)
+                            failed += status['failed']
+                    time.sleep(0.1)
+                elapsed = time.perf_counter() - start
+                _, stats, _ = request(f'{server.base_url}/status')
+
+    items = args.clients * args.jobs * args.urls
+    print(json.dumps({
+        'benchmark': 'server',
+        'clients': args.clients,
+        'jobs': len(submitted),
+        'items': items,
+        'workers': args.workers,
+        'max_queued': args.max_queued,
+        'seconds': round(elapsed, 4),
+        'items_per_second': round(items / elapsed, 2),
+        'rejected_429': len(rejections),
+        'failed': failed,
+        'session_pool': stats['session_pool'],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+bench_session_pool.py - Per-call YoutubeDL construction vs pooled reuse
+
+Runs metadata extractions against a local stand-in extractor and prints one
+JSON object with timings for both strategies.
+
+Usage:
+    python benchmarks/bench_session_pool.py [--jobs 200] [--threads 4]
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_media import LocalMediaServer, local_youtube_dl_factory
+
+from session_pool import SessionPool
+
+OPTS = {'quiet': True, 'no_warnings': True, 'skip_download': True}
+
+
+def per_call(url):
+    ydl = local_youtube_dl_factory(OPTS)
+    try:
+        return ydl.extract_info(url, download=False, ie_key='Local')
+    finally:
+        ydl.close()
+
+
+def run(label, fn, urls, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(fn, urls))
+    elapsed = time.perf_counter() - start
+    return {'strategy': label, 'jobs': len(urls), 'seconds': round(elapsed, 4),
+            'jobs_per_second': round(len(urls) / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with LocalMediaServer() as server:
+        urls = [server.video_url(f'vid{i:08d}') for i in range(args.jobs)]
+        pool = SessionPool(local_youtube_dl_factory)
+
+        def pooled(url):
+            with pool.session('info', OPTS) as ydl:
+                return ydl.extract_info(url, download=False, ie_key='Local')
+
+        results = [
+            run('per_call', per_call, urls, args.threads),
+            run('pooled', pooled, urls, args.threads),
+        ]
+        pool_stats = pool.stats()
+        pool.close()
+
+    print(json.dumps({'benchmark': 'session_pool', 'results': results, 'pool': pool_stats}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
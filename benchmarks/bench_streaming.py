@@ -0,0 +1,71 @@
+"""
+bench_streaming.py - File-based download+transcode vs streaming into FFmpeg
+
+Serves a generated audio file from a local HTTP server (optionally
+throttled) and times both paths of an MP3 transcoder.EncodeJob: run() on a
+downloaded file and stream() straight from the HTTP body. Requires ffmpeg
+on PATH.
+
+Usage:
+    python benchmarks/bench_streaming.py [--seconds 180] [--rate 4000000] [--runs 3]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from local_media import LocalMediaServer, generate_audio
+
+import streaming
+import transcoder
+
+
+def file_based(url, workdir, quality):
+    source = os.path.join(workdir, 'source.webm')
+    with open(source, 'wb') as f:
+        for chunk in streaming.iter_http(url):
+            f.write(chunk)
+    target = os.path.join(workdir, 'file_based.mp3')
+    transcoder.EncodeJob('mp3', quality).run(source, target)
+    os.remove(source)
+    return target
+
+
+def streamed(url, workdir, quality):
+    target = os.path.join(workdir, 'streamed.mp3')
+    transcoder.EncodeJob('mp3', quality).stream(streaming.iter_http(url), target)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=180, help='Length of the test audio')
+    parser.add_argument('--rate', type=int, default=None, help='Throttle in bytes/second')
+    parser.add_argument('--quality', default='192')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        media_path = generate_audio(os.path.join(workdir, 'media.webm'), args.seconds)
+        with open(media_path, 'rb') as f:
+            media = f.read()
+
+        results = []
+        with LocalMediaServer(media=media, rate=args.rate) as server:
+            url = f'{server.base_url}/media/bench'
+            for label, fn in (('file_based', file_based), ('streamed', streamed)):
+                timings = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    fn(url, workdir, args.quality)
+                    timings.append(time.perf_counter() - start)
+                results.append({'strategy': label, 'best_seconds': round(min(timings), 4),
+                                'mean_seconds': round(sum(timings) / len(timings), 4)})
+
+    print(json.dumps({'benchmark': 'streaming', 'media_bytes': len(media),
+                      'rate': args.rate, 'results': results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+bench_suite.py - Offline end-to-end benchmark suite for converter.py
+
+Generates test media once. Then it runs each scenario in a fresh Python
+process against the local media server and the stand-in YouTube extractor
+(local_media.youtube_stand_in_factory), so nothing touches the internet:
+
+    single_mp3       one MP3 conversion (download + encode)
+    single_mp4       one MP4 (parallel video/audio fetch + merge)
+    fanout           MP3 192 + MP3 320 + MP4 of one video from a single
+                     download (converter.convert_outputs)
+    batch            --items MP3s through converter.batch_download
+    cache_cold       --cache-items MP3s with an empty metadata cache
+    cache_warm       the same batch with every video's metadata cached
+    source_cache_warm
+                     the cache_cold batch converted again at 320 kbps, with
+                     every source already in the source cache (no downloads)
+    transcode_heavy  --heavy-items long tracks encoded at 320 kbps
+    normalize        --cache-items MP3s with loudness normalization, measured
+                     while encoding (one decode per item)
+    normalize_cached the same batch with every video's loudness already
+                     measured (linear loudnorm, no analysis)
+
+Each scenario reports wall time, throughput, CPU time (this process,
+which includes the local server's threads, and its FFmpeg children) and
+peak RSS. Batch scenarios also report per-stage times (tracing.stage_summary). The whole report is one JSON object, optionally written to
+--output. Pass an earlier file as --compare to see the change per metric.
+Requires yt-dlp and ffmpeg, and the resource module (Linux/macOS).
+
+Usage:
+    python benchmarks/bench_suite.py [--scenarios single_mp3 batch ...] [--items 100]
+                                     [--runs 1] [--output suite.json] [--compare previous.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from local_media import LocalMediaServer, generate_audio, generate_video, youtube_stand_in_factory
+
+SCENARIOS = ['single_mp3', 'single_mp4', 'fanout', 'batch', 'cache_cold', 'cache_warm',
+             'source_cache_warm', 'transcode_heavy',
+             'normalize', 'normalize_cached']
+COMPARED = ['wall_seconds', 'items_per_second', 'cpu_seconds', 'peak_rss_mib']
+
+
+@contextlib.contextmanager
+def environment(args, media='audio.m4a', video=False):
+    """Fresh caches in a temp dir, a local server and the stand-in session factory"""
+    import download_archive
+    import loudness_cache
+    import metadata_cache
+    import session_pool
+    import source_cache
+
+    with open(os.path.join(args.media_dir, media), 'rb') as f:
+        audio = f.read()
+    video_bytes = None
+    if video:
+        with open(os.path.join(args.media_dir, 'video.mp4'), 'rb') as f:
+            video_bytes = f.read()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        metadata_cache.configure(workdir)
+        download_archive.configure(workdir)
+        loudness_cache.configure(workdir)
+        source_cache.configure(workdir)
+        with LocalMediaServer(media=audio, video=video_bytes) as server:
+            session_pool.configure(youtube_stand_in_factory(server.base_url))
+            yield os.path.join(workdir, 'out'), len(audio) + len(video_bytes or b'')
+
+
+def urls(count):
+    return [LocalMediaServer.youtube_url(n) for n in range(count)]
+
+
+def run_single_mp3(args, measure):
+    from converter import convert_url
+    with environment(args) as (output, size):
+        result = measure(lambda: convert_url(urls(1)[0], output, '192', 'mp3', force=True))
+    return {'items': 1, 'succeeded': int(bool(result.get('success'))), 'bytes': size}
+
+
+def run_single_mp4(args, measure):
+    from converter import download_video
+    with environment(args, video=True) as (output, size):
+        result = measure(lambda: download_video(urls(1)[0], output, 'best'))
+    return {'items': 1, 'succeeded': int(bool(result.get('success'))), 'bytes': size,
+            'merge': result.get('merge'), 'timings': result.get('timings')}
+
+
+def run_fanout(args, measure):
+    from converter import convert_outputs, extraction_count
+    with environment(args, video=True) as (output, size):
+        before = extraction_count()
+        result = measure(lambda: convert_outputs(urls(1)[0], 'mp3:192,mp3:320,mp4:best', output))
+    outputs = result.get('outputs', [])
+    return {'items': len(outputs), 'succeeded': sum(1 for o in outputs if o.get('success')),
+            'bytes': size, 'extractions': extraction_count() - before}
+
+
+def _batch(args, measure, count, media='audio.m4a', quality='192', warm=False, normalize=None,
+           measured=False, sources=False):
+    import source_cache
+    from converter import batch_download, extraction_count, lookup_info
+    with environment(args, media=media) as (output, size):
+        batch = urls(count)
+        if warm:
+            for url in batch:
+                lookup_info(url)
+        if sources:
+            # Download every source once at another quality
+            with contextlib.redirect_stdout(io.StringIO()):
+                batch_download(batch, output, '192', force=True, show_progress=False)
+        if measured:
+            # Measure every video once; the timed run reuses the measurements
+            with contextlib.redirect_stdout(io.StringIO()):
+                batch_download(batch, output, quality, force=True, show_progress=False, normalize=True)
+        before = extraction_count()
+        sources_before = source_cache.get_cache().stats()
+        totals = measure(lambda: batch_download(
+            batch, output, quality, force=True, show_progress=False, normalize=normalize))
+        sources_after = source_cache.get_cache().stats()
+    metrics = {'items': count, 'succeeded': totals['succeeded'],
+               'bytes': size * count, 'extractions': extraction_count() - before,
+               'source_cache_hits': sources_after['hits'] - sources_before['hits'],
+               'stages': totals['stages']}
+    if normalize:
+        metrics['loudness_cached'] = totals['loudness_reused']
+    return metrics
+
+
+def run_batch(args, measure):
+    return _batch(args, measure, args.items)
+
+
+def run_cache_cold(args, measure):
+    return _batch(args, measure, args.cache_items)
+
+
+def run_cache_warm(args, measure):
+    return _batch(args, measure, args.cache_items, warm=True)
+
+
+def run_source_cache_warm(args, measure):
+    return _batch(args, measure, args.cache_items, quality='320', sources=True)
+
+
+def run_transcode_heavy(args, measure):
+    return _batch(args, measure, args.heavy_items, media='long.m4a', quality='320')
+
+
+def run_normalize(args, measure):
+    return _batch(args, measure, args.cache_items, normalize=True)
+
+
+def run_normalize_cached(args, measure):
+    return _batch(args, measure, args.cache_items, normalize=True, measured=True)
+
+
+def child(args):
+    """Run one scenario in this process and print its metrics as a JSON line"""
+    timing = {}
+
+    def measure(fn):
+        before_self = resource.getrusage(resource.RUSAGE_SELF)
+        before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        # converter prints per-item lines; keep stdout for the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcome = fn()
+        timing['wall'] = time.perf_counter() - start
+        after_self = resource.getrusage(resource.RUSAGE_SELF)
+        after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        timing['cpu_self'] = (after_self.ru_utime - before_self.ru_utime
+                              + after_self.ru_stime - before_self.ru_stime)
+        timing['cpu_children'] = (after_children.ru_utime - before_children.ru_utime
+                                  + after_children.ru_stime - before_children.ru_stime)
+        return outcome
+
+    metrics = globals()[f'run_{args.child}'](args, measure)
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    peak_child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    wall = timing['wall']
+    report = {
+        'scenario': args.child,
+        'wall_seconds': round(wall, 3),
+        'items_per_second': round(metrics['items'] / wall, 3),
+        'mb_per_second': round(metrics.pop('bytes') / wall / 1e6, 2),
+        'cpu_seconds': round(timing['cpu_self'] + timing['cpu_children'], 3),
+        'cpu_self_seconds': round(timing['cpu_self'], 3),
+        'cpu_ffmpeg_seconds': round(timing['cpu_children'], 3),
+        'peak_rss_mib': round(peak_self / 2 ** 20, 1),
+        'peak_child_rss_mib': round(peak_child / 2 ** 20, 1),
+        **metrics,
+    }
+    print(json.dumps(report))
+
+
+def run_scenario(name, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name,
+               '--media-dir', args.media_dir, '--items', str(args.items),
+               '--cache-items', str(args.cache_items), '--heavy-items', str(args.heavy_items)]
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'scenario': name, 'error': proc.stderr.strip()[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def median_run(runs):
+    """The run with the median wall time, plus every run's wall time"""
+    ok = sorted((r for r in runs if 'error' not in r), key=lambda r: r['wall_seconds'])
+    if not ok:
+        return runs[-1]
+    chosen = dict(ok[(len(ok) - 1) // 2])
+    chosen['runs'] = [r['wall_seconds'] for r in ok]
+    chosen['errors'] = len(runs) - len(ok)
+    return chosen
+
+
+def compare(current, previous):
+    """Percent change per metric for scenarios present in both reports"""
+    before = {s['scenario']: s for s in previous.get('scenarios', [])}
+    changes = {}
+    for scenario in current:
+        old = before.get(scenario['scenario'])
+        if old is None or 'error' in scenario or 'error' in old:
+            continue
+        changes[scenario['scenario']] = {
+            metric: round((scenario[metric] - old[metric]) / old[metric] * 100, 1)
+            for metric in COMPARED if old.get(metric)
+        }
+    return changes
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--items', type=int, default=100, help='Items in the batch scenario')
+    parser.add_argument('--cache-items', type=int, default=20, help='Items in the cache scenarios')
+    parser.add_argument('--heavy-items', type=int, default=8, help='Items in transcode_heavy')
+    parser.add_argument('--seconds', type=int, default=30, help='Length of the test media')
+    parser.add_argument('--heavy-seconds', type=int, default=600, help='Length of transcode_heavy tracks')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per scenario (median reported)')
+    parser.add_argument('--output', default=None, help='Also write the report to this file')
+    parser.add_argument('--compare', default=None, help='Earlier report to compare against')
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--media-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    from cli import missing_dependencies
+    missing = missing_dependencies()
+    if missing:
+        for name in missing:
+            print(f"Missing: {name}", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory() as media_dir:
+        args.media_dir = media_dir
+        generate_audio(os.path.join(media_dir, 'audio.m4a'), args.seconds)
+        generate_audio(os.path.join(media_dir, 'long.m4a'), args.heavy_seconds)
+        generate_video(os.path.join(media_dir, 'video.mp4'), args.seconds)
+        scenarios = [median_run([run_scenario(name, args) for _ in range(args.runs)])
+                     for name in args.scenarios]
+
+    report = {
+        'benchmark': 'suite',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenarios': scenarios,
+    }
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report['change_percent'] = compare(scenarios, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    return 1 if any('error' in s for s in scenarios) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+bench_url_parser.py - url_parser.parse throughput
+
+Times parse() and the substring checks it replaced over millions of
+generated video URLs. Correctness is covered by tests/test_url_parser.py.
+Prints one JSON object.
+
+Usage:
+    python benchmarks/bench_url_parser.py [--urls 2000000]
+"""
+import argparse
+import json
+import random
+import re
+import string
+import time
+
+import local_media  # noqa: F401  (puts the repo root on sys.path)
+
+import url_parser
+
+ID = 'dQw4w9WgXcQ'
+
+# Video URL shapes the generated URLs are drawn from (ID is replaced);
+# parse() correctness is covered by tests/test_url_parser.py
+TEMPLATES = [
+    f'https://www.youtube.com/watch?v={ID}',
+    f'youtube.com/watch?v={ID}',
+    f'https://m.youtube.com/watch?v={ID}',
+    f'https://music.youtube.com/watch?v={ID}&feature=share',
+    f'https://www.youtube.com/watch?feature=youtu.be&v={ID}',
+    f'https://www.youtube.com/watch?v={ID}&si=AbCdEf123',
+    f'https://www.youtube.com/watch?v={ID}&list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf&index=4',
+    f'https://www.youtube.com/watch?v={ID}&t=1m30s',
+    f'https://youtu.be/{ID}',
+    f'https://youtu.be/{ID}?si=tracking&t=5',
+    f'https://www.youtube.com/shorts/{ID}',
+    f'https://www.youtube.com/embed/{ID}?start=30',
+    f'https://www.youtube.com/live/{ID}',
+]
+
+# The checks url_parser replaced, for comparison
+LEGACY_ID = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})(?![\w-])')
+
+
+def legacy(url):
+    if 'youtube.com/watch' in url or 'youtu.be/' in url:
+        match = LEGACY_ID.search(url)
+        return match.group(1) if match else url
+    return None
+
+
+def generate(count, seed=1):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '-_'
+    urls = []
+    for _ in range(count):
+        video_id = ''.join(rng.choice(alphabet) for _ in range(11))
+        urls.append(rng.choice(TEMPLATES).replace(ID, video_id))
+    return urls
+
+
+def throughput(fn, urls):
+    start = time.perf_counter()
+    for url in urls:
+        fn(url)
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 3), 'urls_per_second': round(len(urls) / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    urls = generate(args.urls)
+    report = {
+        'benchmark': 'url_parser',
+        'urls': len(urls),
+        'parse': throughput(url_parser.parse, urls),
+        'legacy_substring_checks': throughput(legacy, urls),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+local_media.py - Offline fixtures for benchmarks: a local HTTP media server
+and a stand-in yt-dlp extractor that points at it
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Benchmarks run as scripts from the repo root or the benchmarks folder
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is measurable
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+
+        match = re.fullmatch(r'/video/([\w-]+)\.json', path)
+        if match:
+            video_id = match.group(1)
+            body = json.dumps({
+                'id': video_id,
+                'title': f'Local video {video_id}',
+                'uploader': 'Local Server',
+                'duration': 60,
+                'media': f'{server.base_url}/media/{video_id}',
+                'video_media': f'{server.base_url}/video-media/{video_id}' if server.video else None,
+            }).encode()
+            return self._send(200, body, 'application/json')
+
+        match = re.fullmatch(r'/playlist/([\w-]+)\.json', path)
+        if match:
+            page = int(re.search(r'page=(\d+)', self.path).group(1)) if 'page=' in self.path else 0
+            if server.page_delay:
+                time.sleep(server.page_delay)
+            first = page * server.page_size
+            ids = [f'{n:011d}' for n in range(first, min(first + server.page_size, server.playlist_size))]
+            more = first + server.page_size < server.playlist_size
+            body = json.dumps({'id': match.group(1), 'entries': ids,
+                               'next': page + 1 if more else None}).encode()
+            return self._send(200, body, 'application/json')
+
+        match = re.fullmatch(r'/video-media/([\w-]+)', path)
+        if match and server.video is not None:
+            return self._send_media(server.video)
+
+        match = re.fullmatch(r'/media/([\w-]+)', path)
+        if match and server.media is not None:
+            status = server.scripted_status()
+            if status is not None:
+                return self._send(status, b'scripted error', 'text/plain', {'Retry-After': '0'})
+            return self._send_media(server.media)
+
+        self._send(404, b'not found', 'text/plain')
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self._write(body)
+
+    def _send_media(self, media):
+        """Serve media bytes, honouring a single Range header"""
+        headers = {'Accept-Ranges': 'bytes'}
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if not match or not self.server.ranges:
+            return self._send(200, media, 'application/octet-stream', headers)
+        start = int(match.group(1) or 0)
+        end = min(int(match.group(2)) if match.group(2) else len(media) - 1, len(media) - 1)
+        if start >= len(media):
+            return self._send(416, b'', 'application/octet-stream',
+                              {'Content-Range': f'bytes */{len(media)}'})
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(media)}'
+        self._send(206, media[start:end + 1], 'application/octet-stream', headers)
+
+    def _write(self, body):
+        """Write a body, throttled to the server's per-connection rate"""
+        rate = self.server.rate
+        try:
+            if not rate:
+                self.wfile.write(body)
+                return
+            block = max(1024, rate // 20)
+            for offset in range(0, len(body), block):
+                self.wfile.write(body[offset:offset + block])
+                time.sleep(block / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hung up early (e.g. a probe that only wanted the headers)
+            self.close_connection = True
+
+
+class LocalMediaServer:
+    """
+    Local HTTP server for benchmarks
+
+    Serves /video/<id>.json metadata, /media/<id> audio bytes and
+    /video-media/<id> video-only bytes (both Range aware), and
+    /playlist/<id>.json?page=N pages of video IDs.
+
+    Args:
+        media: Bytes served for every /media/<id>
+        video: Optional video-only bytes served for every /video-media/<id>;
+               when set, the stand-in extractor offers an MP4 video format
+        rate: Optional per-connection throttle in bytes/second
+        errors: Status codes returned, in order, for the first /media
+                requests (e.g. [429, 503]) before serving normally
+        max_rps: Answer /media requests with 429 beyond this many per second
+        ranges: Honour Range headers (False always sends the whole body)
+        playlist_size: Entries in every /playlist/<id>
+        page_size: Entries per playlist page
+        page_delay: Seconds each playlist page takes to answer
+
+    Usage:
+        with LocalMediaServer(media=b'...') as server:
+            server.base_url
+    """
+
+    def __init__(self, media=None, rate=None, errors=None, max_rps=None, ranges=True,
+                 playlist_size=0, page_size=100, page_delay=0, video=None):
+        self.media = media
+        self.video = video
+        self.playlist_size = playlist_size
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.ranges = ranges
+        self.rate = rate
+        self.errors = list(errors or [])
+        self.max_rps = max_rps
+        self.requests = 0
+        self.rejected = 0
+        self._recent = []
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def scripted_status(self):
+        """Error status to answer the next /media request with, or None"""
+        with self._lock:
+            self.requests += 1
+            status = self.errors.pop(0) if self.errors else None
+            if status is None and self.max_rps:
+                now = time.monotonic()
+                self._recent = [t for t in self._recent if now - t < 1.0]
+                if len(self._recent) >= self.max_rps:
+                    status = 429
+                else:
+                    self._recent.append(now)
+            if status is not None:
+                self.rejected += 1
+            return status
+
+    def __enter__(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.media = self.media
+        self._httpd.video = self.video
+        self._httpd.rate = self.rate
+        self._httpd.scripted_status = self.scripted_status
+        self._httpd.ranges = self.ranges
+        self._httpd.playlist_size = self.playlist_size
+        self._httpd.page_size = self.page_size
+        self._httpd.page_delay = self.page_delay
+        self._httpd.base_url = self.base_url = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def video_url(self, video_id):
+        return f'{self.base_url}/video/{video_id}'
+
+    @staticmethod
+    def youtube_url(n):
+        """A YouTube watch URL with a valid, unique 11-character ID for item n"""
+        return f'https://www.youtube.com/watch?v=bench{n:06d}'
+
+
+def stand_in_extractor(youtube_base_url=None):
+    """
+    A yt-dlp extractor for LocalMediaServer URLs
+
+    Metadata comes from the local server through the YoutubeDL instance's own
+    HTTP stack, so connection reuse behaves as it would against YouTube.
+
+    With youtube_base_url it claims youtube.com watch URLs instead and
+    answers them from that server, so everything keyed by video ID (metadata
+    cache, download archive, dedup) behaves as it does for real videos.
+    """
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class LocalIE(InfoExtractor):
+        if youtube_base_url is None:
+            IE_NAME = 'local'
+            _VALID_URL = r'https?://127\.0\.0\.1:\d+/video/(?P<id>[\w-]+)'
+        else:
+            IE_NAME = 'local:youtube'
+            _VALID_URL = r'https?://(?:www\.)?youtube\.com/watch\?v=(?P<id>[\w-]{11})'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            metadata_url = f'{url}.json' if youtube_base_url is None else \
+                f'{youtube_base_url}/video/{video_id}.json'
+            data = self._download_json(metadata_url, video_id)
+            formats = [{
+                'format_id': 'm4a',
+                'url': data['media'],
+                'ext': 'm4a',
+                'acodec': 'aac',
+                'vcodec': 'none',
+                'abr': 128,
+            }]
+            if data.get('video_media'):
+                formats.append({
+                    'format_id': 'mp4-360',
+                    'url': data['video_media'],
+                    'ext': 'mp4',
+                    'vcodec': 'avc1.64001e',
+                    'acodec': 'none',
+                    'width': 640,
+                    'height': 360,
+                    'tbr': 500,
+                })
+            return {
+                'id': video_id,
+                'title': data['title'],
+                'uploader': data['uploader'],
+                'duration': data['duration'],
+                'formats': formats,
+            }
+
+    return LocalIE
+
+
+def stand_in_playlist_extractor():
+    """
+    A yt-dlp playlist extractor for LocalMediaServer /playlist URLs
+
+    Like YouTube's tab extractor, it returns entries as a generator that
+    fetches the next page only once the previous one has been consumed.
+    """
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class LocalPlaylistIE(InfoExtractor):
+        IE_NAME = 'local:playlist'
+        _VALID_URL = r'https?://127\.0\.0\.1:\d+/playlist/(?P<id>[\w-]+)'
+
+        def _entries(self, url, playlist_id):
+            page = 0
+            while page is not None:
+                data = self._download_json(f'{url}.json?page={page}', playlist_id,
+                                           note=f'Downloading page {page}')
+                for video_id in data['entries']:
+                    yield self.url_result(f'https://www.youtube.com/watch?v={video_id}',
+                                          'Youtube', video_id)
+                page = data['next']
+
+        def _real_extract(self, url):
+            playlist_id = self._match_id(url)
+            return self.playlist_result(self._entries(url, playlist_id), playlist_id)
+
+    return LocalPlaylistIE
+
+
+def local_youtube_dl_factory(opts):
+    """SessionPool factory that registers the stand-in extractors"""
+    import yt_dlp
+    ydl = yt_dlp.YoutubeDL(opts)
+    ydl.add_info_extractor(stand_in_extractor()())
+    ydl.add_info_extractor(stand_in_playlist_extractor()())
+    return ydl
+
+
+def youtube_stand_in_factory(base_url):
+    """
+    SessionPool factory whose sessions answer YouTube watch URLs from a
+    LocalMediaServer
+
+    Only the stand-in extractor is registered (auto_init=False skips the
+    real ones), so nothing can reach the internet.
+    """
+    def factory(opts):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(opts, auto_init=False)
+        ydl.add_info_extractor(stand_in_extractor(base_url)())
+        return ydl
+    return factory
+
+
+def generate_audio(path, seconds=120, ffmpeg='ffmpeg'):
+    """Write a test tone of the given length (format from the extension)"""
+    import subprocess
+    subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-ac', '2', '-ar', '48000', path], check=True)
+    return path
+
+
+def generate_video(path, seconds=30, size='640x360', ffmpeg='ffmpeg'):
+    """Write a video-only H.264 test pattern of the given length"""
+    import subprocess
+    subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc=size={size}:rate=25:duration={seconds}',
+                    '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+                    path], check=True)
+    return path
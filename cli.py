@@ -0,0 +1,384 @@
+"""
+cli.py - Command-line batch converter (no GUI)
+
+Headless entry point for servers and scheduled jobs: it never imports
+tkinter or main.py, never runs pip, loads yt-dlp only when a job actually
+needs it and checks for FFmpeg once per process.
+
+Usage:
+    python cli.py batch urls.txt [--quality 192] [--codec mp3] [--output downloads] [--force] [--stream]
+                                 [--normalize [single|two-pass]] [--outputs mp3:192,mp3:320,mp4:720p]
+                                 [--metrics metrics.prom] [--trace traces.jsonl] [--profile [RATE]]
+    producer | python cli.py batch - [...]
+    python cli.py resume <journal.jsonl> [--retry-failed] [--metrics metrics.prom] [--trace traces.jsonl]
+                                         [--profile [RATE]]
+    python cli.py results <journal.jsonl> [--results batch_results.json]
+    python cli.py serve [--port 8765] [--workers 4] [--max-queued 200]
+    python cli.py enqueue <store.sqlite> urls.txt [--quality 192] [--codec mp3] [--output downloads]
+    python cli.py worker <store.sqlite> [--workers 4] [--lease 60] [--exit-when-empty]
+    python cli.py store <store.sqlite> [--results batch_results.json] [--retry-failed]
+    python cli.py check
+"""
+import argparse
+import importlib.util
+import itertools
+import os
+import sys
+
+from batch_engine import DEFAULT_DOWNLOAD_WORKERS
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="YouTube to MP3 converter (command line)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch = commands.add_parser('batch', help='Convert every URL in a text file')
+    batch.add_argument('file', help="Text file with one URL per line ('-' reads stdin)")
+    batch.add_argument('-o', '--output', default='downloads', help='Output folder')
+    batch.add_argument('-q', '--quality', default='192', choices=['128', '192', '320', 'best'])
+    batch.add_argument('-c', '--codec', default='mp3', choices=['mp3', 'm4a', 'opus', 'flac'],
+                       help='Output audio codec (a matching source is stream-copied)')
+    batch.add_argument('--normalize', nargs='?', const='single', default=None,
+                       choices=['single', 'two-pass'],
+                       help='EBU R128 loudness normalization, measured while encoding (single) '
+                            'or in a separate first pass (two-pass); measurements are cached')
+    batch.add_argument('--outputs', default=None,
+                       help='Several outputs per video from one download, as comma-separated '
+                            'format[:quality][:normalize] (e.g. mp3:192,mp3:320,mp4:720p); '
+                            'replaces --codec/--quality/--normalize')
+    batch.add_argument('-j', '--workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                       help='Parallel downloads')
+    batch.add_argument('--transcode-workers', type=int, default=None,
+                       help='Parallel FFmpeg encodes (default: CPU count)')
+    batch.add_argument('--force', action='store_true',
+                       help='Convert again even if already in the download archive')
+    batch.add_argument('--stream', action='store_true',
+                       help='Pipe downloads straight into FFmpeg (no intermediate file)')
+    batch.add_argument('--connections', type=int, default=4,
+                       help='Parallel range connections per download (1 = single stream)')
+    batch.add_argument('--results', default='batch_results.json', help='Where to save results')
+    batch.add_argument('--journal', default=None,
+                       help='Job journal file (default: a new file in the cache folder)')
+    _add_diagnostics_arguments(batch)
+
+    resume = commands.add_parser('resume', help='Continue an interrupted batch from its journal')
+    resume.add_argument('journal', help='Journal file printed when the batch started')
+    resume.add_argument('--retry-failed', action='store_true', help='Also retry items that failed')
+    resume.add_argument('-j', '--workers', type=int, default=None, help='Parallel downloads')
+    resume.add_argument('--results', default='batch_results.json', help='Where to save results')
+    _add_diagnostics_arguments(resume)
+
+    results = commands.add_parser('results', help='Regenerate batch_results.json from a journal')
+    results.add_argument('journal')
+    results.add_argument('--results', default='batch_results.json')
+
+    serve = commands.add_parser('serve', help='Run a local HTTP job-queue server')
+    serve.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('-o', '--output', default='downloads', help='Default output folder')
+    serve.add_argument('-j', '--workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                       help='Conversions running at once')
+    serve.add_argument('--max-queued', type=int, default=200,
+                       help='URLs allowed to wait before submissions get 429')
+
+    enqueue = commands.add_parser('enqueue', help='Add URLs to a shared job store')
+    enqueue.add_argument('store', help='Job store file (e.g. on a shared volume)')
+    enqueue.add_argument('file', help="Text file with one URL per line ('-' reads stdin)")
+    enqueue.add_argument('-o', '--output', default='downloads', help='Output folder on the workers')
+    enqueue.add_argument('-q', '--quality', default='192', choices=['128', '192', '320', 'best'])
+    enqueue.add_argument('-c', '--codec', default='mp3', choices=['mp3', 'm4a', 'opus', 'flac'])
+    enqueue.add_argument('--normalize', nargs='?', const='single', default=None,
+                         choices=['single', 'two-pass'])
+    enqueue.add_argument('--force', action='store_true')
+    enqueue.add_argument('--stream', action='store_true')
+    enqueue.add_argument('--batch', default=None, help='Label to group these URLs by')
+
+    worker = commands.add_parser('worker', help='Convert items from a shared job store')
+    worker.add_argument('store')
+    worker.add_argument('-j', '--workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help='Items converted at once by this process')
+    worker.add_argument('--lease', type=float, default=60, help='Claim lease in seconds')
+    worker.add_argument('--max-attempts', type=int, default=3)
+    worker.add_argument('--exit-when-empty', action='store_true',
+                        help='Stop once nothing is queued or in progress')
+
+    store = commands.add_parser('store', help='Show a job store\'s progress')
+    store.add_argument('store')
+    store.add_argument('--batch', default=None)
+    store.add_argument('--results', default=None, help='Also write results to this file')
+    store.add_argument('--retry-failed', action='store_true', help='Queue failed items again')
+
+    commands.add_parser('check', help='Report whether yt-dlp and FFmpeg are usable (installs nothing)')
+    return parser
+
+
+def _add_diagnostics_arguments(parser):
+    parser.add_argument('--metrics', default=None,
+                        help='Write per-stage Prometheus metrics to this file when the batch ends')
+    parser.add_argument('--trace', default=None,
+                        help='Append one OpenTelemetry (OTLP/JSON) trace per job to this file')
+    parser.add_argument('--profile', nargs='?', type=float, const=1.0, default=None, metavar='RATE',
+                        help='Sample Python stacks and FFmpeg CPU time and write a profile report; '
+                             'RATE profiles only that fraction of runs (default: $YT2MP3_PROFILE_RATE)')
+
+
+def missing_dependencies():
+    """Names of required tools that are not available, without importing yt-dlp"""
+    import transcoder
+
+    missing = []
+    if importlib.util.find_spec('yt_dlp') is None:
+        missing.append('yt-dlp (pip install -r requirements.txt)')
+    if not transcoder.ffmpeg_available():
+        missing.append('FFmpeg (https://ffmpeg.org/download.html, must be on PATH)')
+    return missing
+
+
+def run_check(args):
+    missing = missing_dependencies()
+    for name in missing:
+        print(f"Missing: {name}")
+    if not missing:
+        print("yt-dlp and FFmpeg are available")
+    return 1 if missing else 0
+
+
+def _skip_invalid(url):
+    print(f"Skipping invalid URL: {url}")
+
+
+def _stream_urls(path):
+    """
+    Valid, normalized URLs from a file or stdin, read as they are consumed
+
+    Returns:
+        iterator or None: None (after printing why) if there is nothing to do
+    """
+    from batch_processor import ingest_urls, iter_urls_from_file
+
+    urls = ingest_urls(iter_urls_from_file(path), on_invalid=_skip_invalid)
+    try:
+        first = next(urls, None)
+    except OSError as e:
+        print(f"Error reading file: {e}")
+        return None
+    if first is None:
+        print("No valid URLs to download")
+        return None
+    return itertools.chain([first], urls)
+
+
+def run_batch(args):
+    from job_journal import JobJournal
+
+    if args.outputs:
+        from converter import parse_outputs
+        try:
+            parse_outputs(args.outputs)
+        except ValueError as e:
+            print(f"Bad --outputs: {e}")
+            return 1
+
+    urls = _stream_urls(args.file)
+    if urls is None:
+        return 1
+
+    options = {
+        'output': args.output,
+        'quality': args.quality,
+        'codec': args.codec,
+        'normalize': args.normalize,
+        'outputs': args.outputs,
+        'workers': args.workers,
+        'transcode_workers': args.transcode_workers,
+        'force': args.force,
+        'stream': args.stream,
+        'connections': args.connections,
+    }
+    # URLs are journaled as the batch pulls them; a resume reads on from the file
+    source = None if args.file == '-' else os.path.abspath(args.file)
+    with JobJournal.create((), options, args.journal, source=source) as journal:
+        print(f"Journal: {journal.path}")
+        print(f"(resume with: python cli.py resume {journal.path})")
+        return _run_journal(journal, journal.feed(urls), options, args.results, args.metrics, args.trace,
+                            args.profile)
+
+
+def run_resume(args):
+    from batch_processor import ingest_urls, iter_urls_from_file
+    from job_journal import DONE, EXPANDED, FINAL_STATES, SKIPPED, JobJournal
+
+    with JobJournal.open(args.journal) as journal:
+        options = dict(journal.options)
+        if args.workers:
+            options['workers'] = args.workers
+        counts = journal.counts()
+        finished = (DONE, SKIPPED, EXPANDED) if args.retry_failed else FINAL_STATES
+        left = sum(n for state, n in counts.items() if state not in finished)
+        urls = journal.pending(retry_failed=args.retry_failed) if left else ()
+        print(f"Resuming {journal.job_id}: {left} of {sum(counts.values())} journaled items left")
+        if journal.source:
+            if not os.path.exists(journal.source):
+                print(f"Source file is gone, only journaled items will run: {journal.source}")
+            else:
+                print(f"Reading the rest of {journal.source}")
+                # Already-journaled URLs are skipped, or dropped as duplicates
+                unread = (url for url in ingest_urls(iter_urls_from_file(journal.source))
+                          if journal.needs_work(url, args.retry_failed))
+                urls = journal.feed(itertools.chain(urls, unread))
+        return _run_journal(journal, urls, options, args.results, args.metrics, args.trace, args.profile)
+
+
+def run_results(args):
+    from job_journal import JobJournal
+
+    with JobJournal.open(args.journal) as journal:
+        journal.write_results(args.results)
+        counts = ', '.join(f'{n} {state}' for state, n in sorted(journal.counts().items()))
+        print(f"{args.results} written from {journal.path} ({counts})")
+    return 0
+
+
+def run_serve(args):
+    from job_server import JobQueue, JobServer
+
+    missing = missing_dependencies()
+    if missing:
+        for name in missing:
+            print(f"Missing: {name}")
+        return 1
+
+    jobs = JobQueue(workers=args.workers, max_queued=args.max_queued,
+                    defaults={'output': args.output})
+    server = JobServer(jobs, args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port} "
+          f"({args.workers} workers, queue of {args.max_queued}); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping")
+    return 0
+
+
+def run_enqueue(args):
+    from job_server import check_options
+    from job_store import JobStore
+    from playlist import expand_urls
+
+    urls = _stream_urls(args.file)
+    if urls is None:
+        return 1
+    options = check_options({'output': args.output, 'quality': args.quality, 'codec': args.codec,
+                             'force': args.force, 'stream': args.stream, 'normalize': args.normalize})
+    store = JobStore(args.store)
+    try:
+        added, duplicates = store.add(expand_urls(urls), options, args.batch)
+    finally:
+        store.close()
+    print(f"Queued {added} URLs ({duplicates} already in the store)")
+    return 0
+
+
+def run_worker(args):
+    from job_store import JobStore, StoreWorker
+
+    missing = missing_dependencies()
+    if missing:
+        for name in missing:
+            print(f"Missing: {name}")
+        return 1
+
+    store = JobStore(args.store, lease=args.lease, max_attempts=args.max_attempts)
+    worker = StoreWorker(store, concurrency=args.workers, exit_when_empty=args.exit_when_empty)
+    print(f"Worker {worker.worker_id} pulling from {args.store}")
+    try:
+        stats = worker.run()
+    except KeyboardInterrupt:
+        # run() has already finished the items in progress and joined its threads
+        stats = worker.stats
+    finally:
+        store.close()
+    print(f"Worker done: {stats['done']} converted, {stats['failed']} failed, "
+          f"{stats['lost']} lost to expired leases")
+    return 0
+
+
+def run_store(args):
+    from batch_processor import save_batch_results
+    from job_store import JobStore
+
+    store = JobStore(args.store)
+    try:
+        if args.retry_failed:
+            print(f"Queued {store.retry_failed(args.batch)} failed items again")
+        counts = ', '.join(f'{n} {state}' for state, n in sorted(store.counts(args.batch).items()))
+        print(f"{args.store}: {counts or 'empty'}")
+        if args.results:
+            save_batch_results(store.results(args.batch), args.results)
+            print(f"Results saved to: {args.results}")
+    finally:
+        store.close()
+    return 0
+
+
+def _run_journal(journal, urls, options, results_file, metrics_file=None, trace_file=None, profile=None):
+    from job_journal import DONE, EXPANDED, SKIPPED
+
+    if urls:
+        missing = missing_dependencies()
+        if missing:
+            for name in missing:
+                print(f"Missing: {name}")
+            return 1
+
+        import tracing
+        from converter import batch_download
+        if trace_file:
+            tracing.configure(trace_file)
+        batch_download(urls, options.get('output', 'downloads'), options.get('quality', '192'),
+                       download_workers=options.get('workers') or DEFAULT_DOWNLOAD_WORKERS,
+                       transcode_workers=options.get('transcode_workers'),
+                       force=options.get('force', False),
+                       stream=options.get('stream', False),
+                       codec=options.get('codec', 'mp3'),
+                       journal=journal,
+                       connections=options.get('connections', 4),
+                       normalize=options.get('normalize'),
+                       outputs=options.get('outputs'),
+                       profile=profile)
+        if metrics_file:
+            tracing.get_metrics().write(metrics_file)
+            print(f"Metrics written to {metrics_file}")
+
+    # batch_results.json is a view of the journal, covering earlier runs too
+    journal.write_results(results_file)
+    counts = journal.counts()
+    succeeded = counts.get(DONE, 0) + counts.get(SKIPPED, 0)
+    failures = sum(counts.values()) - succeeded - counts.get(EXPANDED, 0)
+    print(f"Batch complete: {succeeded} succeeded, {failures} failed")
+    return 0 if failures == 0 else 2
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'batch':
+        return run_batch(args)
+    if args.command == 'resume':
+        return run_resume(args)
+    if args.command == 'results':
+        return run_results(args)
+    if args.command == 'serve':
+        return run_serve(args)
+    if args.command == 'enqueue':
+        return run_enqueue(args)
+    if args.command == 'worker':
+        return run_worker(args)
+    if args.command == 'store':
+        return run_store(args)
+    if args.command == 'check':
+        return run_check(args)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
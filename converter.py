@@ -1,9 +1,30 @@
 """
 converter.py - Core YouTube to MP3 conversion functions
 """
-import yt_dlp
+import copy
 import os
 import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import download_archive
+import job_journal
+import loudness_cache
+import metadata_cache
+import playlist
+import profiler
+import progress
+import retry_policy
+import segmented
+import session_pool
+import source_cache
+import streaming
+import tracing
+import transcoder
+from batch_processor import extract_video_id, is_collection_url
+from batch_engine import BatchEngine, DEFAULT_DOWNLOAD_WORKERS
 
 def clean_filename(filename, max_length=200):
     """Remove invalid characters and limit filename length"""
@@ -22,28 +43,493 @@ def clean_filename(filename, max_length=200):
     
     return filename.strip()
 
-def get_video_info(url):
-    """Get video information without downloading"""
+# Process-wide count of metadata extractions, so a job that extracts more
+# than once shows up immediately
+_extractions = 0
+_extractions_lock = threading.Lock()
+
+def extraction_count():
+    """Total extract_info network round-trips made by this process"""
+    return _extractions
+
+def lookup_info(url, use_cache=True):
+    """
+    Info stage: return the info dict for a URL, extracting only on a cache miss
+    
+    Returns:
+        tuple: (info, extractions) - extractions is 0 on a cache hit, else 1
+    """
+    global _extractions
+    video_id = extract_video_id(url)
+    cache = metadata_cache.get_cache() if use_cache and video_id else None
+    
+    if cache is not None:
+        info = cache.get(video_id)
+        if info is not None:
+            return info, 0
+    
+    with _extractions_lock:
+        _extractions += 1
+    progress.report(progress.EXTRACTING)
+    
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
         'skip_download': True,
     }
     
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
+    with tracing.span(tracing.EXTRACT, url):
+        with session_pool.get_pool().session('info', ydl_opts) as ydl, retry_policy.throttled(url):
             info = ydl.extract_info(url, download=False)
+        if not info:
+            raise ValueError('Could not retrieve video information')
+        
+        # Imported here so headless entry points don't pay for yt-dlp at startup
+        from yt_dlp import YoutubeDL
+        info = YoutubeDL.sanitize_info(info)
+    if cache is not None:
+        cache.put(video_id, info)
+    return info, 1
+
+def extract_info(url, use_cache=True):
+    """
+    Return the info dict for a URL (one extraction at most)
+    
+    The dict can be passed to download_audio (info=...) so later stages
+    reuse it instead of extracting again. Callers must not modify it: it
+    may be shared through the metadata cache.
+    """
+    return lookup_info(url, use_cache)[0]
+
+def summarize_info(info):
+    """Reduce a raw info dict to the fields the UI shows"""
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'thumbnail': info.get('thumbnail', ''),
+        'view_count': info.get('view_count', 0),
+    }
+
+def get_video_info(url):
+    """Get video information without downloading"""
+    try:
+        return summarize_info(extract_info(url))
+    except Exception as e:
+        return {'error': str(e)}
+
+def download_audio(url, output_folder="downloads", ffmpeg_location=None, info=None, codec='mp3',
+                   connections=segmented.DEFAULT_CONNECTIONS):
+    """
+    Download stage: fetch the best audio stream without converting it
+
+    The stream is kept in the source cache afterwards, and a video whose
+    audio is already cached (in this or any other audio format) is served
+    from local disk without touching the network.
+
+    Args:
+        url: YouTube URL
+        output_folder: Where to save the file
+        ffmpeg_location: Optional folder containing ffmpeg
+        info: Info dict from extract_info; extracted here if not given
+        codec: Output codec the source will be turned into ('mp3', 'm4a',
+               'opus'); a source already in that codec is preferred so the
+               transcode stage can stream-copy it
+        connections: Parallel range connections for a plain HTTP source
+                     (1 leaves the download to yt-dlp's single stream)
+
+    Returns:
+        dict: {'success': bool, 'source': str, 'title': str, 'url': str,
+               'source_cache': 'hit' | 'stored' | None, 'extractions': int, 'error': str}
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    with progress.bind(url):
+        # Transient failures (429, 5xx, dropped connections) are retried with
+        # backoff; the result carries the retry/throttle counts
+        return retry_policy.call(_download_audio, url, output_folder, ffmpeg_location, info, codec,
+                                 connections)
+
+def _download_audio(url, output_folder, ffmpeg_location, info, codec, connections):
+    extractions = 0
+    
+    try:
+        format_spec = transcoder.codec_info(codec)['format']
+        if info is None:
+            info, extractions = lookup_info(url)
+        
+        title = clean_filename(info.get('title', 'audio_download'))
+        progress.report(progress.DOWNLOADING, title=info.get('title'))
+        
+        selected = select_format(info, format_spec, ffmpeg_location)
+        cached = _cached_download(url, output_folder, info, selected, title, ffmpeg_location, extractions)
+        if cached:
+            return cached
+        
+        # Keep the untouched source apart from the final file so an
+        # .mp3 source can't collide with the encoded output
+        if connections > 1 and segmented.can_segment(selected):
+            with tracing.span(tracing.DOWNLOAD, url, format_id=selected.get('format_id'),
+                              connections=connections) as span:
+                download = _download_segmented(url, output_folder, info, selected, title, connections,
+                                               ffmpeg_location, extractions)
+                span.set(bytes=_file_size(download['source']))
+            return _cache_download(url, selected, download)
+        
+        ydl_opts = {
+            'format': format_spec,
+            'outtmpl': os.path.join(output_folder, f'{title}.source.%(ext)s'),
+            'quiet': True,
+            'no_warnings': True,
+            'progress_hooks': [progress.download_hook],
+            'postprocessor_hooks': [progress.postprocessor_hook],
+            # Pick up an interrupted .part file (e.g. on a resumed batch)
+            'continuedl': True,
+        }
+        if ffmpeg_location:
+            ydl_opts['ffmpeg_location'] = ffmpeg_location
+        
+        segmented.discard_preallocated(os.path.join(output_folder, f"{title}.source.{selected.get('ext', 'bin')}"))
+        with tracing.span(tracing.DOWNLOAD, url, format_id=selected.get('format_id')) as span:
+            with session_pool.get_pool().session(f'audio@{format_spec}@{ffmpeg_location}', ydl_opts) as ydl:
+                session_pool.set_outtmpl(ydl, os.path.join(output_folder, f'{title}.source.%(ext)s'))
+                # Download from the info we already have - no second extraction.
+                # yt-dlp annotates the dict while processing, so work on a copy
+                with retry_policy.throttled(selected.get('url') or url):
+                    downloaded = ydl.process_ie_result(copy.deepcopy(info), download=True)
+            
+            source = downloaded_filepath(downloaded)
+            if not source:
+                # Check for other possible names
+                for file in os.listdir(output_folder):
+                    if file.startswith(f'{title}.source.') and not file.endswith(('.part', segmented.SEGMENTS_SUFFIX)):
+                        source = os.path.join(output_folder, file)
+                        break
+            span.set(bytes=_file_size(source))
+        
+        if not source:
             return {
+                'success': False,
+                'error': 'Downloaded audio not found',
+                'url': url,
                 'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'thumbnail': info.get('thumbnail', ''),
-                'view_count': info.get('view_count', 0),
+                'extractions': extractions
             }
-        except Exception as e:
-            return {'error': str(e)}
+        
+        source_format = downloaded_format(downloaded)
+        return _cache_download(url, source_format, {
+            'success': True,
+            'source': source,
+            'source_acodec': source_format.get('acodec'),
+            'source_abr': source_format.get('abr'),
+            'output_folder': output_folder,
+            'clean_title': title,
+            'title': info.get('title', 'Unknown'),
+            'uploader': info.get('uploader', ''),
+            'ffmpeg_location': ffmpeg_location,
+            'extractions': extractions,
+            'url': url
+        })
+                
+    except Exception as e:
+        return {'success': False, 'error': str(e), 'url': url, 'extractions': extractions}
+
+def _cached_download(url, output_folder, info, selected, title, ffmpeg_location, extractions):
+    """A download result served from the source cache, or None on a miss"""
+    # Other cached audio only stands in if it is at least as good as what we'd download
+    cached = source_cache.get_cache().acquire(extract_video_id(url), selected.get('format_id'),
+                                              fallback_abr=selected.get('abr'))
+    if cached is None:
+        return None
+    progress.report(downloaded_bytes=cached['size'], total_bytes=cached['size'])
+    return {
+        'success': True,
+        'source': cached['filename'],
+        'source_acodec': cached['acodec'],
+        'source_abr': cached['abr'],
+        'source_cache': 'hit',
+        'output_folder': output_folder,
+        'clean_title': title,
+        'title': info.get('title', 'Unknown'),
+        'uploader': info.get('uploader', ''),
+        'ffmpeg_location': ffmpeg_location,
+        'extractions': extractions,
+        'url': url
+    }
+
+def _cache_download(url, fmt, result):
+    """Move a fresh download's source into the source cache"""
+    if result.get('success'):
+        with tracing.span(tracing.MOVE, url, bytes=_file_size(result['source'])):
+            cached = source_cache.get_cache().put(extract_video_id(url), fmt, result['source'])
+        if cached:
+            result['source'] = cached
+            result['source_cache'] = 'stored'
+    return result
 
-def youtube_to_mp3(url, output_folder="downloads", quality='192', add_metadata=True):
+def _file_size(path):
+    """Size of a file, or None if there is none"""
+    return os.path.getsize(path) if path and os.path.exists(path) else None
+
+def release_source(download):
+    """Done with a download's source: unpin it in the source cache, or delete it"""
+    source = download.get('source')
+    if download.get('source_cache'):
+        source_cache.get_cache().release(source)
+    elif source and os.path.exists(source):
+        os.remove(source)
+
+def _download_segmented(url, output_folder, info, selected, title, connections, ffmpeg_location,
+                        extractions):
+    """Fetch a plain HTTP source over parallel range connections"""
+    source = os.path.join(output_folder, f"{title}.source.{selected.get('ext', 'bin')}")
+    total = selected.get('filesize') or selected.get('filesize_approx')
+    
+    def on_progress(downloaded, size):
+        progress.report(downloaded_bytes=downloaded, total_bytes=size or total)
+    
+    chunk_size = (selected.get('downloader_options') or {}).get('http_chunk_size')
+    fetched = segmented.download(selected['url'], source, selected.get('http_headers'), connections,
+                                 chunk_size, on_progress=on_progress)
+    return {
+        'success': True,
+        'source': source,
+        'source_acodec': selected.get('acodec'),
+        'source_abr': selected.get('abr'),
+        'output_folder': output_folder,
+        'clean_title': title,
+        'title': info.get('title', 'Unknown'),
+        'uploader': info.get('uploader', ''),
+        'ffmpeg_location': ffmpeg_location,
+        'extractions': extractions,
+        'connections': fetched['connections'],
+        'url': url
+    }
+
+def downloaded_filepath(info):
+    """Path of the file yt-dlp wrote for a processed info dict, if it exists"""
+    for download in (info or {}).get('requested_downloads') or []:
+        path = download.get('filepath')
+        if path and os.path.exists(path):
+            return path
+    path = (info or {}).get('filepath')
+    if path and os.path.exists(path):
+        return path
+    return None
+
+def downloaded_format(info):
+    """The format dict (acodec, abr, ext, ...) yt-dlp actually downloaded"""
+    downloads = (info or {}).get('requested_downloads') or []
+    return downloads[0] if downloads else (info or {})
+
+def encode_job(url, codec='mp3', quality='192', metadata=None, normalize=None):
+    """
+    transcoder.EncodeJob for one URL, carrying its cached loudness measurements
+    
+    With normalize set and the video measured before, the encode applies
+    the stored values and skips loudness analysis.
+    """
+    measured = None
+    if transcoder.normalize_mode(normalize):
+        measured = loudness_cache.get_cache().get(extract_video_id(url))
+    return transcoder.EncodeJob(codec, quality, metadata, normalize, measured)
+
+def _loudness_result(job, url, result):
+    """Store measurements an encode just took and note them on its result"""
+    if job.loudness is not None:
+        if job.analysis != 'cached':
+            loudness_cache.get_cache().put(extract_video_id(url), job.loudness, job.target)
+        result['loudness'] = job.loudness
+        result['loudness_analysis'] = job.analysis
+    return result
+
+def transcode_audio(download, quality='192', add_metadata=True, codec='mp3', normalize=None):
+    """
+    Transcode stage: turn a downloaded source into the output file and release the source
+    
+    The audio is stream-copied (no re-encode) when the source codec already
+    matches the output codec; otherwise it is encoded at the given quality.
+
+    Args:
+        download: Successful result of download_audio
+        quality: '128', '192', '320' (or 'best' to always keep a matching source)
+        add_metadata: Add title, artist metadata
+        codec: 'mp3', 'm4a', 'opus' or 'flac'
+        normalize: EBU R128 loudness normalization: None, True/'single'
+                   (measure while encoding) or 'two-pass'; see encode_job
+
+    Returns:
+        dict: {'success': bool, 'filename': str, 'title': str, 'url': str,
+               'transcode': 'copy' | 'encode', 'loudness': dict, 'error': str}
+    """
+    url = download.get('url')
+    source = download['source']
+    progress.get_tracker().set_phase(url, progress.TRANSCODING)
+    
+    metadata = None
+    if add_metadata:
+        metadata = {'title': download.get('title'), 'artist': download.get('uploader')}
+    
+    try:
+        ext = transcoder.codec_info(codec)['ext']
+        output_file = os.path.join(download['output_folder'], f"{download['clean_title']}.{ext}")
+        job = encode_job(url, codec, quality, metadata, normalize)
+        with tracing.span(tracing.TRANSCODE, url, codec=codec, input_bytes=_file_size(source)) as span:
+            mode = job.run(source, output_file, download.get('ffmpeg_location'),
+                           download.get('source_acodec'), download.get('source_abr'))
+            span.set(mode=mode, loudness=job.analysis, bytes=_file_size(output_file))
+    except Exception as e:
+        return {'success': False, 'error': str(e), 'url': url, 'title': download.get('title', 'Unknown'),
+                'extractions': download.get('extractions', 0)}
+    finally:
+        release_source(download)
+    
+    return _loudness_result(job, url, {
+        'success': True,
+        'filename': output_file,
+        'title': download.get('title', 'Unknown'),
+        'size': os.path.getsize(output_file) if os.path.exists(output_file) else 0,
+        'codec': codec,
+        'transcode': mode,
+        'extractions': download.get('extractions', 0),
+        'url': url
+    })
+
+def select_format(info, format_spec='bestaudio/best', ffmpeg_location=None):
+    """
+    Run yt-dlp format selection on an info dict without downloading
+    
+    Returns:
+        dict: The info dict with the chosen format's url/ext/protocol merged in
+    """
+    ydl_opts = {
+        'format': format_spec,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    if ffmpeg_location:
+        ydl_opts['ffmpeg_location'] = ffmpeg_location
+    
+    with session_pool.get_pool().session(f'select@{format_spec}@{ffmpeg_location}', ydl_opts) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+def stream_audio(url, output_folder="downloads", quality='192', add_metadata=True, info=None,
+                 ffmpeg_location=None, codec='mp3', normalize=None):
+    """
+    Download and encode in one pass: pipe the audio stream straight into FFmpeg
+    
+    Falls back to the file-based download + transcode when the selected
+    format can't be streamed or the stream fails part way. Loudness
+    normalization measures while encoding (a stream can't be read twice).
+    A source already in the source cache is encoded from disk instead;
+    streamed audio itself is not cached (it never touches the disk).
+    
+    Returns:
+        dict: {'success': bool, 'filename': str, 'title': str, 'url': str,
+               'streamed': bool, 'transcode': 'copy' | 'encode', 'error': str}
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    with progress.bind(url):
+        return _stream_audio(url, output_folder, quality, add_metadata, info, ffmpeg_location, codec,
+                             normalize)
+
+def _stream_audio(url, output_folder, quality, add_metadata, info, ffmpeg_location, codec, normalize):
+    extractions = 0
+    stream_error = None
+    attempts = retry_policy.Attempts()
+    
+    try:
+        settings = transcoder.codec_info(codec)
+        if info is None:
+            with retry_policy.bind(attempts):
+                info, extractions = lookup_info(url)
+        
+        selected = select_format(info, settings['format'], ffmpeg_location)
+        # A cached source is encoded from local disk instead of streamed again
+        title = clean_filename(info.get('title', 'audio_download'))
+        cached = _cached_download(url, output_folder, info, selected, title, ffmpeg_location, extractions)
+        if cached is not None:
+            result = transcode_audio(cached, quality, add_metadata, codec, normalize)
+            result['streamed'] = False
+            return result
+        if streaming.can_stream(selected):
+            output_file = os.path.join(output_folder, f"{title}.{settings['ext']}")
+            metadata = None
+            if add_metadata:
+                metadata = {'title': info.get('title'), 'artist': info.get('uploader')}
+            try:
+                progress.report(title=info.get('title'))
+                chunks = progress.count_bytes(streaming.iter_format(selected, attempts=attempts), url,
+                                              selected.get('filesize') or selected.get('filesize_approx'))
+                job = encode_job(url, codec, quality, metadata, normalize)
+                # Download and encode overlap, so the whole stream is one span
+                with tracing.span(tracing.TRANSCODE, url, codec=codec, streamed=True) as span:
+                    mode, _ = job.stream(chunks, output_file, ffmpeg_location,
+                                         selected.get('acodec'), selected.get('abr'))
+                    span.set(mode=mode, loudness=job.analysis, bytes=_file_size(output_file))
+                return attempts.annotate(_loudness_result(job, url, {
+                    'success': True,
+                    'filename': output_file,
+                    'title': info.get('title', 'Unknown'),
+                    'size': os.path.getsize(output_file) if os.path.exists(output_file) else 0,
+                    'codec': codec,
+                    'transcode': mode,
+                    'streamed': True,
+                    'extractions': extractions,
+                    'url': url
+                }))
+            except Exception as e:
+                stream_error = str(e)
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+    except Exception as e:
+        # Extraction or format selection failed; the file-based path below
+        # extracts again under the retry policy and reports the final error
+        stream_error = str(e)
+    
+    # File-based fallback, reusing the info we already have (if any)
+    download = download_audio(url, output_folder, ffmpeg_location, info=info, codec=codec)
+    download['extractions'] = download.get('extractions', 0) + extractions
+    if download.get('success'):
+        result = transcode_audio(download, quality, add_metadata, codec, normalize)
+    else:
+        result = download
+    result['streamed'] = False
+    if stream_error:
+        result['stream_error'] = stream_error
+    return result
+
+def youtube_to_audio(url, output_folder="downloads", codec='mp3', quality='192', add_metadata=True,
+                     info=None, stream=False, normalize=None):
+    """
+    Convert YouTube video to an audio file (MP3, M4A, Opus or FLAC)
+    
+    Args:
+        url: YouTube URL
+        output_folder: Where to save the file
+        codec: 'mp3', 'm4a', 'opus' or 'flac'. A source already in this codec
+               is stream-copied instead of re-encoded.
+        quality: '128', '192', '320', or 'best' to keep a matching source as is
+        add_metadata: Add title, artist metadata
+        info: Info dict from extract_info, to skip a second extraction
+        stream: Pipe the download straight into FFmpeg (no temp file),
+                falling back to download-then-transcode when not possible
+        normalize: EBU R128 loudness normalization (None, True/'single' or
+                   'two-pass'); analysis and encode share one FFmpeg run, and
+                   measurements are cached per video for later re-encodes
+    
+    Returns:
+        dict: {'success': bool, 'filename': str, 'transcode': str, 'error': str}
+    """
+    if stream:
+        return stream_audio(url, output_folder, quality, add_metadata, info, codec=codec,
+                            normalize=normalize)
+    download = download_audio(url, output_folder, info=info, codec=codec)
+    if not download.get('success'):
+        return download
+    return transcode_audio(download, quality, add_metadata, codec, normalize)
+
+def youtube_to_mp3(url, output_folder="downloads", quality='192', add_metadata=True, info=None,
+                   stream=False):
     """
     Convert YouTube video to MP3
     
@@ -52,114 +538,681 @@ def youtube_to_mp3(url, output_folder="downloads", quality='192', add_metadata=T
         output_folder: Where to save the file
         quality: '128', '192', '320'
         add_metadata: Add title, artist metadata
+        info: Info dict from extract_info, to skip a second extraction
+        stream: Pipe the download straight into FFmpeg (no temp file),
+                falling back to download-then-transcode when not possible
     
     Returns:
         dict: {'success': bool, 'filename': str, 'error': str}
     """
+    return youtube_to_audio(url, output_folder, 'mp3', quality, add_metadata, info, stream)
+
+# MP4 quality -> yt-dlp format selector
+VIDEO_QUALITIES = {
+    '360p': 'bestvideo[height<=360]+bestaudio/best[height<=360]',
+    '480p': 'bestvideo[height<=480]+bestaudio/best[height<=480]',
+    '720p': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
+    '1080p': 'bestvideo[height<=1080]+bestaudio/best[height<=1080]',
+    'best': 'bestvideo+bestaudio/best',
+}
+
+def download_video(url, output_folder="downloads", quality='best', info=None, ffmpeg_location=None,
+                   connections=segmented.DEFAULT_CONNECTIONS):
+    """
+    Download an MP4, fetching separate video and audio streams at the same time
+    
+    The merge starts as soon as both streams are on disk and stream-copies
+    whatever MP4 can carry, so usually nothing is re-encoded.
+    
+    Args:
+        url: YouTube URL
+        output_folder: Where to save the file
+        quality: '360p', '480p', '720p', '1080p' or 'best'
+        info: Info dict from extract_info, to skip a second extraction
+        ffmpeg_location: Optional folder containing ffmpeg
+        connections: Parallel range connections per stream
+    
+    Returns:
+        dict: {'success': bool, 'filename': str, 'title': str, 'merge': 'copy' | 'encode',
+               'timings': {'video_fetch', 'audio_fetch', 'merge', 'total'} in seconds,
+               'url': str, 'error': str}
+    """
     os.makedirs(output_folder, exist_ok=True)
+    with progress.bind(url):
+        return retry_policy.call(_download_video, url, output_folder, quality, info, ffmpeg_location,
+                                 connections)
+
+def _download_video(url, output_folder, quality, info, ffmpeg_location, connections, audio=None,
+                    output_file=None):
+    """
+    download_video; audio is an already downloaded audio source
+    ({'source', 'acodec'}) to merge instead of fetching the audio stream
+    """
+    extractions = 0
+    started = time.monotonic()
+    sources = []
+    held = []  # pinned in the source cache
     
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(output_folder, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'progress_hooks': [],
-        }
+        if info is None:
+            info, extractions = lookup_info(url)
+        title = clean_filename(info.get('title', 'video_download'))
+        progress.report(progress.DOWNLOADING, title=info.get('title'))
+        selected = select_format(info, VIDEO_QUALITIES.get(quality, VIDEO_QUALITIES['best']),
+                                 ffmpeg_location)
+        streams = selected.get('requested_formats') or [selected]
+        shared_audio = audio is not None and len(streams) > 1
+        if shared_audio:
+            streams = [f for f in streams if f.get('vcodec') != 'none']
         
-        # Configure postprocessors
-        postprocessors = []
+        timings = {}
+        fetched = _ByteTotals(len(streams))
+        cache = source_cache.get_cache()
+        video_id = extract_video_id(url)
+        acodecs = {}
+        attempt = tracing.current_attempt()
+        attempts = retry_policy.current_attempts()
         
-        # Audio extraction
-        postprocessors.append({
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': quality,
-        })
+        def fetch(index, fmt):
+            kind = 'audio' if fmt.get('vcodec') == 'none' else 'video'
+            # Cached audio of this video at the same bitrate or better will do;
+            # video must match exactly
+            cached = cache.acquire(video_id, fmt.get('format_id'),
+                                   fallback_abr=fmt.get('abr') if kind == 'audio' else None)
+            if cached is not None:
+                held.append(cached['filename'])
+                acodecs[index] = cached['acodec']
+                timings[f'{kind}_fetch'] = 0.0
+                return cached['filename']
+            path = os.path.join(output_folder, f"{title}.{kind}.{fmt.get('ext', 'bin')}")
+            # Each stream runs on its own thread; report to the same job
+            with progress.bind(url), tracing.span(tracing.DOWNLOAD, url, stream=kind, attempt=attempt,
+                                                  format_id=fmt.get('format_id')) as span:
+                fetch_started = time.monotonic()
+                path = _fetch_format(info, fmt, path, connections, ffmpeg_location,
+                                     lambda done, total: fetched.update(index, done, total), attempts)
+                timings[f'{kind}_fetch'] = round(time.monotonic() - fetch_started, 3)
+                span.set(bytes=_file_size(path))
+            with tracing.span(tracing.MOVE, url, attempt=attempt, bytes=_file_size(path)):
+                stored = cache.put(video_id, fmt, path)
+            if stored is not None:
+                held.append(stored)
+                return stored
+            return path
         
-        # Metadata
-        if add_metadata:
-            postprocessors.append({
-                'key': 'FFmpegMetadata',
-                'add_metadata': True,
-            })
+        with ThreadPoolExecutor(len(streams), thread_name_prefix='av-fetch') as pool:
+            futures = [pool.submit(fetch, i, fmt) for i, fmt in enumerate(streams)]
+            for future in futures:
+                sources.append(future.result())
         
-        ydl_opts['postprocessors'] = postprocessors
+        progress.report(progress.TRANSCODING)
+        merge_started = time.monotonic()
+        output_file = output_file or os.path.join(output_folder, f"{title}.mp4")
+        video_fmt = next((f for f in streams if f.get('vcodec') != 'none'), streams[0])
+        if shared_audio:
+            audio_source, acodec = audio['source'], audio.get('acodec')
+        else:
+            audio_fmt = next((f for f in streams if f.get('vcodec') == 'none'), video_fmt)
+            audio_source = sources[streams.index(audio_fmt)] if audio_fmt is not video_fmt else None
+            acodec = acodecs.get(streams.index(audio_fmt), audio_fmt.get('acodec'))
+        with tracing.span(tracing.TRANSCODE, url, codec='mp4') as span:
+            merge = transcoder.mux_mp4(sources[streams.index(video_fmt)], output_file, audio_source,
+                                       video_fmt.get('vcodec'), acodec, ffmpeg_location)
+            span.set(mode=merge, bytes=_file_size(output_file))
+        timings['merge'] = round(time.monotonic() - merge_started, 3)
+        timings['total'] = round(time.monotonic() - started, 3)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Get info first to clean filename
-            info = ydl.extract_info(url, download=False)
-            
-            # Check if info is valid
-            if not info:
-                return {'success': False, 'error': 'Could not retrieve video information', 'url': url}
-            
-            title = clean_filename(info.get('title', 'audio_download'))
-            
-            # Set cleaned filename
-            ydl.params['outtmpl'] = os.path.join(output_folder, f'{title}.%(ext)s')
-            
-            # Download
-            ydl.download([url])
-            
-            # Find the downloaded file
-            mp3_file = os.path.join(output_folder, f"{title}.mp3")
-            if os.path.exists(mp3_file):
-                return {
-                    'success': True,
-                    'filename': mp3_file,
-                    'title': info.get('title', 'Unknown'),
-                    'size': os.path.getsize(mp3_file) if os.path.exists(mp3_file) else 0,
-                    'url': url
-                }
-            else:
-                # Check for other possible names
-                for file in os.listdir(output_folder):
-                    if file.startswith(title) and file.endswith('.mp3'):
-                        return {
-                            'success': True,
-                            'filename': os.path.join(output_folder, file),
-                            'title': info.get('title', 'Unknown'),
-                            'url': url
-                        }
-                
-                return {
-                    'success': False, 
-                    'error': 'MP3 file not found after conversion', 
-                    'url': url,
-                    'title': info.get('title', 'Unknown')
-                }
-                
+        return {
+            'success': True,
+            'filename': output_file,
+            'title': info.get('title', 'Unknown'),
+            'size': os.path.getsize(output_file),
+            'merge': merge,
+            'timings': timings,
+            'extractions': extractions,
+            'url': url
+        }
     except Exception as e:
-        return {'success': False, 'error': str(e), 'url': url}
+        return {'success': False, 'error': str(e), 'url': url, 'extractions': extractions}
+    finally:
+        for source in held:
+            source_cache.get_cache().release(source)
+        for source in sources:
+            if source not in held and os.path.exists(source):
+                os.remove(source)
+
+class _ByteTotals:
+    """Sum progress over the streams of one job fetched in parallel"""
+    
+    def __init__(self, count):
+        self._done = [0] * count
+        self._totals = [None] * count
+        self._lock = threading.Lock()
+    
+    def update(self, index, done, total):
+        with self._lock:
+            self._done[index] = done
+            self._totals[index] = total
+            known = None if None in self._totals else sum(self._totals)
+            received = sum(self._done)
+        progress.report(downloaded_bytes=received, total_bytes=known)
+
+def _fetch_format(info, fmt, path, connections, ffmpeg_location, on_progress, attempts=None):
+    """
+    Download one selected format to path; returns the path written
+
+    attempts is the job's retry_policy.Attempts (this may run on a pool thread).
+    """
+    if segmented.can_segment(fmt):
+        chunk_size = (fmt.get('downloader_options') or {}).get('http_chunk_size')
+        segmented.download(fmt['url'], path, fmt.get('http_headers'), connections, chunk_size,
+                           on_progress=on_progress, attempts=attempts)
+        return path
+    
+    # HLS/DASH manifests and other protocols: let yt-dlp fetch just this format
+    segmented.discard_preallocated(path)
+    stem = os.path.splitext(path)[0]
+    ydl_opts = {
+        'format': fmt['format_id'],
+        'outtmpl': f'{stem}.%(ext)s',
+        'quiet': True,
+        'no_warnings': True,
+        'progress_hooks': [progress.download_hook],
+        'continuedl': True,
+    }
+    if ffmpeg_location:
+        ydl_opts['ffmpeg_location'] = ffmpeg_location
+    with session_pool.get_pool().session(f"format@{fmt['format_id']}@{ffmpeg_location}", ydl_opts) as ydl:
+        session_pool.set_outtmpl(ydl, f'{stem}.%(ext)s')
+        with retry_policy.throttled(fmt.get('url') or info.get('webpage_url'), attempts):
+            downloaded = ydl.process_ie_result(copy.deepcopy(info), download=True)
+    source = downloaded_filepath(downloaded)
+    if not source:
+        raise FileNotFoundError(f"Downloaded stream {fmt['format_id']} not found")
+    return source
+
+# One requested output of a multi-output job
+OutputSpec = namedtuple('OutputSpec', 'format quality normalize')
+
+def parse_outputs(outputs):
+    """
+    Output specs for a multi-output job
+    
+    Accepts 'mp3:192,mp3:320,mp4:720p', a list of such strings, or
+    (format, quality[, normalize]) tuples and {'format', 'quality',
+    'normalize'} dicts. A string spec is format[:quality][:normalize], where
+    normalize is 'normalize' (single pass), 'single' or 'two-pass'. Audio
+    quality defaults to 192 (lossless codecs ignore it) and MP4 quality to
+    'best'. Repeated specs are dropped.
+    
+    Returns:
+        list: OutputSpec per output, in the order given
+    
+    Raises:
+        ValueError: for unknown formats, qualities or normalize modes
+    """
+    if isinstance(outputs, str):
+        outputs = [part for part in outputs.split(',') if part.strip()]
+    specs = []
+    for output in outputs:
+        if isinstance(output, dict):
+            parts = [output.get('format'), output.get('quality'), output.get('normalize')]
+        elif isinstance(output, str):
+            parts = output.strip().lower().split(':')
+        else:
+            parts = list(output)
+        if not parts or len(parts) > 3:
+            raise ValueError(f"Bad output spec: {output!r} (use format[:quality][:normalize])")
+        format_type, quality, normalize = (parts + [None, None])[:3]
+        format_type = str(format_type or '').lower()
+        normalize = 'single' if normalize == 'normalize' else normalize
+        
+        if format_type == 'mp4':
+            quality = str(quality or 'best')
+            if quality not in VIDEO_QUALITIES:
+                raise ValueError(f"MP4 quality must be one of {', '.join(VIDEO_QUALITIES)}")
+            if normalize:
+                raise ValueError("Loudness normalization applies to audio outputs only")
+        elif format_type in transcoder.AUDIO_CODECS:
+            lossless = transcoder.codec_info(format_type).get('lossless')
+            quality = 'best' if lossless else str(quality or '192')
+            if quality != 'best' and not quality.isdigit():
+                raise ValueError(f"Audio quality must be a bitrate in kbps or 'best', not {quality!r}")
+            normalize = transcoder.normalize_mode(normalize)
+        else:
+            raise ValueError(f"Unknown output format: {format_type!r} "
+                             f"(use {', '.join(list(transcoder.AUDIO_CODECS) + ['mp4'])})")
+        
+        spec = OutputSpec(format_type, quality, normalize)
+        if spec not in specs:
+            specs.append(spec)
+    if not specs:
+        raise ValueError("No outputs given")
+    return specs
 
-def batch_download(urls, output_folder="downloads", quality='192'):
+def output_label(spec):
+    """'mp3:192', 'mp3:192:two-pass', 'mp4:720p' - the string form parse_outputs reads"""
+    return ':'.join(part for part in spec if part)
+
+def download_outputs(url, outputs, output_folder="downloads", info=None, ffmpeg_location=None,
+                     force=False, connections=segmented.DEFAULT_CONNECTIONS):
     """
-    Download multiple URLs
+    Download stage of a multi-output job: fetch everything its outputs need, once
+    
+    The video is extracted once and one audio source is downloaded for all
+    outputs. Each MP4 quality fetches only its video stream and is merged
+    here with that shared audio (a stream copy). Audio outputs are left to
+    transcode_outputs. Outputs already in the download archive are skipped
+    unless force=True.
     
     Args:
-        urls: List of YouTube URLs
-        output_folder: Download directory
+        outputs: Anything parse_outputs accepts
     
     Returns:
-        list: Results for each download
+        dict: Job result (see fanout_result) plus, while audio outputs are
+              still to be encoded, the shared 'source' and 'pending' specs
     """
-    results = []
-    total = len(urls)
+    specs = parse_outputs(outputs)
+    archive = download_archive.get_archive()
+    done = []
+    todo = []
+    for spec in specs:
+        archived = None
+        if not force:
+            archived = download_archive.archived_result(
+                archive, url, download_archive.archive_format(spec.format, spec.normalize), spec.quality)
+        if archived:
+            done.append(dict(archived, output=output_label(spec), format=spec.format, quality=spec.quality))
+        else:
+            todo.append(spec)
+    if not todo:
+        return fanout_result(url, done)
     
-    for i, url in enumerate(urls, 1):
+    os.makedirs(output_folder, exist_ok=True)
+    extractions = 0
+    if info is None:
         try:
-            print(f"[{i}/{total}] Processing: {url[:50]}...")
-            result = youtube_to_mp3(url, output_folder, quality)
-            results.append(result)
+            info, extractions = lookup_info(url)
+        except Exception as e:
+            return fanout_result(url, done + [_output_failure(url, spec, e) for spec in todo])
+    
+    videos = [spec for spec in todo if spec.format == 'mp4']
+    audio = [spec for spec in todo if spec.format != 'mp4']
+    title = clean_filename(info.get('title', 'download'))
+    # Named over every spec, so an output redone later gets the same file name
+    names = _output_names(title, specs)
+    
+    if len(videos) == 1 and not audio:
+        # Nothing to share: a plain MP4 download
+        result = download_video(url, output_folder, videos[0].quality, info, ffmpeg_location, connections)
+        done.append(_recorded(archive, url, videos[0], result))
+        return fanout_result(url, done, extractions)
+    
+    # One audio download for every output; an MP4 source (AAC) when it only feeds MP4s
+    download = download_audio(url, output_folder, ffmpeg_location, info, audio[0].format if audio else 'm4a',
+                              connections)
+    if not download.get('success'):
+        return fanout_result(url, done + [_output_failure(url, spec, download.get('error')) for spec in todo],
+                             extractions)
+    
+    shared = {'source': download['source'], 'acodec': download.get('source_acodec')}
+    for spec in videos:
+        output_file = os.path.join(output_folder, names[spec])
+        with progress.bind(url):
+            result = retry_policy.call(_download_video, url, output_folder, spec.quality, info,
+                                       ffmpeg_location, connections, shared, output_file)
+        done.append(_recorded(archive, url, spec, result))
+    
+    if not audio:
+        release_source(download)
+        return fanout_result(url, done, extractions)
+    
+    return dict(fanout_result(url, done, extractions), success=True, skipped=False, source=download['source'],
+                source_acodec=download.get('source_acodec'), source_abr=download.get('source_abr'),
+                source_cache=download.get('source_cache'), output_folder=output_folder, names=names, pending=audio,
+                title=download.get('title'), uploader=download.get('uploader'),
+                ffmpeg_location=ffmpeg_location)
+
+def transcode_outputs(download, add_metadata=True):
+    """
+    Transcode stage of a multi-output job: every pending audio output in one FFmpeg run
+    
+    Each output has its own codec, bitrate and loudness filter graph, but
+    the shared source is read and decoded once (transcoder.encode_outputs).
+    The source is released afterwards.
+    
+    Returns:
+        dict: The finished job result (see fanout_result)
+    """
+    url = download.get('url')
+    specs = download.get('pending')
+    if not specs:
+        return download
+    source = download['source']
+    progress.get_tracker().set_phase(url, progress.TRANSCODING)
+    
+    metadata = None
+    if add_metadata:
+        metadata = {'title': download.get('title'), 'artist': download.get('uploader')}
+    
+    archive = download_archive.get_archive()
+    done = list(download.get('outputs', []))
+    try:
+        jobs = [(encode_job(url, spec.format, spec.quality, metadata, spec.normalize),
+                 os.path.join(download['output_folder'], download['names'][spec])) for spec in specs]
+        with tracing.span(tracing.TRANSCODE, url, outputs=len(jobs), input_bytes=_file_size(source)) as span:
+            modes = transcoder.encode_outputs(source, jobs, download.get('ffmpeg_location'),
+                                              download.get('source_acodec'), download.get('source_abr'))
+            span.set(bytes=sum(_file_size(output_file) or 0 for _, output_file in jobs))
+    except Exception as e:
+        done += [_output_failure(url, spec, e) for spec in specs]
+        return fanout_result(url, done, download.get('extractions', 0))
+    finally:
+        release_source(download)
+    
+    for spec, (job, output_file), mode in zip(specs, jobs, modes):
+        result = _loudness_result(job, url, {
+            'success': True,
+            'filename': output_file,
+            'title': download.get('title', 'Unknown'),
+            'size': os.path.getsize(output_file) if os.path.exists(output_file) else 0,
+            'codec': spec.format,
+            'transcode': mode,
+            'url': url
+        })
+        done.append(_recorded(archive, url, spec, result))
+    return fanout_result(url, done, download.get('extractions', 0))
+
+def convert_outputs(url, outputs, output_folder="downloads", info=None, ffmpeg_location=None,
+                    force=False, connections=segmented.DEFAULT_CONNECTIONS):
+    """
+    Produce several formats/bitrates of one video from a single download
+    
+    e.g. convert_outputs(url, 'mp3:192,mp3:320,mp4:720p') extracts once,
+    downloads the audio once, merges the MP4 with it and encodes both MP3s
+    in one FFmpeg run.
+    
+    Returns:
+        dict: See fanout_result; 'outputs' has one entry per output, and
+              'stages' has the time spent per stage (tracing.finish)
+    """
+    download = download_outputs(url, outputs, output_folder, info, ffmpeg_location, force, connections)
+    if download.get('pending'):
+        download = transcode_outputs(download)
+    return tracing.finish(download)
+
+def fanout_result(url, outputs, extractions=0):
+    """
+    Job result for a multi-output job
+    
+    Returns:
+        dict: {'success': all outputs succeeded, 'outputs': [per-output
+               result, each with 'output', 'format', 'quality'], 'filename':
+               first output file, 'title', 'skipped': every output was
+               archived, 'url', 'error': joined output errors}
+    """
+    outputs = list(outputs)
+    succeeded = [o for o in outputs if o.get('success')]
+    result = {
+        'success': len(succeeded) == len(outputs),
+        'outputs': outputs,
+        'filename': succeeded[0]['filename'] if succeeded else None,
+        'title': next((o['title'] for o in outputs if o.get('title')), 'Unknown'),
+        'skipped': bool(outputs) and all(o.get('skipped') for o in outputs),
+        'extractions': extractions,
+        'url': url
+    }
+    errors = [f"{o['output']}: {o['error']}" for o in outputs if not o.get('success')]
+    if errors:
+        result['error'] = '; '.join(errors)
+    return result
+
+def _output_names(title, specs):
+    """File name per output; outputs sharing an extension get a suffix"""
+    exts = {spec: 'mp4' if spec.format == 'mp4' else transcoder.codec_info(spec.format)['ext']
+            for spec in specs}
+    names = {}
+    for spec, ext in exts.items():
+        if list(exts.values()).count(ext) == 1:
+            names[spec] = f"{title}.{ext}"
+        else:
+            suffix = spec.quality if spec.quality.endswith('p') or spec.quality == 'best' else f'{spec.quality}k'
+            if spec.normalize:
+                suffix += ' normalized'
+            names[spec] = f"{title} ({suffix}).{ext}"
+    return names
+
+def _output_failure(url, spec, error):
+    return {'success': False, 'error': str(error), 'url': url, 'output': output_label(spec),
+            'format': spec.format, 'quality': spec.quality}
+
+def _recorded(archive, url, spec, result):
+    """Tag one output's result with its spec and archive it"""
+    result = dict(result, url=url, output=output_label(spec), format=spec.format, quality=spec.quality)
+    result.pop('extractions', None)
+    return download_archive.record_result(
+        archive, result, download_archive.archive_format(spec.format, spec.normalize), spec.quality)
+
+def convert_url(url, output_folder="downloads", quality='192', codec='mp3', force=False, stream=False,
+                normalize=None):
+    """
+    Convert one URL end to end, honouring the download archive
+    
+    Used by long-running workers that take URLs one at a time instead of
+    as a batch.
+    
+    Returns:
+        dict: Same shape as youtube_to_audio; 'skipped': True if the archive
+              already had an intact output; 'stages': time spent per stage
+              (tracing.finish)
+    """
+    archive = download_archive.get_archive()
+    archive_format = download_archive.archive_format(codec, normalize)
+    if not force:
+        archived = download_archive.archived_result(archive, url, archive_format, quality)
+        if archived:
+            return tracing.finish(archived)
+    result = youtube_to_audio(url, output_folder, codec, quality, stream=stream, normalize=normalize)
+    return tracing.finish(download_archive.record_result(archive, result, archive_format, quality))
+
+class BatchTotals:
+    """
+    Running counts over a batch's results, for its closing summary
+    
+    add() each result as it is yielded; nothing per job is kept, so a batch
+    of any length is summarized in constant memory.
+    """
+    
+    def __init__(self):
+        self.jobs = 0
+        self.succeeded = 0
+        self.skipped = 0
+        self.copied = 0
+        self.files = 0
+        self.normalized = 0
+        self.loudness_reused = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttle_seconds = 0.0
+        self.stages = tracing.StageSummary()
+    
+    @property
+    def failed(self):
+        return self.jobs - self.succeeded
+    
+    def add(self, result):
+        self.jobs += 1
+        self.succeeded += bool(result.get('success'))
+        self.skipped += bool(result.get('skipped'))
+        self.copied += result.get('transcode') == 'copy'
+        self.files += sum(1 for output in result.get('outputs', []) if output.get('success'))
+        if result.get('loudness'):
+            self.normalized += 1
+            self.loudness_reused += result.get('loudness_analysis') == 'cached'
+        self.retries += result.get('retries', 0)
+        self.rate_limited += result.get('rate_limited', 0)
+        self.throttle_seconds += result.get('throttle_seconds', 0)
+        self.stages.add(result)
+    
+    def as_dict(self):
+        totals = {name: value for name, value in vars(self).items() if name != 'stages'}
+        totals['failed'] = self.failed
+        totals['stages'] = self.stages.summary()
+        return totals
+
+def batch_download(urls, output_folder="downloads", quality='192',
+                   download_workers=DEFAULT_DOWNLOAD_WORKERS, transcode_workers=None, ordered=True,
+                   force=False, stream=False, codec='mp3', show_progress=True, journal=None,
+                   connections=segmented.DEFAULT_CONNECTIONS, normalize=None, outputs=None, profile=None):
+    """
+    Download multiple URLs concurrently
+    
+    Args:
+        urls: YouTube URLs; playlist and channel URLs are expanded lazily,
+              so their first entries start converting while later pages
+              are still being listed. Duplicate videos are converted once.
+        output_folder: Download directory
+        download_workers: Parallel downloads
+        transcode_workers: Parallel FFmpeg encodes (default: CPU count)
+        ordered: Report results in input order instead of completion order
+        force: Convert again even if the download archive has an intact output
+        stream: Pipe downloads straight into FFmpeg; download and encode then
+                run as one stage on the download pool
+        codec: Output audio codec ('mp3', 'm4a', 'opus', 'flac')
+        show_progress: Draw live per-job progress when stdout is a terminal
+        journal: Optional job_journal.JobJournal; every item's state change
+                 is appended to it as it happens, so the batch can be resumed
+        connections: Parallel range connections per download (1 = single stream)
+        normalize: EBU R128 loudness normalization (None, True/'single' or
+                   'two-pass'); videos measured before skip the analysis
+        outputs: Several outputs per video from one download (anything
+                 parse_outputs accepts, e.g. 'mp3:192,mp3:320,mp4:720p');
+                 replaces codec/quality/normalize, and stream is ignored
+        profile: Sample the run with profiler.Profiler and write its report:
+                 True/False, or the fraction of runs to profile (default:
+                 $YT2MP3_PROFILE_RATE)
+    
+    Returns:
+        dict: BatchTotals.as_dict() - job, success, skip and retry counts and
+              the per-stage summary. Per-job results (with their per-stage
+              timings in 'stages') go to the journal as they finish.
+    """
+    totals = BatchTotals()
+    total = None
+    if isinstance(urls, (list, tuple)) and not any(map(is_collection_url, urls)):
+        total = len(urls)
+    engine = BatchEngine(download_workers, transcode_workers, ordered)
+    normalize = transcoder.normalize_mode(normalize)
+    if outputs is not None:
+        outputs = parse_outputs(outputs)
+    archive = download_archive.get_archive()
+    archive_format = download_archive.archive_format(codec, normalize)
+    extractions_before = extraction_count()
+    sources_before = source_cache.get_cache().stats()
+    
+    def finished(result):
+        # Per-stage timings go into the result, and so into the journal and results file
+        result = tracing.finish(result)
+        if journal is not None:
+            journal.record_result(result)
+        return result
+    
+    def started(url):
+        if journal is not None:
+            journal.record(url, job_journal.DOWNLOADING)
+    
+    def download(url):
+        if not force:
+            archived = download_archive.archived_result(archive, url, archive_format, quality)
+            if archived:
+                return finished(archived)
+        started(url)
+        result = download_audio(url, output_folder, codec=codec, connections=connections)
+        return result if result.get('success') else finished(result)
+    
+    def transcode(download):
+        result = transcode_audio(download, quality, codec=codec, normalize=normalize)
+        return finished(download_archive.record_result(archive, result, archive_format, quality))
+    
+    def download_and_stream(url):
+        if not force:
+            archived = download_archive.archived_result(archive, url, archive_format, quality)
+            if archived:
+                return finished(archived)
+        started(url)
+        result = stream_audio(url, output_folder, quality, codec=codec, normalize=normalize)
+        return finished(download_archive.record_result(archive, result, archive_format, quality))
+    
+    def download_fanout(url):
+        started(url)
+        result = download_outputs(url, outputs, output_folder, force=force, connections=connections)
+        # Failures and fully archived jobs are final; the rest go on to transcode_outputs
+        if result.get('success') and not result.get('skipped'):
+            return result
+        return finished(result)
+    
+    def transcode_fanout(download):
+        return finished(transcode_outputs(download))
+    
+    def expanded(url, count):
+        out(f"Listed {count} new videos from {url}")
+        if journal is not None:
+            journal.record(url, job_journal.EXPANDED)
+    
+    videos = playlist.expand_urls(urls, on_expanded=expanded)
+    if outputs is not None:
+        jobs = engine.run(videos, download_fanout, transcode_fanout)
+    elif stream:
+        jobs = engine.run(videos, download_and_stream)
+    else:
+        jobs = engine.run(videos, download, transcode)
+    
+    tracker = progress.get_tracker()
+    display = None
+    if show_progress and progress.CliProgressDisplay.supported():
+        display = progress.CliProgressDisplay(tracker).start()
+    out = display.print if display else print
+    sampler = profiler.Profiler().start() if profiler.should_profile(profile) else None
+    
+    try:
+        for i, result in enumerate(jobs, 1):
+            totals.add(result)
+            tracker.finish(result.get('url'), result.get('success'), result.get('error'))
+            tracker.prune()
             
-            if result['success']:
-                print(f"    ✓ Success: {result.get('title', 'Unknown')}")
+            position = f"{i}/{total}" if total else str(i)
+            if result.get('skipped'):
+                out(f"[{position}] ↷ Already converted: {result.get('title', 'Unknown')}")
+            elif result['success']:
+                out(f"[{position}] ✓ Success: {result.get('title', 'Unknown')}")
             else:
-                print(f"    ✗ Failed: {result.get('error', 'Unknown error')}")
-                
-        except Exception as e:
-            results.append({'success': False, 'error': str(e), 'url': url})
-            print(f"    ✗ Error: {e}")
+                out(f"[{position}] ✗ Failed: {str(result.get('url', ''))[:50]} - {result.get('error', 'Unknown error')}")
+    finally:
+        if sampler:
+            sampler.stop()
+        if display:
+            display.stop()
+    
+    if totals.jobs:
+        jobs = totals.jobs
+        extractions = extraction_count() - extractions_before
+        print(f"Archive: {totals.skipped} of {jobs} already converted (skipped)")
+        print(f"Stream copy: {totals.copied} of {jobs} needed no re-encode")
+        if outputs is not None:
+            print(f"Outputs: {totals.files} files from {jobs} jobs ({len(outputs)} per job)")
+        if normalize:
+            print(f"Loudness: {totals.normalized} normalized, {totals.loudness_reused} reused cached measurements, "
+                  f"{totals.normalized - totals.loudness_reused} measured")
+        print(f"Retries: {totals.retries} ({totals.rate_limited} rate limited), "
+              f"throttled for {totals.throttle_seconds:.1f}s")
+        print(f"Extractions: {extractions} for {jobs} jobs ({extractions / jobs:.2f} per job)")
+        stats = metadata_cache.get_cache().stats()
+        print(f"Metadata cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_ratio']:.0%})")
+        print(f"Source cache: {source_cache.summary(sources_before)}")
+        print(f"Stages: {tracing.format_summary(totals.stages.summary())}")
+    if sampler:
+        report, folded = sampler.write()
+        print(f"Profile: {sampler.summary()}")
+        print(f"Profile written to {report} (flame graph input: {folded})")
     
-    return results
\ No newline at end of file
+    return totals.as_dict()
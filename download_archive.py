@@ -0,0 +1,193 @@
+"""
+download_archive.py - Persistent record of finished conversions
+
+Every successful conversion is recorded under (video ID, format, quality)
+with its output path, size, mtime and SHA-256. Batches check the archive
+before doing any network or FFmpeg work and skip entries whose output is
+still on disk and intact.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import tracing
+from batch_processor import extract_video_id
+from metadata_cache import default_cache_dir
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadArchive:
+    """
+    (video ID, format, quality) -> output file archive
+
+    Args:
+        path: SQLite file (default: <cache dir>/archive.sqlite3)
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'archive.sqlite3')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS archive ('
+            ' video_id TEXT NOT NULL,'
+            ' format TEXT NOT NULL,'
+            ' quality TEXT NOT NULL,'
+            ' filename TEXT NOT NULL,'
+            ' title TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' mtime REAL NOT NULL,'
+            ' sha256 TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' PRIMARY KEY (video_id, format, quality))')
+
+    def lookup(self, video_id, format_type, quality):
+        """
+        Return the archived entry if its output is still present and intact
+
+        The file is re-hashed only when its size or mtime changed since it
+        was recorded, so a hit normally costs one stat() call.
+
+        Returns:
+            dict or None: {'filename', 'title', 'size', 'sha256'}
+        """
+        if not video_id:
+            return None
+        key = (video_id, str(format_type).lower(), str(quality))
+        with self._lock:
+            row = self._db.execute(
+                'SELECT filename, title, size, mtime, sha256 FROM archive'
+                ' WHERE video_id = ? AND format = ? AND quality = ?', key).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+
+        filename, title, size, mtime, sha256 = row
+        try:
+            stat = os.stat(filename)
+            intact = stat.st_size == size and (
+                stat.st_mtime == mtime or file_checksum(filename) == sha256)
+        except OSError:
+            intact = False
+
+        if not intact:
+            self.forget(*key)
+            self._count('stale')
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return {'filename': filename, 'title': title, 'size': size, 'sha256': sha256}
+
+    def record(self, video_id, format_type, quality, filename, title=None):
+        """Record a finished output file"""
+        if not video_id or not filename or not os.path.exists(filename):
+            return False
+        stat = os.stat(filename)
+        sha256 = file_checksum(filename)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO archive'
+                ' (video_id, format, quality, filename, title, size, mtime, sha256, created)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (video_id, str(format_type).lower(), str(quality), filename, title,
+                 stat.st_size, stat.st_mtime, sha256, time.time()))
+        return True
+
+    def forget(self, video_id, format_type, quality):
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM archive WHERE video_id = ? AND format = ? AND quality = ?',
+                (video_id, str(format_type).lower(), str(quality)))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+def archive_format(format_type, normalize=None):
+    """Archive format key: a loudness-normalized output is a different file"""
+    format_type = str(format_type).lower()
+    return f'{format_type}+loudnorm' if normalize else format_type
+
+
+def archived_result(archive, url, format_type, quality):
+    """
+    Build a finished result for a URL already in the archive
+
+    Returns:
+        dict or None: {'success': True, 'filename', 'title', 'url', 'skipped': True, ...}
+    """
+    entry = archive.lookup(extract_video_id(url), format_type, quality)
+    if entry is None:
+        return None
+    return {
+        'success': True,
+        'filename': entry['filename'],
+        'title': entry['title'] or 'Unknown',
+        'size': entry['size'],
+        'skipped': True,
+        'url': url
+    }
+
+
+def record_result(archive, result, format_type, quality):
+    """Archive a successful, freshly converted result"""
+    if result.get('success') and not result.get('skipped'):
+        # Hashes the whole output, so it gets its own stage span
+        with tracing.span(tracing.ARCHIVE, result.get('url'), bytes=result.get('size')):
+            archive.record(extract_video_id(result.get('url')), format_type, quality,
+                           result.get('filename'), result.get('title'))
+    return result
+
+
+_default_archive = None
+_default_lock = threading.Lock()
+
+
+def get_archive():
+    """Shared process-wide archive, created on first use"""
+    global _default_archive
+    with _default_lock:
+        if _default_archive is None:
+            _default_archive = DownloadArchive()
+        return _default_archive
+
+
+def configure(cache_dir=None):
+    """Replace the shared archive, e.g. to point it at a temp directory"""
+    global _default_archive
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'archive.sqlite3')
+    archive = DownloadArchive(path)
+    with _default_lock:
+        old, _default_archive = _default_archive, archive
+    if old is not None:
+        old.close()
+    return archive
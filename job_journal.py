@@ -0,0 +1,311 @@
+"""
+job_journal.py - Append-only JSONL journal for batch jobs
+
+The journal is written as the batch runs: a 'start' record with the URL list
+and options, then one record per item state change (downloading, done,
+failed, skipped). A batch streamed from a file or stdin starts with an
+empty list instead: feed() journals each URL as 'queued' when the batch
+pulls it, and the start record names the source file so a resume can read
+on from it. Videos discovered by expanding a playlist or channel
+are journaled the same way and join the job's item list as they first
+appear. A crashed or killed batch can be resumed from it, and
+batch_results.json is just a view generated from it.
+
+A half-written last line (crash mid-write) is ignored on replay.
+
+Only compact state is held in memory: VideoIdSets of the journaled,
+started and finished videos and a count per state. pending() and
+results() read the file again instead, so a journal of millions of items
+costs a few dozen bytes per video, not a dict per result.
+"""
+import json
+import os
+import threading
+import time
+
+import url_parser
+from batch_processor import VideoIdSet, save_batch_results
+from metadata_cache import default_cache_dir
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+EXPANDED = 'expanded'  # a playlist/channel URL whose entries were all queued
+FINAL_STATES = (DONE, FAILED, SKIPPED, EXPANDED)
+
+
+def default_journal_dir():
+    return os.path.join(default_cache_dir(), 'jobs')
+
+
+def state_for_result(result):
+    """Journal state for a finished result dict"""
+    if result.get('skipped'):
+        return SKIPPED
+    return DONE if result.get('success') else FAILED
+
+
+class JobJournal:
+    """
+    One batch job's journal
+
+    Use JobJournal.create() for a new job and JobJournal.open() to resume.
+    Items are tracked by video ID, so two URL forms of one video are the
+    same item; playlist and channel URLs are tracked as given.
+
+    Args:
+        path: Journal file
+        fsync: fsync after every final-state record (survives power loss,
+               not just process death, at the cost of a disk flush per item)
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.job_id = None
+        self.options = {}
+        self.source = None
+        self._known = VideoIdSet()
+        self._started = VideoIdSet()
+        self._finals = {state: VideoIdSet() for state in FINAL_STATES}  # first final state only
+        self._latest = {}  # key -> [state, final records] for the few items finished more than once
+        self._counts = dict.fromkeys((QUEUED, DOWNLOADING) + FINAL_STATES, 0)
+        self._lock = threading.Lock()
+        torn = self._replay()
+        self._file = open(path, 'a', encoding='utf-8')
+        if torn:
+            # Start appends on a fresh line after a half-written record
+            self._file.write('\n')
+
+    @classmethod
+    def create(cls, urls, options=None, path=None, fsync=False, source=None):
+        """
+        Start a new journal holding the URL list and batch options
+
+        Pass urls=() for a streamed batch and run it through feed(); source
+        is the file it streams from, if it can be read again on resume.
+        """
+        job_id = time.strftime('batch-%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+        if path is None:
+            os.makedirs(default_journal_dir(), exist_ok=True)
+            path = os.path.join(default_journal_dir(), f'{job_id}.jsonl')
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'event': 'start', 'job': job_id, 'time': time.time(),
+                                'urls': list(urls), 'options': options or {},
+                                'source': source},
+                               ensure_ascii=False) + '\n')
+        return cls(path, fsync)
+
+    @classmethod
+    def open(cls, path, fsync=False):
+        """Open an existing journal to resume it"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Journal not found: {path}')
+        return cls(path, fsync)
+
+    def record(self, url, state, result=None):
+        """Append a state transition for one URL"""
+        entry = {'event': 'item', 'url': url, 'state': state, 'time': time.time()}
+        if result is not None:
+            entry['result'] = result
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self._apply(entry)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync and state in FINAL_STATES:
+                os.fsync(self._file.fileno())
+
+    def record_result(self, result):
+        """Record a finished result and return it (for chaining)"""
+        self.record(result.get('url'), state_for_result(result), result)
+        return result
+
+    def state(self, url):
+        """Latest state of url, or None if it was never journaled"""
+        with self._lock:
+            return self._state(_key(url))
+
+    def feed(self, urls):
+        """Yield urls, journaling each new one as queued when it is pulled"""
+        for url in urls:
+            with self._lock:
+                known = _key(url) in self._known
+            if not known:
+                self.record(url, QUEUED)
+            yield url
+
+    def needs_work(self, url, retry_failed=False):
+        """True unless url already reached a final state (see pending())"""
+        redo = (DONE, SKIPPED, EXPANDED) if retry_failed else FINAL_STATES
+        return self.state(url) not in redo
+
+    def pending(self, retry_failed=False):
+        """
+        Yield the URLs that still need work, in original order
+
+        Read from the journal as written when called; items journaled
+        later (e.g. by feed()) are not included.
+        """
+        listed = VideoIdSet()
+        for url in self._urls(self._entries(self._written())):
+            key = _key(url)
+            if key not in listed and self.needs_work(url, retry_failed):
+                listed.add(key)
+                yield url
+
+    def counts(self):
+        """Items per state; queued and downloading are the unfinished ones"""
+        with self._lock:
+            return {state: n for state, n in self._counts.items() if n}
+
+    def results(self):
+        """
+        Yield the latest result per item (expanded playlists and channels have none)
+
+        Finished items come in the order they finished; an unfinished item
+        is marked where it first appears.
+        """
+        with self._lock:
+            # Snapshot, so records appended while this runs don't shift which one is last
+            limit = os.path.getsize(self.path)
+            finals = {key: latest[1] for key, latest in self._latest.items()}
+        marked = VideoIdSet()
+        for entry in self._entries(limit):
+            if entry.get('event') == 'start':
+                for url in entry.get('urls', []):
+                    marker = self._unfinished(url, marked)
+                    if marker:
+                        yield marker
+            elif entry.get('event') != 'item':
+                continue
+            elif entry.get('state') not in FINAL_STATES:
+                marker = self._unfinished(entry['url'], marked)
+                if marker:
+                    yield marker
+            else:
+                key = _key(entry['url'])
+                if key in finals:
+                    # Only the last of its final records counts
+                    finals[key] -= 1
+                    if finals[key]:
+                        continue
+                if entry['state'] != EXPANDED and 'result' in entry:
+                    yield entry['result']
+
+    def write_results(self, output_file="batch_results.json"):
+        """Regenerate batch_results.json from the journal"""
+        return save_batch_results(self.results(), output_file)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _replay(self):
+        """Apply every readable record; True if the file ends mid-line"""
+        if not os.path.exists(self.path):
+            return False
+        for entry in self._entries():
+            self._apply(entry)
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def _written(self):
+        """Bytes of the journal written so far"""
+        with self._lock:
+            return os.path.getsize(self.path)
+
+    def _entries(self, limit=None):
+        """Records in the file, up to limit bytes; unreadable lines are skipped"""
+        read = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                read += len(line)
+                if limit is not None and read > limit:
+                    return
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    @staticmethod
+    def _urls(entries):
+        """Every URL the records mention, in order (with repeats)"""
+        for entry in entries:
+            if entry.get('event') == 'start':
+                yield from entry.get('urls', [])
+            elif entry.get('event') == 'item':
+                yield entry['url']
+
+    def _unfinished(self, url, marked):
+        """Not-finished marker for url the first time it's seen unfinished"""
+        key = _key(url)
+        with self._lock:
+            state = self._state(key)
+        if state in FINAL_STATES or key in marked:
+            return None
+        marked.add(key)
+        return {'success': False, 'error': 'Not finished', 'state': state or QUEUED, 'url': url}
+
+    def _state(self, key):
+        if key in self._latest:
+            return self._latest[key][0]
+        for state, keys in self._finals.items():
+            if key in keys:
+                return state
+        if key in self._started:
+            return DOWNLOADING
+        return QUEUED if key in self._known else None
+
+    def _apply(self, entry):
+        if entry.get('event') == 'start':
+            self.job_id = entry.get('job')
+            self.options = entry.get('options', {})
+            self.source = entry.get('source')
+            for url in entry.get('urls', []):
+                self._add(_key(url))
+        elif entry.get('event') == 'item':
+            key = _key(entry['url'])
+            self._add(key)
+            state = entry['state']
+            previous = self._state(key)
+            if state in FINAL_STATES:
+                if previous in FINAL_STATES:
+                    latest = self._latest.setdefault(key, [previous, 1])
+                    latest[0] = state
+                    latest[1] += 1
+                else:
+                    self._finals[state].add(key)
+            elif state == DOWNLOADING and previous == QUEUED:
+                self._started.add(key)
+            else:
+                # Queued again, or a retry of a failed item: it stays failed until it finishes
+                return
+            self._counts[previous] -= 1
+            self._counts[state] += 1
+
+    def _add(self, key):
+        if key not in self._known:
+            self._known.add(key)
+            self._counts[QUEUED] += 1
+
+
+def _key(url):
+    """Items are tracked by video ID, collections by their URL"""
+    if not isinstance(url, str):
+        return url
+    return url_parser.video_id(url) or url
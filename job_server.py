@@ -0,0 +1,546 @@
+"""
+job_server.py - Long-running conversion server with a local HTTP API
+
+One warm process (pooled YoutubeDL sessions, metadata cache, download
+archive) serves many clients. Submitted URLs go into a bounded queue that a
+fixed set of worker threads drains. When the queue is full, a submission is
+refused with 429 and a Retry-After estimate instead of piling up.
+
+A video is converted by one worker at a time, whichever job or URL form it
+came from, so two conversions never share its .part and output files. A
+duplicate with the same options gets the running conversion's result; one
+with different options waits until it has finished.
+
+API (JSON bodies and responses):
+    POST /jobs               {"urls": [...]} or {"url": "..."}, optionally
+                             "quality", "codec", "force", "stream", "output"
+                             (a folder inside the server's output folder),
+                             "normalize" (false, true, "single" or "two-pass"),
+                             "outputs" (e.g. "mp3:192,mp3:320,mp4:720p": several
+                             formats from one download; replaces codec/quality)
+                             -> 202 job status, 400 bad request, 429 queue full
+    GET  /jobs               Status of every job still held
+    GET  /jobs/<id>          Status, counts and live progress of one job
+    GET  /jobs/<id>/results  Results in batch_results.json shape
+    GET  /status             Queue depth, capacity, workers, metadata/source cache stats
+    GET  /metrics            Per-stage timings, bytes, errors and retries of every
+                             job so far, in the Prometheus text format (tracing.py)
+"""
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import progress
+import url_parser
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUED = 200  # URLs waiting for a worker
+DEFAULT_KEEP_JOBS = 500  # finished jobs kept around for polling
+MAX_BODY_BYTES = 1024 * 1024
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+
+STOPPED_ERROR = 'Server stopped before this URL was converted'
+
+JOB_OPTIONS = {'quality': '192', 'codec': 'mp3', 'output': 'downloads', 'force': False, 'stream': False,
+               'normalize': None, 'outputs': None}
+QUALITIES = ('128', '192', '320', 'best')
+
+
+class QueueFull(Exception):
+    """Raised when a submission doesn't fit in the queue"""
+
+    def __init__(self, requested, free, retry_after):
+        super().__init__(f'Queue full: {requested} URLs submitted, room for {free}')
+        self.requested = requested
+        self.free = free
+        self.retry_after = retry_after
+
+
+def convert(url, options):
+    """Default worker function: converter.convert_url"""
+    from converter import convert_outputs, convert_url
+    if options.get('outputs'):
+        return convert_outputs(url, options['outputs'], options['output'], force=options['force'])
+    return convert_url(url, options['output'], options['quality'], options['codec'],
+                       force=options['force'], stream=options['stream'],
+                       normalize=options.get('normalize'))
+
+
+def output_folder(root, output):
+    """
+    Resolve a submitted output folder against the server's output folder
+
+    Relative paths are taken inside root; anything that resolves outside it
+    (absolute paths, '..', symlinks) is refused.
+
+    Raises:
+        ValueError: if the folder isn't inside root
+    """
+    if not isinstance(output, str) or not output.strip():
+        raise ValueError('output must be a folder name')
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, output))
+    try:
+        inside = os.path.commonpath([root, path]) == root
+    except ValueError:  # different drives
+        inside = False
+    if not inside:
+        raise ValueError(f'output must be a folder inside {root}')
+    return path
+
+
+def check_options(options):
+    """
+    Merge submitted options over the defaults
+
+    Raises:
+        ValueError: for unknown keys or unsupported values
+    """
+    from transcoder import AUDIO_CODECS, normalize_mode
+
+    unknown = set(options) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown option(s): {', '.join(sorted(unknown))}")
+    merged = dict(JOB_OPTIONS, **options)
+    merged['quality'] = str(merged['quality'])
+    if merged['quality'] not in QUALITIES:
+        raise ValueError(f"quality must be one of {', '.join(QUALITIES)}")
+    if merged['codec'] not in AUDIO_CODECS:
+        raise ValueError(f"codec must be one of {', '.join(AUDIO_CODECS)}")
+    merged['normalize'] = normalize_mode(merged['normalize'])
+    if merged['outputs']:
+        from converter import output_label, parse_outputs
+        merged['outputs'] = ','.join(map(output_label, parse_outputs(merged['outputs'])))
+    return merged
+
+
+class JobQueue:
+    """
+    Bounded queue of conversion items drained by persistent worker threads
+
+    Args:
+        process: Callable(url, options) -> result dict (default: convert)
+        workers: Worker threads
+        max_queued: URLs allowed to wait; submit() raises QueueFull beyond it
+        keep_jobs: Finished jobs kept for polling before the oldest are dropped
+        defaults: Option overrides applied to every job; defaults['output'] is
+                  also the folder a submitted 'output' has to stay inside
+    """
+
+    def __init__(self, process=None, workers=DEFAULT_WORKERS, max_queued=DEFAULT_MAX_QUEUED,
+                 keep_jobs=DEFAULT_KEEP_JOBS, defaults=None):
+        self.process = process or convert
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.keep_jobs = keep_jobs
+        self.defaults = dict(defaults or {})
+        self._items = queue.Queue()
+        self._queued = 0
+        self._active = 0
+        self._item_seconds = None  # moving average, for Retry-After
+        self._in_flight = {}  # video ID -> {'options', 'attached': [(job, index)], 'deferred': [...]}
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, wait=True):
+        """
+        Refuse new jobs; workers exit after the item they are on
+
+        URLs that haven't started fail with STOPPED_ERROR, so every job
+        still reaches DONE.
+        """
+        with self._lock:
+            self._stopping = True
+        # Drop queued items so workers see the stop markers promptly
+        while True:
+            try:
+                item = self._items.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                with self._lock:
+                    self._cancel(*item)
+        for _ in self._threads:
+            self._items.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def submit(self, urls, options=None):
+        """
+        Queue a job of one or more URLs
+
+        Returns:
+            dict: Job status (see status())
+
+        Raises:
+            ValueError: no URLs or bad options
+            QueueFull: not enough room; nothing was queued
+        """
+        urls = list(urls)
+        if not urls:
+            raise ValueError('No URLs to convert')
+        options = dict(options or {})
+        if 'output' in options:
+            root = self.defaults.get('output', JOB_OPTIONS['output'])
+            options['output'] = output_folder(root, options['output'])
+        options = check_options(dict(self.defaults, **options))
+
+        with self._lock:
+            if self._stopping:
+                raise QueueFull(len(urls), 0, None)
+            free = self.max_queued - self._queued
+            if len(urls) > free:
+                raise QueueFull(len(urls), free, self._retry_after())
+            self._queued += len(urls)
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'state': QUEUED,
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'options': options,
+                'urls': urls,
+                'results': [None] * len(urls),
+                'running': 0,
+                'done': 0,
+            }
+            self._jobs[job['id']] = job
+            self._trim()
+
+        for index in range(len(urls)):
+            self._items.put((job, index))
+        return self.status(job['id'])
+
+    def status(self, job_id):
+        """Job summary with per-outcome counts and progress of running URLs, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            summary = self._summarize(job)
+            running = set(url for url, result in zip(job['urls'], job['results']) if result is None)
+
+        if summary['state'] == RUNNING:
+            summary['progress'] = [
+                {key: entry.get(key) for key in ('job', 'phase', 'percent', 'speed', 'eta', 'stalled')}
+                for entry in progress.get_tracker().snapshot()
+                if entry['job'] in running and entry['phase'] not in (progress.FINISHED, progress.FAILED)
+            ]
+        return summary
+
+    def jobs(self):
+        with self._lock:
+            return [self._summarize(job) for job in self._jobs.values()]
+
+    def results(self, job_id):
+        """Results in input order; unfinished URLs are marked, or None for an unknown job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return [result if result is not None else
+                    {'success': False, 'error': 'Not finished', 'state': job['state'], 'url': url}
+                    for url, result in zip(job['urls'], job['results'])]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active': self._active,
+                'queued': self._queued,
+                'max_queued': self.max_queued,
+                'free': self.max_queued - self._queued,
+                'jobs': len(self._jobs),
+                'avg_item_seconds': self._item_seconds,
+            }
+
+    def _work(self):
+        tracker = progress.get_tracker()
+        while True:
+            item = self._items.get()
+            if item is None:
+                return
+            job, index = item
+            url = job['urls'][index]
+            key = url_parser.video_id(url) or url
+            with self._lock:
+                if not self._claim(key, job, index):
+                    continue
+                self._active += 1
+
+            started = time.monotonic()
+            try:
+                result = self.process(url, job['options'])
+            except Exception as e:
+                result = {'success': False, 'error': str(e), 'url': url}
+            elapsed = time.monotonic() - started
+
+            with self._lock:
+                self._active -= 1
+                flight = self._in_flight.pop(key)
+                finished = [(job, index)] + flight['attached']
+                for other, other_index in finished:
+                    other_url = other['urls'][other_index]
+                    other['running'] -= 1
+                    self._finish(other, other_index, result if other_url == url else dict(result, url=other_url))
+                deferred = flight['deferred']
+                if self._stopping:
+                    for other, other_index in deferred:
+                        self._cancel(other, other_index)
+                    deferred = []
+                if self._item_seconds is None:
+                    self._item_seconds = elapsed
+                else:
+                    self._item_seconds = 0.8 * self._item_seconds + 0.2 * elapsed
+            for other, other_index in finished:
+                tracker.finish(other['urls'][other_index], result.get('success'), result.get('error'))
+            tracker.prune()
+            # Duplicates with other options go back in line now that the video is free
+            for item in deferred:
+                self._items.put(item)
+
+    def _claim(self, key, job, index):
+        """
+        Start (job, index) unless its video is already being converted
+
+        A duplicate with the same options is attached to the running
+        conversion; one with other options is deferred until it finishes and
+        stays queued. Returns True if the caller should convert it.
+        """
+        flight = self._in_flight.get(key)
+        if flight is not None and flight['options'] != job['options']:
+            flight['deferred'].append((job, index))
+            return False
+        self._queued -= 1
+        job['running'] += 1
+        if job['state'] == QUEUED:
+            job['state'] = RUNNING
+            job['started'] = time.time()
+        if flight is not None:
+            flight['attached'].append((job, index))
+            return False
+        self._in_flight[key] = {'options': job['options'], 'attached': [], 'deferred': []}
+        return True
+
+    def _finish(self, job, index, result):
+        job['results'][index] = result
+        job['done'] += 1
+        if job['done'] == len(job['urls']):
+            job['state'] = DONE
+            job['finished'] = time.time()
+
+    def _cancel(self, job, index):
+        """Fail a queued item that will never run"""
+        self._queued -= 1
+        self._finish(job, index, {'success': False, 'error': STOPPED_ERROR, 'url': job['urls'][index]})
+
+    def _retry_after(self):
+        """Seconds until roughly a worker's share of the queue has drained"""
+        if not self._item_seconds:
+            return 1
+        return max(1, math.ceil(self._item_seconds * (self._queued / self.workers + 1)))
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['state'] == DONE]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+            del self._jobs[job_id]
+
+    def _summarize(self, job):
+        results = [r for r in job['results'] if r is not None]
+        return {
+            'job': job['id'],
+            'state': job['state'],
+            'created': job['created'],
+            'started': job['started'],
+            'finished': job['finished'],
+            'options': job['options'],
+            'total': len(job['urls']),
+            'queued': len(job['urls']) - job['done'] - job['running'],
+            'running': job['running'],
+            'succeeded': sum(1 for r in results if r.get('success') and not r.get('skipped')),
+            'skipped': sum(1 for r in results if r.get('skipped')),
+            'failed': sum(1 for r in results if not r.get('success')),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'YT2MP3JobServer/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+
+        if parts == ['status']:
+            return self._json(200, self.server.describe())
+        if parts == ['metrics']:
+            import tracing
+            return self._send(200, tracing.get_metrics().render().encode('utf-8'),
+                              'text/plain; version=0.0.4; charset=utf-8')
+        if parts == ['jobs']:
+            return self._json(200, {'jobs': jobs.jobs()})
+        if len(parts) == 2 and parts[0] == 'jobs':
+            status = jobs.status(parts[1])
+            return self._json(200, status) if status else self._error(404, 'Unknown job')
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'results':
+            results = jobs.results(parts[1])
+            return self._json(200, results) if results is not None else self._error(404, 'Unknown job')
+        self._error(404, 'Not found')
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0].rstrip('/') != '/jobs':
+            return self._error(404, 'Not found')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return self._error(400, 'Bad Content-Length')
+        if length > MAX_BODY_BYTES:
+            return self._error(413, 'Request body too large')
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError('Body must be a JSON object')
+        except ValueError as e:
+            return self._error(400, f'Invalid JSON: {e}')
+
+        urls = body.pop('urls', None)
+        if urls is None and 'url' in body:
+            urls = [body.pop('url')]
+        if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+            return self._error(400, 'Send "url" or a list of "urls"')
+
+        invalid = []
+        if not self.server.accept_any_url:
+            from batch_processor import validate_urls
+            # A job is a fixed list of videos; playlists are expanded client-side
+            # (cli.py batch/enqueue) so the queue bound stays meaningful
+            urls, invalid = validate_urls([u.strip() for u in urls], allow_collections=False)
+        try:
+            status = self.server.jobs.submit(urls, body)
+        except QueueFull as e:
+            headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+            return self._json(429 if e.retry_after else 503,
+                              {'error': str(e), 'free': e.free}, headers)
+        except ValueError as e:
+            return self._json(400, {'error': str(e), 'invalid': invalid})
+        status['invalid'] = invalid
+        self._json(202, status, {'Location': f"/jobs/{status['job']}"})
+
+    def _error(self, code, message):
+        self._json(code, {'error': message})
+
+    def _json(self, code, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self._send(code, body, 'application/json; charset=utf-8', headers)
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class JobServer:
+    """
+    HTTP front-end for a JobQueue
+
+    Args:
+        jobs: JobQueue to serve (default: a new one with default settings)
+        host: Interface to bind; keep the default unless clients are remote
+        port: TCP port (0 picks a free one)
+        accept_any_url: Skip YouTube URL validation (local stand-in extractors)
+
+    Usage:
+        with JobServer(port=0) as server:
+            server.base_url
+    """
+
+    def __init__(self, jobs=None, host=DEFAULT_HOST, port=DEFAULT_PORT, accept_any_url=False):
+        self.jobs = jobs or JobQueue()
+        self.host = host
+        self.port = port
+        self.accept_any_url = accept_any_url
+        self.base_url = None
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        """Start workers and serve HTTP on a background thread"""
+        self._bind()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Start workers and serve HTTP on this thread until stop() or Ctrl+C"""
+        self._bind()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._close()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            if self._thread is not None:
+                self._close()
+
+    def describe(self):
+        """Contents of GET /status"""
+        import metadata_cache
+        import session_pool
+        import source_cache
+
+        return {
+            'queue': self.jobs.stats(),
+            'metadata_cache': metadata_cache.get_cache().stats(),
+            'source_cache': source_cache.get_cache().stats(),
+            'session_pool': session_pool.get_pool().stats(),
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _bind(self):
+        self.jobs.start()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.jobs = self.jobs
+        self._httpd.accept_any_url = self.accept_any_url
+        self._httpd.describe = self.describe
+        host, port = self._httpd.server_address[:2]
+        self.port = port
+        self.base_url = f'http://{host}:{port}'
+
+    def _close(self):
+        self._httpd.server_close()
+        self.jobs.stop(wait=False)
@@ -0,0 +1,395 @@
+"""
+job_store.py - Shared job store for spreading a batch over several workers
+
+Items live in one SQLite file that any number of worker processes, on one
+machine or several hosts sharing a volume, pull from. A worker claims items
+with a time-limited lease and renews it with heartbeats while it works. If a
+worker dies, its leases run out and the items go back to the queue for
+another worker, up to max_attempts claims per item.
+
+Items are deduplicated on (video ID, codec, quality): queueing a video that
+is already in the store, under any URL form, is a no-op.
+
+The file uses SQLite's rollback journal rather than WAL, because WAL needs
+shared memory and does not work across hosts on a network filesystem.
+"""
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from batch_processor import extract_video_id
+from download_archive import archive_format
+
+QUEUED = 'queued'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_LEASE = 60  # seconds a claim stays valid without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 1.0
+ADD_CHUNK = 1000  # URLs inserted per transaction by add()
+STORE_RETRY_DELAY = 0.5  # first wait after a locked/busy store, doubled up to STORE_RETRY_MAX_DELAY
+STORE_RETRY_MAX_DELAY = 10.0
+
+
+def item_key(url, options):
+    """Dedup key: video ID (or the URL itself) plus output codec (and normalization) and quality"""
+    if options.get('outputs'):
+        return f"{extract_video_id(url) or url}:{options['outputs']}"
+    codec = archive_format(options.get('codec', 'mp3'), options.get('normalize'))
+    return f"{extract_video_id(url) or url}:{codec}:{options.get('quality', '192')}"
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+
+class JobStore:
+    """
+    SQLite-backed queue of conversion items with lease-based claiming
+
+    Args:
+        path: Store file, shared by every worker
+        lease: Seconds a claim is valid without a heartbeat
+        max_attempts: Claims per item before it is marked failed
+    """
+
+    def __init__(self, path, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' key TEXT PRIMARY KEY,'
+            ' url TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' batch TEXT,'
+            ' state TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' owner TEXT,'
+            ' lease_expires REAL,'
+            ' result TEXT,'
+            ' created REAL NOT NULL,'
+            ' updated REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires)')
+
+    def add(self, urls, options=None, batch=None):
+        """
+        Queue URLs, skipping videos already in the store
+
+        urls may be any iterable; it is consumed ADD_CHUNK at a time, one
+        short transaction each, so workers can claim the first items while
+        a long list is still being added.
+
+        Returns:
+            tuple: (added, duplicates) counts
+        """
+        options = dict(options or {})
+        encoded = json.dumps(options, sort_keys=True)
+        added = 0
+        total = 0
+        urls = iter(urls)
+        while True:
+            chunk = list(itertools.islice(urls, ADD_CHUNK))
+            if not chunk:
+                break
+            now = time.time()
+            with self._transaction() as db:
+                for url in chunk:
+                    cursor = db.execute(
+                        'INSERT OR IGNORE INTO items (key, url, options, batch, state, created, updated)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (item_key(url, options), url, encoded, batch, QUEUED, now, now))
+                    added += cursor.rowcount
+            total += len(chunk)
+        return added, total - added
+
+    def claim(self, worker_id, limit=1):
+        """
+        Lease up to limit items: queued ones first, then ones whose lease ran out
+
+        Items whose lease expired max_attempts times are marked failed.
+
+        Returns:
+            list: dicts with 'key', 'url', 'options', 'attempts'
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'UPDATE items SET state = ?, owner = NULL, updated = ?, result = ?'
+                ' WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+                (FAILED, now, json.dumps({'success': False, 'error': 'Lease expired too many times'}),
+                 CLAIMED, now, self.max_attempts))
+            rows = db.execute(
+                'SELECT key, url, options, attempts FROM items'
+                ' WHERE state = ? OR (state = ? AND lease_expires < ?)'
+                ' ORDER BY created, rowid LIMIT ?',
+                (QUEUED, CLAIMED, now, limit)).fetchall()
+            for key, _, _, _ in rows:
+                db.execute(
+                    'UPDATE items SET state = ?, owner = ?, lease_expires = ?,'
+                    ' attempts = attempts + 1, updated = ? WHERE key = ?',
+                    (CLAIMED, worker_id, now + self.lease, now, key))
+        return [{'key': key, 'url': url, 'options': json.loads(options), 'attempts': attempts + 1}
+                for key, url, options, attempts in rows]
+
+    def heartbeat(self, worker_id, keys):
+        """
+        Extend the leases worker_id still holds
+
+        Returns:
+            set: Keys still owned; anything missing was reclaimed by another worker
+        """
+        keys = list(keys)
+        if not keys:
+            return set()
+        now = time.time()
+        with self._transaction() as db:
+            owned = set()
+            for key in keys:
+                cursor = db.execute(
+                    'UPDATE items SET lease_expires = ?, updated = ?'
+                    ' WHERE key = ? AND owner = ? AND state = ?',
+                    (now + self.lease, now, key, worker_id, CLAIMED))
+                if cursor.rowcount:
+                    owned.add(key)
+        return owned
+
+    def complete(self, worker_id, key, result):
+        """
+        Store a finished item's result
+
+        Returns:
+            bool: False if the lease was lost and another worker owns the item
+        """
+        state = DONE if result.get('success') else FAILED
+        with self._transaction() as db:
+            cursor = db.execute(
+                'UPDATE items SET state = ?, owner = NULL, lease_expires = NULL, result = ?, updated = ?'
+                ' WHERE key = ? AND owner = ? AND state = ?',
+                (state, json.dumps(result, ensure_ascii=False, default=str), time.time(),
+                 key, worker_id, CLAIMED))
+        return cursor.rowcount == 1
+
+    def release(self, worker_id):
+        """Give back every item worker_id holds (clean shutdown); returns the count"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                'UPDATE items SET state = ?, owner = NULL, lease_expires = NULL,'
+                ' attempts = MAX(attempts - 1, 0), updated = ? WHERE owner = ? AND state = ?',
+                (QUEUED, time.time(), worker_id, CLAIMED))
+        return cursor.rowcount
+
+    def retry_failed(self, batch=None):
+        """Queue failed items again with a fresh attempt count"""
+        query = 'UPDATE items SET state = ?, attempts = 0, result = NULL, updated = ? WHERE state = ?'
+        params = [QUEUED, time.time(), FAILED]
+        if batch is not None:
+            query += ' AND batch = ?'
+            params.append(batch)
+        with self._transaction() as db:
+            return db.execute(query, params).rowcount
+
+    def counts(self, batch=None):
+        query = 'SELECT state, COUNT(*) FROM items'
+        params = []
+        if batch is not None:
+            query += ' WHERE batch = ?'
+            params.append(batch)
+        with self._lock:
+            return dict(self._db.execute(query + ' GROUP BY state', params).fetchall())
+
+    def unfinished(self, batch=None):
+        """Number of items still queued or claimed"""
+        counts = self.counts(batch)
+        return counts.get(QUEUED, 0) + counts.get(CLAIMED, 0)
+
+    def results(self, batch=None):
+        """Results in insertion order; unfinished items are marked"""
+        query = 'SELECT url, state, result FROM items'
+        params = []
+        if batch is not None:
+            query += ' WHERE batch = ?'
+            params.append(batch)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY created, rowid', params).fetchall()
+        return [json.loads(result) if result else
+                {'success': False, 'error': 'Not finished', 'state': state, 'url': url}
+                for url, state, result in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so claims from different processes can't interleave"""
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self._lock.release()
+
+
+class StoreWorker:
+    """
+    Pull items from a JobStore and convert them until stopped or the store is empty
+
+    Args:
+        store: JobStore
+        process: Callable(url, options) -> result dict (default: job_server.convert)
+        concurrency: Items converted at once by this worker
+        worker_id: Lease owner name (default: host-pid-random)
+        poll_interval: Seconds to wait when nothing is claimable
+        exit_when_empty: Return once nothing is queued or claimed anywhere
+    """
+
+    def __init__(self, store, process=None, concurrency=4, worker_id=None,
+                 poll_interval=DEFAULT_POLL_INTERVAL, exit_when_empty=False):
+        if process is None:
+            from job_server import convert as process
+        self.store = store
+        self.process = process
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.exit_when_empty = exit_when_empty
+        self.stats = {'claimed': 0, 'done': 0, 'failed': 0, 'lost': 0}
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self):
+        """
+        Work until stop() or (with exit_when_empty) the store drains; returns stats
+
+        On stop, Ctrl+C included, the items in progress are finished before
+        the rest of this worker's leases are released and run() returns.
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._work, name=f'store-worker-{i}')
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            self._join(threads)
+        except KeyboardInterrupt:
+            print("Stopping after the items in progress")
+            raise
+        finally:
+            self._stop.set()
+            self._join(threads)
+            try:
+                self.store.release(self.worker_id)
+            except sqlite3.OperationalError as e:
+                # The leases run out on their own
+                print(f"✗ Could not release {self.worker_id}'s items: {e}")
+        return dict(self.stats)
+
+    def stop(self):
+        self._stop.set()
+
+    def _work(self):
+        while not self._stop.is_set():
+            items = self._retry(self.store.claim, self.worker_id)
+            if not items:
+                if items is not None and self.exit_when_empty and self._retry(self.store.unfinished) == 0:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            item = items[0]
+            with self._lock:
+                self._held.add(item['key'])
+                self.stats['claimed'] += 1
+            try:
+                result = self.process(item['url'], item['options'])
+            except Exception as e:
+                result = {'success': False, 'error': str(e), 'url': item['url']}
+            result['attempts'] = item['attempts']
+            result['worker'] = self.worker_id
+            try:
+                # Past the lease another worker may have taken the item over
+                kept = self._retry(self.store.complete, self.worker_id, item['key'], result,
+                                   deadline=time.monotonic() + self.store.lease)
+            except sqlite3.OperationalError as e:
+                print(f"✗ Could not store the result of {item['url']}: {e}")
+                kept = False
+            with self._lock:
+                self._held.discard(item['key'])
+                if not kept:
+                    self.stats['lost'] += 1
+                elif result.get('success'):
+                    self.stats['done'] += 1
+                else:
+                    self.stats['failed'] += 1
+
+    def _heartbeat(self):
+        # Renew well before expiry so one slow write doesn't cost the lease
+        while not self._stop.wait(max(0.1, self.store.lease / 3)):
+            with self._lock:
+                held = set(self._held)
+            try:
+                self.store.heartbeat(self.worker_id, held)
+            except sqlite3.OperationalError as e:
+                # Tried again on the next beat
+                print(f"✗ Heartbeat failed: {e}")
+
+    def _retry(self, method, *args, deadline=None):
+        """
+        Call a JobStore method, retrying with backoff on sqlite3.OperationalError
+
+        That is usually 'database is locked': other workers held the file
+        for longer than the connection's busy timeout. Without a deadline
+        (a time.monotonic() value) it retries until stop() and then returns
+        None; with one it retries through stop() and re-raises once the
+        deadline has passed.
+        """
+        delay = STORE_RETRY_DELAY
+        while True:
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as e:
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise
+                print(f"✗ Job store busy ({e}); retrying in {delay:g}s")
+            if deadline is not None:
+                time.sleep(delay)
+            elif self._stop.wait(delay):
+                return None
+            delay = min(delay * 2, STORE_RETRY_MAX_DELAY)
+
+    @staticmethod
+    def _join(threads):
+        # Short timeouts keep the main thread responsive to Ctrl+C
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
@@ -0,0 +1,115 @@
+"""
+loudness_cache.py - Persistent EBU R128 loudness measurements (SQLite)
+
+The first normalized encode of a video measures its loudness (loudnorm,
+see transcoder.EncodeJob) and the measurements are kept here under
+(video ID, loudness target). Any later encode of the same video, whether
+another codec, another bitrate or a forced re-convert, applies them in
+linear mode and skips the analysis.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import default_cache_dir
+from transcoder import LOUDNESS_KEYS, loudness_target_key
+
+
+class LoudnessCache:
+    """
+    (video ID, target) -> loudnorm input measurements
+
+    Args:
+        path: SQLite file (default: <cache dir>/loudness.sqlite3)
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'loudness.sqlite3')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS loudness ('
+            ' video_id TEXT NOT NULL,'
+            ' target TEXT NOT NULL,'
+            ' input_i REAL NOT NULL,'
+            ' input_tp REAL NOT NULL,'
+            ' input_lra REAL NOT NULL,'
+            ' input_thresh REAL NOT NULL,'
+            ' target_offset REAL NOT NULL,'
+            ' measured REAL NOT NULL,'
+            ' PRIMARY KEY (video_id, target))')
+
+    def get(self, video_id, target=None):
+        """
+        Measurements for a video at a loudness target
+
+        Returns:
+            dict or None: transcoder.LOUDNESS_KEYS -> float
+        """
+        if not video_id:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(LOUDNESS_KEYS)} FROM loudness WHERE video_id = ? AND target = ?",
+                (video_id, loudness_target_key(target))).fetchone()
+            self._stats['hits' if row else 'misses'] += 1
+        return dict(zip(LOUDNESS_KEYS, row)) if row else None
+
+    def put(self, video_id, measured, target=None):
+        """Store measurements taken by an encode"""
+        if not video_id or not measured:
+            return
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO loudness (video_id, target, {', '.join(LOUDNESS_KEYS)}, measured)"
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (video_id, loudness_target_key(target))
+                + tuple(measured[key] for key in LOUDNESS_KEYS) + (time.time(),))
+            self._stats['stored'] += 1
+
+    def forget(self, video_id):
+        with self._lock:
+            self._db.execute('DELETE FROM loudness WHERE video_id = ?', (video_id,))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide cache, created on first use"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LoudnessCache()
+        return _default_cache
+
+
+def configure(cache_dir=None):
+    """Replace the shared cache, e.g. to point it at a temp directory"""
+    global _default_cache
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'loudness.sqlite3')
+    cache = LoudnessCache(path)
+    with _default_lock:
+        old, _default_cache = _default_cache, cache
+    if old is not None:
+        old.close()
+    return cache
@@ -5,12 +5,24 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
+import queue
 import time
-
-# Install yt-dlp if missing
 import subprocess
 import sys
 
+import download_archive
+import job_journal
+import playlist
+import profiler
+import progress
+import source_cache
+import tracing
+import transcoder
+from batch_engine import BatchEngine, DEFAULT_DOWNLOAD_WORKERS
+from batch_processor import canonical_url, ingest_urls, is_collection_url, iter_urls
+from converter import (BatchTotals, convert_outputs, download_audio, download_video, transcode_audio,
+                       extract_info, lookup_info, output_label, parse_outputs, summarize_info)
+
 def install_requirements():
     """Install required packages if missing"""
     required = ['yt-dlp']
@@ -21,11 +33,6 @@ def install_requirements():
             print(f"Installing {package}...")
             subprocess.check_call([sys.executable, "-m", "pip", "install", package])
 
-install_requirements()
-
-# Now import yt_dlp
-import yt_dlp
-
 # ===========================================
 # SIMPLE WORKING CONVERTER FUNCTIONS
 # ===========================================
@@ -42,128 +49,83 @@ def clean_filename(filename, max_length=200):
         filename = name[:max_length-len(ext)] + ext
     return filename.strip()
 
+def get_ffmpeg_location():
+    """Return the local FFmpeg folder if it exists, otherwise None (use PATH)"""
+    ffmpeg_dir = r"C:\Users\User\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg.Essentials_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-essentials_build\bin"
+    if os.path.exists(os.path.join(ffmpeg_dir, "ffmpeg.exe")):
+        return ffmpeg_dir
+    return None
+
 def get_video_info(url):
     """Get video information without downloading - SIMPLE VERSION"""
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True,
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            # ALWAYS return a dict
-            return {
-                'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'thumbnail': info.get('thumbnail', ''),
-                'view_count': info.get('view_count', 0),
-            }
+        return summarize_info(extract_info(url))
     except Exception as e:
         # ALWAYS return a dict, not a string
         return {'error': str(e)}
 
-def youtube_to_mp3(url, output_folder="downloads", quality='192'):
-    """
-    Convert YouTube video to MP3
+def youtube_to_audio(url, output_folder="downloads", codec='mp3', quality='192', info=None,
+                     normalize=None):
     """
-    os.makedirs(output_folder, exist_ok=True)
+    Convert YouTube video to MP3, M4A, Opus or FLAC
     
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(output_folder, '%(title)s.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': quality,
-        }],
-        'quiet': True,
-        'keepvideo': False,
-        'writethumbnail': False,
-    }
-    
-    # ADD FFMPEG LOCATION
-    ffmpeg_dir = r"C:\Users\User\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg.Essentials_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-essentials_build\bin"
-    if os.path.exists(os.path.join(ffmpeg_dir, "ffmpeg.exe")):
-        ydl_opts['ffmpeg_location'] = ffmpeg_dir
-    
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'audio_download')
-            filename = os.path.join(output_folder, f"{clean_filename(title)}.mp3")
-            
-            return {
-                'success': True,
-                'filename': filename,
-                'title': title,
-                'format': 'MP3',
-                'quality': f'{quality}kbps',
-                'url': url
-            }
-    except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'url': url
-        }
+    The source is downloaded as is and turned into the output by one FFmpeg
+    run (transcoder.EncodeJob): a stream copy when it is already in the
+    right codec, otherwise an encode whose filter graph also normalizes
+    loudness when asked. Pass info (from extract_info) to download without
+    extracting again.
+    """
+    download = download_audio(url, output_folder, get_ffmpeg_location(), info=info, codec=codec)
+    if not download.get('success'):
+        return download
+    result = transcode_audio(download, quality, codec=codec, normalize=normalize)
+    return _audio_result(result, codec, quality)
 
-def youtube_to_mp4(url, output_folder="downloads", quality='best'):
+def youtube_to_mp3(url, output_folder="downloads", quality='192', info=None):
+    """Convert YouTube video to MP3"""
+    return youtube_to_audio(url, output_folder, 'mp3', quality, info)
+
+def youtube_to_mp4(url, output_folder="downloads", quality='best', info=None):
     """
     Convert YouTube video to MP4
-    """
-    os.makedirs(output_folder, exist_ok=True)
-    
-    # Quality mapping
-    quality_map = {
-        '360p': 'bestvideo[height<=360]+bestaudio/best[height<=360]',
-        '480p': 'bestvideo[height<=480]+bestaudio/best[height<=480]',
-        '720p': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
-        '1080p': 'bestvideo[height<=1080]+bestaudio/best[height<=1080]',
-        'best': 'bestvideo+bestaudio/best',
-    }
     
-    format_string = quality_map.get(quality, 'bestvideo+bestaudio/best')
-    
-    ydl_opts = {
-        'format': format_string,
-        'outtmpl': os.path.join(output_folder, '%(title)s.%(ext)s'),
-        'merge_output_format': 'mp4',
-        'quiet': True,
-        'writethumbnail': False,
-    }
-    
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'video_download')
-            filename = os.path.join(output_folder, f"{clean_filename(title)}.mp4")
-            
-            return {
-                'success': True,
-                'filename': filename,
-                'title': title,
-                'format': 'MP4',
-                'quality': quality,
-                'url': url
-            }
-    except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'url': url
-        }
+    Video and audio streams are fetched at the same time and merged with
+    stream copy where possible (converter.download_video). Pass info (from
+    extract_info) to download without extracting again.
+    """
+    result = download_video(url, output_folder, quality, info, get_ffmpeg_location())
+    if result.get('success'):
+        result['format'] = 'MP4'
+        result['quality'] = quality
+    return result
 
-def download_youtube(url, output_folder="downloads", format_type='mp3', quality='192'):
+def download_youtube(url, output_folder="downloads", format_type='mp3', quality='192', info=None,
+                     normalize=None):
     """
-    Unified download function for MP3 or MP4
+    Unified download function for audio (any transcoder.AUDIO_CODECS entry) or MP4
+    
+    normalize applies EBU R128 loudness normalization to audio outputs.
+    format_type may also name several outputs ('mp3:192,mp3:320,mp4:720p'
+    or a list of such specs, see converter.parse_outputs); they are all
+    produced from one download, with one entry per output in the result's
+    'outputs'.
     """
-    if format_type.lower() == 'mp3':
-        return youtube_to_mp3(url, output_folder, quality)
-    elif format_type.lower() == 'mp4':
-        return youtube_to_mp4(url, output_folder, quality)
+    # Transient failures (429, 5xx, dropped connections) are retried with
+    # backoff by the download stage itself
+    if not isinstance(format_type, str) or ',' in format_type:
+        try:
+            specs = parse_outputs(format_type)
+        except ValueError as e:
+            return {'success': False, 'error': str(e), 'url': url}
+        result = convert_outputs(url, specs, output_folder, info, get_ffmpeg_location())
+        result['format'] = ' + '.join(output_label(spec).upper() for spec in specs)
+        result['quality'] = f'{len(specs)} outputs'
+        return result
+    format_type = format_type.lower()
+    if format_type in transcoder.AUDIO_CODECS:
+        return youtube_to_audio(url, output_folder, format_type, quality, info, normalize)
+    elif format_type == 'mp4':
+        return youtube_to_mp4(url, output_folder, quality, info)
     else:
         return {
             'success': False,
@@ -171,30 +133,104 @@ def download_youtube(url, output_folder="downloads", format_type='mp3', quality=
             'url': url
         }
 
-def batch_download(urls, output_folder="downloads", format_type='mp3', quality='192'):
+def batch_download(urls, output_folder="downloads", format_type='mp3', quality='192',
+                   download_workers=DEFAULT_DOWNLOAD_WORKERS, transcode_workers=None, ordered=True,
+                   force=False, journal=None, normalize=None):
     """
-    Simple batch download
+    Concurrent batch download
+    
+    Audio jobs download on one pool and encode on a CPU-sized FFmpeg pool.
+    MP4 jobs run entirely on the download pool: the video and audio streams
+    are fetched in parallel and merged with stream copy where possible
+    (converter.download_video).
+    Items already in the download archive are skipped unless force=True.
+    Playlist and channel URLs are expanded into their videos lazily.
+    With a journal (job_journal.JobJournal) every item's state change is
+    appended as it happens, so the batch can be resumed.
+    
+    Returns a converter.BatchTotals; the per-job results are only kept in
+    the journal.
     """
-    results = []
-    total = len(urls)
+    totals = BatchTotals()
+    total = None
+    if isinstance(urls, (list, tuple)) and not any(map(is_collection_url, urls)):
+        total = len(urls)
+    engine = BatchEngine(download_workers, transcode_workers, ordered)
+    archive = download_archive.get_archive()
+    format_type = format_type.lower()
+    audio = format_type in transcoder.AUDIO_CODECS
+    normalize = transcoder.normalize_mode(normalize) if audio else None
+    archive_format = download_archive.archive_format(format_type, normalize)
+    ffmpeg_dir = get_ffmpeg_location()
     
-    for i, url in enumerate(urls, 1):
-        try:
-            print(f"[{i}/{total}] Processing: {url[:50]}...")
-            result = download_youtube(url, output_folder, format_type, quality)
-            results.append(result)
-            
-            if isinstance(result, dict) and result.get('success'):
-                print(f"    ✓ Success: {result.get('title', 'Unknown')} ({result.get('format', 'Unknown')})")
-            else:
-                error_msg = result.get('error', 'Unknown error') if isinstance(result, dict) else str(result)
-                print(f"    ✗ Failed: {error_msg}")
-                
-        except Exception as e:
-            results.append({'success': False, 'error': str(e), 'url': url})
-            print(f"    ✗ Error: {e}")
+    def archived(url):
+        if force:
+            return None
+        return download_archive.archived_result(archive, url, archive_format, quality)
+    
+    def finished(result):
+        result = tracing.finish(download_archive.record_result(archive, result, archive_format, quality))
+        if journal is not None:
+            journal.record_result(result)
+        return result
+    
+    def download(url):
+        result = archived(url)
+        if result:
+            return finished(result)
+        if journal is not None:
+            journal.record(url, job_journal.DOWNLOADING)
+        if audio:
+            result = download_audio(url, output_folder, ffmpeg_dir, codec=format_type)
+            # A successful download still has its transcode stage to run
+            return result if result.get('success') else finished(result)
+        return finished(download_youtube(url, output_folder, format_type, quality))
+    
+    def expanded(url, count):
+        print(f"Listed {count} new videos from {url}")
+        if journal is not None:
+            journal.record(url, job_journal.EXPANDED)
     
-    return results
+    # Playlists and channels are listed lazily while the first videos convert
+    videos = playlist.expand_urls(urls, on_expanded=expanded)
+    if audio:
+        jobs = engine.run(
+            videos,
+            download,
+            lambda download: finished(_audio_result(
+                transcode_audio(download, quality, codec=format_type, normalize=normalize),
+                format_type, quality)))
+    else:
+        jobs = engine.run(videos, download)
+    
+    tracker = progress.get_tracker()
+    for i, result in enumerate(jobs, 1):
+        totals.add(result if isinstance(result, dict) else {})
+        if isinstance(result, dict):
+            tracker.finish(result.get('url'), result.get('success'), result.get('error'))
+        
+        position = f"{i}/{total}" if total else str(i)
+        if isinstance(result, dict) and result.get('skipped'):
+            print(f"[{position}] ↷ Already converted: {result.get('title', 'Unknown')}")
+        elif isinstance(result, dict) and result.get('success'):
+            print(f"[{position}] ✓ Success: {result.get('title', 'Unknown')} ({result.get('format', 'Unknown')})")
+        else:
+            error_msg = result.get('error', 'Unknown error') if isinstance(result, dict) else str(result)
+            print(f"[{position}] ✗ Failed: {error_msg}")
+    
+    return totals
+
+def _audio_result(result, codec, quality):
+    """Tag a converter result with the format/quality keys the GUI shows"""
+    if result.get('success'):
+        result['format'] = codec.upper()
+        if transcoder.codec_info(codec).get('lossless'):
+            result['quality'] = 'lossless'
+        else:
+            result['quality'] = 'source' if quality == 'best' else f'{quality}kbps'
+        if result.get('loudness'):
+            result['quality'] += f", normalized from {result['loudness']['input_i']:.1f} LUFS"
+    return result
 
 # ===========================================
 # BATCH PROCESSOR FUNCTIONS
@@ -226,13 +262,14 @@ def save_batch_results(results, output_file="batch_results.json"):
         return False
 
 def validate_urls(urls):
-    """Validate YouTube URLs"""
+    """Validate YouTube URLs (playlist and channel URLs included), canonicalizing valid ones"""
     validated = []
     invalid = []
     
     for url in urls:
-        if 'youtube.com/watch' in url or 'youtu.be/' in url:
-            validated.append(url)
+        canonical = canonical_url(url)
+        if canonical is not None:
+            validated.append(canonical)
         else:
             invalid.append(url)
     
@@ -242,6 +279,12 @@ def validate_urls(urls):
 # GUI APPLICATION
 # ===========================================
 
+PROGRESS_REFRESH_MS = 250
+MAX_PROGRESS_ROWS = 8
+LOG_DRAIN_MS = 100
+LOG_BATCH_SIZE = 500
+MAX_LOG_LINES = 2000
+
 class YouTubeConverter:
     def __init__(self):
         self.window = tk.Tk()
@@ -254,8 +297,13 @@ class YouTubeConverter:
         self.format_type = tk.StringVar(value="mp3")
         self.mp3_quality = tk.StringVar(value="192")
         self.mp4_quality = tk.StringVar(value="720p")
+        self.normalize = tk.BooleanVar(value=False)
+        self.extra_outputs = tk.StringVar(value="")
         self.downloading = False
         
+        # Workers push log records here; the Tk loop drains them in batches
+        self.log_queue = queue.Queue()
+        
         self.setup_ui()
         
     def setup_ui(self):
@@ -290,7 +338,8 @@ class YouTubeConverter:
         format_frame = tk.Frame(left_panel, bg="#f0f0f0")
         format_frame.pack(fill="x", pady=(0, 10))
         
-        formats = [("MP3 Audio", "mp3"), ("MP4 Video", "mp4")]
+        formats = [("MP3 Audio", "mp3"), ("M4A Audio (AAC)", "m4a"), ("Opus Audio", "opus"),
+                   ("FLAC Audio (Lossless)", "flac"), ("MP4 Video", "mp4")]
         for text, value in formats:
             rb = tk.Radiobutton(format_frame, text=text, variable=self.format_type, 
                                value=value, bg="#f0f0f0", command=self.update_quality_options)
@@ -303,6 +352,16 @@ class YouTubeConverter:
         # Initialize quality options
         self.update_quality_options()
         
+        # EBU R128 loudness normalization for audio formats (single and batch)
+        tk.Checkbutton(left_panel, text="Normalize loudness (EBU R128, audio only)",
+                      variable=self.normalize, bg="#f0f0f0").pack(anchor="w", pady=(0, 10))
+        
+        # More outputs from the same download, e.g. "mp3:320, mp4:720p"
+        tk.Label(left_panel, text="Also produce (optional, e.g. mp3:320, mp4:720p):", bg="#f0f0f0",
+                font=("Arial", 10)).pack(anchor="w", pady=(0, 5))
+        tk.Entry(left_panel, textvariable=self.extra_outputs,
+                font=("Arial", 10)).pack(fill="x", pady=(0, 10))
+        
         # Output folder
         tk.Label(left_panel, text="Save to:", bg="#f0f0f0", 
                 font=("Arial", 10)).pack(anchor="w", pady=(0, 5))
@@ -334,7 +393,7 @@ class YouTubeConverter:
         
         self.batch_format = tk.StringVar(value="mp3")
         for text, value in formats:
-            rb = tk.Radiobutton(batch_format_frame, text=text, variable=self.batch_format, 
+            rb = tk.Radiobutton(batch_format_frame, text=text.split(" ")[0], variable=self.batch_format, 
                                value=value, bg="#f0f0f0")
             rb.pack(side="left", padx=(0, 10))
         
@@ -355,6 +414,16 @@ class YouTubeConverter:
         tk.Button(button_frame, text="Clear All", command=self.clear_urls,
                  bg="#f44336", fg="white").pack(side="left")
         
+        # Re-convert items the download archive already has
+        self.force_redownload = tk.BooleanVar(value=False)
+        tk.Checkbutton(right_panel, text="Re-download already converted videos",
+                      variable=self.force_redownload, bg="#f0f0f0").pack(anchor="w")
+        
+        # Sample the batch and write a profile report / flame graph input
+        self.profile_batch = tk.BooleanVar(value=False)
+        tk.Checkbutton(right_panel, text="Profile this batch (where the time goes)",
+                      variable=self.profile_batch, bg="#f0f0f0").pack(anchor="w")
+        
         # Batch download button
         tk.Button(right_panel, text="Download All", command=self.start_batch_download,
                  bg="#9C27B0", fg="white", font=("Arial", 11, "bold"),
@@ -376,6 +445,41 @@ class YouTubeConverter:
         self.progress = ttk.Progressbar(self.window, mode="indeterminate")
         self.progress.pack(fill="x", padx=20, pady=(0, 10))
         
+        # Per-item progress (one determinate bar per active job)
+        self.jobs_frame = tk.Frame(self.window, bg="#f0f0f0")
+        self.jobs_frame.pack(fill="x", padx=20, pady=(0, 10))
+        self.job_rows = {}
+        
+    def refresh_job_progress(self):
+        """Redraw per-job bars from the progress tracker (runs on the Tk loop)"""
+        tracker = progress.get_tracker()
+        tracker.prune(older_than=3)
+        jobs = {job['job']: job for job in tracker.snapshot()}
+        
+        for job_id in list(self.job_rows):
+            if job_id not in jobs:
+                self.job_rows.pop(job_id)[0].destroy()
+        
+        for job_id, job in list(jobs.items())[:MAX_PROGRESS_ROWS]:
+            if job_id not in self.job_rows:
+                row = tk.Frame(self.jobs_frame, bg="#f0f0f0")
+                row.pack(fill="x")
+                label = tk.Label(row, anchor="w", bg="#f0f0f0", font=("Courier", 8))
+                label.pack(fill="x")
+                bar = ttk.Progressbar(row, mode="determinate", maximum=100)
+                bar.pack(fill="x")
+                self.job_rows[job_id] = (row, label, bar)
+            
+            row, label, bar = self.job_rows[job_id]
+            label.config(text=progress.format_line(job, 110),
+                        fg="red" if job['stalled'] or job['phase'] == progress.FAILED else "black")
+            if job['phase'] == progress.FINISHED:
+                bar['value'] = 100
+            elif job['percent'] is not None:
+                bar['value'] = job['percent']
+        
+        self.window.after(PROGRESS_REFRESH_MS, self.refresh_job_progress)
+        
     def update_quality_options(self):
         """Update quality options based on selected format"""
         # Clear previous quality options
@@ -385,8 +489,13 @@ class YouTubeConverter:
         tk.Label(self.quality_frame, text="Quality:", bg="#f0f0f0", 
                 font=("Arial", 10)).pack(anchor="w", pady=(0, 5))
         
-        if self.format_type.get() == "mp3":
-            # MP3 quality options
+        format_type = self.format_type.get()
+        if format_type in transcoder.AUDIO_CODECS and transcoder.codec_info(format_type).get('lossless'):
+            tk.Label(self.quality_frame, text="Lossless (no bitrate to choose)",
+                    bg="#f0f0f0").pack(anchor="w")
+        
+        elif format_type in transcoder.AUDIO_CODECS:
+            # Lossy audio bitrates (shared by MP3, M4A and Opus)
             mp3_qualities = [("128 kbps (Small)", "128"), 
                            ("192 kbps (Recommended)", "192"), 
                            ("320 kbps (High Quality)", "320")]
@@ -410,13 +519,35 @@ class YouTubeConverter:
                 rb.pack(anchor="w")
     
     def log_message(self, message, color="black"):
-        """Add message to status text"""
-        self.status_text.config(state="normal")
+        """Queue a message for the status text (safe to call from any thread)"""
         timestamp = time.strftime("%H:%M:%S")
-        self.status_text.insert("end", f"[{timestamp}] {message}\n", color)
-        self.status_text.see("end")
-        self.status_text.config(state="disabled")
-        self.window.update()
+        self.log_queue.put((f"[{timestamp}] {message}\n", color))
+    
+    def drain_log_queue(self):
+        """Write queued log lines in one batch (runs on the Tk loop via after())"""
+        records = []
+        try:
+            while len(records) < LOG_BATCH_SIZE:
+                records.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if records:
+            self.status_text.config(state="normal")
+            for line, color in records:
+                self.status_text.insert("end", line, color)
+            
+            # Cap scrollback so long runs keep memory and redraw cost bounded
+            lines = int(self.status_text.index("end-1c").split(".")[0])
+            if lines > MAX_LOG_LINES:
+                self.status_text.delete("1.0", f"{lines - MAX_LOG_LINES + 1}.0")
+            
+            self.status_text.see("end")
+            self.status_text.config(state="disabled")
+        
+        # Come back sooner if there is a backlog
+        delay = 0 if not self.log_queue.empty() else LOG_DRAIN_MS
+        self.window.after(delay, self.drain_log_queue)
     
     def select_folder(self):
         folder = filedialog.askdirectory()
@@ -457,45 +588,60 @@ class YouTubeConverter:
             else:
                 return
         
+        # Read Tk variables here on the main thread; workers must not touch widgets
+        format_type = self.format_type.get()
+        audio = format_type in transcoder.AUDIO_CODECS
+        quality = self.mp3_quality.get() if audio else self.mp4_quality.get()
+        normalize = audio and self.normalize.get()
+        
+        extra = self.extra_outputs.get().strip()
+        if extra:
+            # The selected format plus the extra outputs, all from one download
+            selected = f"{format_type}:{quality}" + (":normalize" if normalize else "")
+            try:
+                format_type = [output_label(spec) for spec in parse_outputs(f"{selected},{extra}")]
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid extra outputs: {e}")
+                return
+        
         self.downloading = True
         self.progress.start()
         
         # Start download in separate thread
-        thread = threading.Thread(target=self.download_single, args=(url,))
+        thread = threading.Thread(target=self.download_single,
+                                  args=(url, format_type, quality, self.output_folder.get(), normalize))
         thread.daemon = True
         thread.start()
     
-    def download_single(self, url):
+    def download_single(self, url, format_type, quality, output_folder, normalize=False):
         try:
-            format_type = self.format_type.get()
-            self.log_message(f"Starting {format_type.upper()} download: {url[:50]}...", "blue")
-            
-            # Get video info first
-            info = get_video_info(url)
+            label = format_type.upper() if isinstance(format_type, str) else ', '.join(format_type).upper()
+            self.log_message(f"Starting {label} download: {url[:50]}...", "blue")
             
-            # Check if info is valid
-            if isinstance(info, dict) and 'error' in info:
-                self.log_message(f"Error: {info['error']}", "red")
+            # Extract once; the download reuses this info dict
+            try:
+                info, extractions = lookup_info(url)
+            except Exception as e:
+                self.log_message(f"Error: {e}", "red")
                 return
             
-            if isinstance(info, dict):
-                title = info.get('title', 'Unknown Video')
-                self.log_message(f"Title: {title}", "green")
-            
-            # Get quality based on format
-            if format_type == "mp3":
-                quality = self.mp3_quality.get()
-            else:
-                quality = self.mp4_quality.get()
+            title = summarize_info(info).get('title', 'Unknown Video')
+            self.log_message(f"Title: {title}", "green")
             
             # Download
             result = download_youtube(
                 url, 
-                self.output_folder.get(), 
+                output_folder, 
                 format_type,
-                quality
+                quality,
+                info,
+                normalize
             )
             
+            if isinstance(result, dict):
+                progress.get_tracker().finish(url, result.get('success'), result.get('error'))
+                tracing.finish(result)
+            
             # SAFELY check result
             if isinstance(result, dict) and result.get('success'):
                 filename = result.get('filename', 'Unknown')
@@ -505,6 +651,16 @@ class YouTubeConverter:
                 
                 self.log_message(f"✓ {format_used} download complete: {filename}", "green")
                 self.log_message(f"  Quality: {quality_used}", "green")
+                for output in result.get('outputs', []):
+                    state = "already converted" if output.get('skipped') else output.get('filename')
+                    self.log_message(f"  {output['output']}: {state}", "green")
+                self.log_message(f"  Extractions: {extractions + result.get('extractions', 0)}", "blue")
+                if result.get('timings'):
+                    phases = ', '.join(f"{phase} {seconds:.1f}s" for phase, seconds in result['timings'].items())
+                    self.log_message(f"  Timings: {phases} (merge: {result.get('merge')})", "blue")
+                if result.get('stages'):
+                    stages = ', '.join(f"{name} {stage['seconds']:.1f}s" for name, stage in result['stages'].items())
+                    self.log_message(f"  Stages: {stages}", "blue")
                 
                 # Show success message
                 self.window.after(0, lambda: messagebox.showinfo(
@@ -536,70 +692,102 @@ class YouTubeConverter:
             messagebox.showerror("Error", "Please enter some URLs")
             return
         
-        urls = [url.strip() for url in urls_text.split('\n') if url.strip()]
-        
-        # Validate URLs
-        valid_urls, invalid_urls = validate_urls(urls)
-        
-        if invalid_urls:
-            msg = f"Found {len(invalid_urls)} invalid URLs:\n"
-            msg += "\n".join(invalid_urls[:5])
-            if len(invalid_urls) > 5:
-                msg += f"\n...and {len(invalid_urls)-5} more"
+        # Validate URLs in one pass without building a list; the batch
+        # thread walks the text again and feeds URLs to the workers lazily
+        valid_count = 0
+        invalid_count = 0
+        invalid_urls = []
+        for url in iter_urls(urls_text):
+            if canonical_url(url) is not None:
+                valid_count += 1
+                continue
+            invalid_count += 1
+            if len(invalid_urls) < 5:
+                invalid_urls.append(url)
+        
+        if invalid_count:
+            msg = f"Found {invalid_count} invalid URLs:\n"
+            msg += "\n".join(invalid_urls)
+            if invalid_count > 5:
+                msg += f"\n...and {invalid_count-5} more"
             
             if not messagebox.askyesno("Warning", 
                                       f"{msg}\n\nContinue with valid URLs only?"):
                 return
-            urls = valid_urls
         
-        if not urls:
+        if not valid_count:
             messagebox.showerror("Error", "No valid URLs to download")
             return
         
         # Get batch quality based on format
         format_type = self.batch_format.get()
-        if format_type == "mp3":
+        audio = format_type in transcoder.AUDIO_CODECS
+        if audio:
             quality = self.mp3_quality.get()
         else:
             quality = self.mp4_quality.get()
+        normalize = audio and self.normalize.get()
         
         self.downloading = True
         self.progress.start()
         
         # Start batch download in thread
-        thread = threading.Thread(target=self.download_batch, args=(urls, format_type, quality))
+        thread = threading.Thread(target=self.download_batch,
+                                  args=(urls_text, valid_count, format_type, quality,
+                                        self.output_folder.get(), self.force_redownload.get(),
+                                        normalize, self.profile_batch.get()))
         thread.daemon = True
         thread.start()
     
-    def download_batch(self, urls, format_type, quality):
+    def download_batch(self, urls_text, count, format_type, quality, output_folder, force,
+                       normalize=False, profile=False):
         try:
-            self.log_message(f"Starting batch download of {len(urls)} URLs as {format_type.upper()}...", "blue")
+            self.log_message(f"Starting batch download of {count} URLs as {format_type.upper()}...", "blue")
             
-            results = batch_download(
-                urls, 
-                self.output_folder.get(), 
-                format_type,
-                quality
-            )
+            sources_before = source_cache.get_cache().stats()
             
-            # Count successes
-            successes = 0
-            for r in results:
-                if isinstance(r, dict) and r.get('success'):
-                    successes += 1
-            failures = len(urls) - successes
+            # URLs are journaled as the workers pull them
+            journal = job_journal.JobJournal.create(
+                (), {'output': output_folder, 'format': format_type, 'quality': quality, 'force': force,
+                     'normalize': normalize})
+            self.log_message(f"Journal: {journal.path}", "blue")
+            # Unticked, $YT2MP3_PROFILE_RATE still profiles a share of batches
+            sampler = profiler.Profiler().start() if profiler.should_profile(profile or None) else None
+            try:
+                totals = batch_download(
+                    journal.feed(ingest_urls(iter_urls(urls_text))), 
+                    output_folder, 
+                    format_type,
+                    quality,
+                    force=force,
+                    journal=journal,
+                    normalize=normalize
+                )
+                
+                # batch_results.json is generated from the journal
+                journal.write_results("batch_results.json")
+            finally:
+                if sampler:
+                    sampler.stop()
+                journal.close()
             
-            self.log_message(f"Batch complete: {successes} succeeded, {failures} failed", 
-                           "green" if failures == 0 else "orange")
+            self.log_message(f"Batch complete: {totals.succeeded} succeeded, {totals.failed} failed", 
+                           "green" if totals.failed == 0 else "orange")
+            if totals.skipped:
+                self.log_message(f"Skipped {totals.skipped} already converted (archive hits)", "blue")
+            self.log_message(f"Source cache: {source_cache.summary(sources_before)}", "blue")
+            self.log_message(f"Stages: {tracing.format_summary(totals.stages.summary())}", "blue")
+            if sampler:
+                report, folded = sampler.write()
+                self.log_message(f"Profile: {sampler.summary()}", "blue")
+                self.log_message(f"Profile saved to {report} (flame graph input: {folded})", "blue")
             
-            # Save results
-            save_batch_results(results, "batch_results.json")
             self.log_message("Results saved to batch_results.json", "blue")
             
             # Show summary
             self.window.after(0, lambda: messagebox.showinfo(
                 "Batch Complete",
-                f"Downloaded {successes} of {len(urls)} files\n"
+                f"Downloaded {totals.succeeded} of {totals.jobs} files\n"
                 f"Format: {format_type.upper()}\n"
                 f"Quality: {quality}\n\n"
                 f"Results saved to: batch_results.json"
@@ -620,15 +808,15 @@ class YouTubeConverter:
         self.status_text.tag_config("orange", foreground="orange")
         
         # Check for FFmpeg
-        try:
-            import subprocess
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        if transcoder.ffmpeg_available():
             self.log_message("✓ FFmpeg found", "green")
-        except:
+        else:
             self.log_message("⚠ FFmpeg not found in PATH", "orange")
             self.log_message("MP3 conversion requires FFmpeg", "orange")
             self.log_message("MP4 downloads will still work", "blue")
         
+        self.drain_log_queue()
+        self.refresh_job_progress()
         self.window.mainloop()
 
 def main():
@@ -637,4 +825,5 @@ def main():
     app.run()
 
 if __name__ == "__main__":
+    install_requirements()
     main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+metadata_cache.py - Persistent video metadata cache (SQLite) with TTL and LRU eviction
+
+Entries are keyed by the 11-character YouTube video ID, so the same video
+reached through different URL shapes shares one entry. A small in-memory LRU
+sits in front of the database so repeated lookups in one process skip both
+SQLite and JSON decoding.
+
+The format URLs inside a yt-dlp info dict are signed and expire after a few
+hours, which is why the default TTL is short. Lookups that only need the
+title/duration can use a longer TTL.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MEMORY_ENTRIES = 256
+CACHE_DIR_ENV = 'YT2MP3_CACHE_DIR'
+
+
+def default_cache_dir():
+    """Cache folder: $YT2MP3_CACHE_DIR or ~/.yt2mp3_cache"""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.yt2mp3_cache')
+
+
+class MetadataCache:
+    """
+    Video ID -> info dict cache
+
+    Args:
+        path: SQLite file (default: <cache dir>/metadata.sqlite3)
+        ttl: Seconds an entry stays valid
+        max_entries: LRU cap on stored entries
+        memory_entries: Entries also kept decoded in memory
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'metadata.sqlite3')
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            ' video_id TEXT PRIMARY KEY,'
+            ' info TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_lru ON metadata (last_access)')
+
+    def get(self, video_id):
+        """Return the cached info dict, or None on miss/expiry"""
+        if not video_id:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(video_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(video_id)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return entry[1]
+
+            row = self._db.execute(
+                'SELECT info, stored_at FROM metadata WHERE video_id = ?', (video_id,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            info, stored_at = row
+            if now - stored_at > self.ttl:
+                self._db.execute('DELETE FROM metadata WHERE video_id = ?', (video_id,))
+                self._memory.pop(video_id, None)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._db.execute('UPDATE metadata SET last_access = ? WHERE video_id = ?', (now, video_id))
+            info = json.loads(info)
+            self._remember(video_id, stored_at, info)
+            self._stats['hits'] += 1
+            return info
+
+    def put(self, video_id, info):
+        """Store an info dict (must be JSON serializable)"""
+        if not video_id or not info:
+            return
+        now = time.time()
+        payload = json.dumps(info, ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO metadata (video_id, info, stored_at, last_access) VALUES (?, ?, ?, ?)',
+                (video_id, payload, now, now))
+            self._remember(video_id, now, info)
+            self._evict()
+
+    def invalidate(self, video_id):
+        """Drop one entry"""
+        with self._lock:
+            self._memory.pop(video_id, None)
+            self._db.execute('DELETE FROM metadata WHERE video_id = ?', (video_id,))
+
+    def clear(self):
+        """Drop everything and reset statistics"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute('DELETE FROM metadata')
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def stats(self):
+        """Hit/miss counters plus current entry count"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _remember(self, video_id, stored_at, info):
+        self._memory[video_id] = (stored_at, info)
+        self._memory.move_to_end(video_id)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        count = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        evicted = [row[0] for row in self._db.execute(
+            'SELECT video_id FROM metadata ORDER BY last_access LIMIT ?', (overflow,))]
+        self._db.executemany('DELETE FROM metadata WHERE video_id = ?', [(v,) for v in evicted])
+        for video_id in evicted:
+            self._memory.pop(video_id, None)
+        self._stats['evictions'] += len(evicted)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide cache, created on first use"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache()
+        return _default_cache
+
+
+def configure(cache_dir=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+              memory_entries=DEFAULT_MEMORY_ENTRIES):
+    """
+    Replace the shared cache, e.g. to point it at a temp directory
+
+    Returns:
+        MetadataCache: the new shared cache
+    """
+    global _default_cache
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'metadata.sqlite3')
+    cache = MetadataCache(path, ttl, max_entries, memory_entries)
+    with _default_lock:
+        old, _default_cache = _default_cache, cache
+    if old is not None:
+        old.close()
+    return cache
@@ -0,0 +1,133 @@
+"""
+playlist.py - Lazy expansion of playlist and channel URLs into video URLs
+
+Entries are enumerated flat (no per-video extraction) and page by page.
+yt-dlp's YouTube tab extractor fetches the next page only when the previous
+one has been consumed, so a batch starts converting as soon as the first
+page arrives. Memory stays flat apart from the compact set of video IDs
+already seen (batch_processor.VideoIdSet), which is how duplicates within
+a batch are dropped.
+
+Entries are listed a page at a time with a pooled session leased, and the
+lease is released before they are handed on, so a slow consumer (a batch
+waiting for free slots) doesn't keep a session from other work.
+"""
+from itertools import islice
+
+from batch_processor import VideoIdSet, extract_video_id, is_collection_url
+
+import session_pool
+import url_parser
+
+# Flat, lazy enumeration: entries are bare {'id', 'url', 'title'} dicts
+FLAT_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True,
+}
+
+# Channel -> tabs -> playlists nesting is shallow; this guards against loops
+MAX_DEPTH = 3
+PAGE_SIZE = 100  # entries listed per session lease; YouTube's continuation page size
+
+
+def iter_entries(url, depth=0):
+    """
+    Yield video URLs in a playlist or channel as they are enumerated
+
+    Nested collections (a channel's Videos/Shorts/Live tabs, a channel's
+    playlists) are expanded in turn. Entries that are neither a video nor a
+    collection URL (e.g. a bare channel ID) are skipped.
+    """
+    for page in _pages(url):
+        for entry in page:
+            if not entry:
+                continue
+            entry_url = entry.get('url') or entry.get('webpage_url') or ''
+            if entry.get('_type') == 'playlist' or (
+                    entry.get('_type') == 'url' and is_collection_url(entry_url)):
+                if depth < MAX_DEPTH and entry_url:
+                    yield from iter_entries(entry_url, depth + 1)
+                continue
+            video_id = extract_video_id(entry_url)
+            if video_id is None and url_parser.is_video_id(entry.get('id')):
+                video_id = entry['id']
+            if video_id:
+                yield url_parser.WATCH_URL.format(video_id)
+
+
+def _pages(url):
+    """
+    Yield lists of up to PAGE_SIZE raw entries of a collection
+
+    Each list is taken from the extractor's lazy generator with the session
+    it is bound to leased, and yielded once the lease is released.
+    """
+    pool = session_pool.get_pool()
+    ydl = entries = None
+    listed = 0
+    while True:
+        with pool.session('playlist', FLAT_OPTS, instance=ydl) as session:
+            if session is not ydl:
+                # First page, or the session was closed between pages: list
+                # again on this one and skip what was already handed on
+                ydl = session
+                # process=False keeps 'entries' as the extractor's own generator
+                info = ydl.extract_info(url, download=False, process=False)
+                entries = iter((info or {}).get('entries') or [])
+                for _ in islice(entries, listed):
+                    pass
+            page = list(islice(entries, PAGE_SIZE))
+        if page:
+            listed += len(page)
+            yield page
+        if len(page) < PAGE_SIZE:
+            return
+
+
+def expand_urls(urls, seen=None, on_expanded=None, on_error=None):
+    """
+    Yield video URLs from a mix of video, playlist and channel URLs, lazily
+
+    Videos already yielded (by video ID, whatever the URL form) are skipped.
+
+    Args:
+        urls: Iterable of URLs
+        seen: Optional set (or VideoIdSet) of video IDs to treat as already
+              queued; updated
+        on_expanded: Optional callable(collection_url, entry_count) once a
+                     collection has been fully enumerated
+        on_error: Optional callable(collection_url, error) if enumeration
+                  fails; by default the error is printed and skipped
+    """
+    seen = VideoIdSet() if seen is None else seen
+    for url in urls:
+        parsed = url_parser.parse(url)
+        if parsed is None or parsed.kind == url_parser.VIDEO:
+            video_id = parsed.video_id if parsed is not None else None
+            if video_id is None or video_id not in seen:
+                if video_id is not None:
+                    seen.add(video_id)
+                yield url
+            continue
+
+        count = 0
+        try:
+            for entry_url in iter_entries(url):
+                video_id = extract_video_id(entry_url)
+                if video_id is not None:
+                    if video_id in seen:
+                        continue
+                    seen.add(video_id)
+                count += 1
+                yield entry_url
+        except Exception as e:
+            if on_error is not None:
+                on_error(url, e)
+            else:
+                print(f"✗ Could not list {url}: {e}")
+            continue
+        if on_expanded is not None:
+            on_expanded(url, count)
@@ -0,0 +1,303 @@
+"""
+profiler.py - Opt-in sampling profiler for batch runs
+
+A background thread samples the Python stack of every thread interval
+seconds apart (sys._current_frames; nothing is instrumented, so the
+overhead stays around a percent at the default 100 Hz). Each sample is
+tagged with:
+
+    group   the thread's pool: download, transcode, av-fetch, segment, ...
+    stage   the tracing span open on that thread (extract, download, ...)
+    state   what the leaf frame is doing: 'python' (running Python code, or
+            C code it called), 'network' (blocked in a socket/SSL read),
+            'ffmpeg' (waiting on an FFmpeg child), 'throttle' (retry
+            backoff / rate limiting); idle pool threads are not counted
+
+Every FFmpeg run made while a profiler is active reports its wall time and,
+on POSIX, its own user/system CPU time (transcoder; os.wait4).
+
+write() saves a JSON report (time per state and stage, hottest functions,
+FFmpeg calls) and the samples as collapsed stacks ('a;b;c count' lines)
+that flamegraph.pl, speedscope or inferno render as a flame graph.
+
+$YT2MP3_PROFILE_RATE profiles that fraction of batch runs (e.g. 0.05) when
+the caller doesn't decide, so it can stay on in production.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import tracing
+from metadata_cache import default_cache_dir
+
+DEFAULT_INTERVAL = 0.01  # seconds between samples
+RATE_ENV = 'YT2MP3_PROFILE_RATE'  # fraction of runs profiled when not asked explicitly
+TOP_FUNCTIONS = 25
+SLOWEST_PROCESSES = 10
+
+PYTHON = 'python'
+NETWORK = 'network'
+FFMPEG = 'ffmpeg'
+THROTTLE = 'throttle'
+IDLE = 'idle'
+
+# Leaf frame (file basename, function) -> state; None matches any function.
+# Leaf frames in _PASS_THROUGH are skipped first, so subprocess.communicate's
+# select() is classified by subprocess.py, not selectors.py.
+_LEAF_STATES = {
+    ('socket.py', None): NETWORK,
+    ('ssl.py', None): NETWORK,
+    ('subprocess.py', None): FFMPEG,
+    ('transcoder.py', '_run_piped'): FFMPEG,  # blocked writing to a piped ffmpeg
+    ('transcoder.py', 'run_ffmpeg'): FFMPEG,  # reading ffmpeg's stderr until it exits
+    ('transcoder.py', '_reap'): FFMPEG,  # os.wait4 on ffmpeg
+    ('retry_policy.py', None): THROTTLE,
+    ('threading.py', None): IDLE,
+    ('queue.py', None): IDLE,
+    ('thread.py', '_worker'): IDLE,  # concurrent.futures worker waiting for work
+    ('socketserver.py', None): IDLE,
+}
+_PASS_THROUGH = ('selectors.py',)
+_IDLE_THREADS = ('profiler', 'ffmpeg-stderr')
+
+
+def default_rate():
+    """$YT2MP3_PROFILE_RATE as a fraction of runs, or 0"""
+    try:
+        return min(1.0, max(0.0, float(os.environ[RATE_ENV])))
+    except (KeyError, ValueError):
+        return 0.0
+
+
+def should_profile(profile=None):
+    """
+    Decide whether a run is profiled
+
+    Args:
+        profile: True/False, a fraction of runs (0.05 = one in twenty), or
+                 None for $YT2MP3_PROFILE_RATE
+    """
+    if profile is None:
+        profile = default_rate()
+    if isinstance(profile, bool):
+        return profile
+    return random.random() < float(profile)
+
+
+class Profiler:
+    """
+    Statistical profiler for one run
+
+    Args:
+        interval: Seconds between samples
+        directory: Where write() saves reports (default: <cache dir>/profiles)
+
+    Usage:
+        with Profiler() as profiler:
+            run_batch()
+        report_path, folded_path = profiler.write()
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, directory=None):
+        self.interval = interval
+        self.directory = directory or os.path.join(default_cache_dir(), 'profiles')
+        self.started = None
+        self.seconds = None
+        self._stacks = Counter()  # (group, stage, state, code objects root first) -> samples
+        self._ticks = 0
+        self._idle = 0
+        self._processes = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._clock = None
+
+    def start(self):
+        global _active
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name='profiler', daemon=True)
+        self._thread.start()
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.seconds is None and self._clock is not None:
+            self.seconds = time.perf_counter() - self._clock
+        return self
+
+    def record_process(self, command, wall, rusage=None):
+        """One finished FFmpeg run; rusage from os.wait4, or None where unavailable"""
+        span = tracing.current_span()
+        entry = {
+            'output': os.path.basename(str(command[-1])) if command else None,
+            'stage': span.name if span else None,
+            'job': span.job if span else None,
+            'wall_seconds': round(wall, 3),
+            'user_seconds': round(rusage.ru_utime, 3) if rusage else None,
+            'system_seconds': round(rusage.ru_stime, 3) if rusage else None,
+        }
+        with self._lock:
+            self._processes.append(entry)
+
+    def report(self):
+        """The run's profile as a dict (see module docstring)"""
+        with self._lock:
+            stacks = Counter(self._stacks)
+            processes = list(self._processes)
+            ticks, idle = self._ticks, self._idle
+        elapsed = self.seconds if self.seconds is not None else time.perf_counter() - self._clock
+        # Seconds one sample stands for (the sampler wakes a little late)
+        per_sample = elapsed / ticks if ticks else self.interval
+
+        states = Counter()
+        stages = {}
+        own = Counter()
+        total = Counter()
+        for (group, stage, state, codes), count in stacks.items():
+            states[state] += count
+            per_stage = stages.setdefault(stage or 'none', Counter())
+            per_stage[state] += count
+            if codes and state == PYTHON:
+                own[_label(codes[-1])] += count
+            for label in {_label(code) for code in codes}:
+                total[label] += count
+
+        cpu = [p for p in processes if p['user_seconds'] is not None]
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(elapsed, 3),
+            'interval': self.interval,
+            'samples': sum(stacks.values()),
+            'idle_samples': idle,
+            'thread_seconds': {state: round(count * per_sample, 2) for state, count in states.most_common()},
+            'stages': {stage: {state: round(count * per_sample, 2) for state, count in counts.most_common()}
+                       for stage, counts in sorted(stages.items())},
+            'top_functions': [
+                {'function': label, 'self_seconds': round(count * per_sample, 2),
+                 'total_seconds': round(total[label] * per_sample, 2)}
+                for label, count in own.most_common(TOP_FUNCTIONS)],
+            'ffmpeg': {
+                'calls': len(processes),
+                'wall_seconds': round(sum(p['wall_seconds'] for p in processes), 3),
+                'cpu_seconds': round(sum(p['user_seconds'] + p['system_seconds'] for p in cpu), 3)
+                               if cpu else None,
+                'slowest': sorted(processes, key=lambda p: p['wall_seconds'], reverse=True)[:SLOWEST_PROCESSES],
+            },
+        }
+
+    def summary(self, report=None):
+        """'python 12.3s, network 40.1s, ffmpeg 20.0s of thread time; FFmpeg: 40 calls, 18.2s CPU'"""
+        report = report or self.report()
+        states = ', '.join(f'{state} {seconds:.1f}s' for state, seconds in report['thread_seconds'].items())
+        ffmpeg = report['ffmpeg']
+        text = f"{states or 'no samples'} of thread time; FFmpeg: {ffmpeg['calls']} calls"
+        if ffmpeg['cpu_seconds'] is not None:
+            text += f", {ffmpeg['cpu_seconds']:.1f}s CPU"
+        return text
+
+    def collapsed(self):
+        """Samples as collapsed stack lines: 'group;[stage];frame;...;frame[;[state]] count'"""
+        with self._lock:
+            stacks = Counter(self._stacks)
+        folded = Counter()
+        for (group, stage, state, codes), count in stacks.items():
+            frames = [group] + ([f'[{stage}]'] if stage else []) + [_label(code) for code in codes]
+            if state != PYTHON:
+                frames.append(f'[{state}]')
+            folded[';'.join(frame.replace(';', ':').replace(' ', '_') for frame in frames)] += count
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(folded.items()))
+
+    def write(self, directory=None):
+        """
+        Save report() and collapsed() as profile-<time>-<pid>.json / .folded
+
+        Returns:
+            tuple: (report path, collapsed stacks path)
+        """
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, time.strftime('profile-%Y%m%d-%H%M%S',
+                                                     time.localtime(self.started)) + f'-{os.getpid()}')
+        folded = f'{stem}.folded'
+        with open(folded, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        report = dict(self.report(), collapsed_stacks=folded)
+        with open(f'{stem}.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return f'{stem}.json', folded
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stages = tracing.active_stages()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            samples = []
+            idle = 0
+            for ident, frame in frames.items():
+                name = names.get(ident, '')
+                if ident == own or name in _IDLE_THREADS:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                state = _state(codes)
+                if state == IDLE:
+                    idle += 1
+                    continue
+                codes.reverse()
+                samples.append((_group(name), stages.get(ident), state, tuple(codes)))
+            with self._lock:
+                self._ticks += 1
+                self._idle += idle
+                self._stacks.update(samples)
+
+
+def _state(codes):
+    """State of a stack given leaf first"""
+    for code in codes:
+        filename = os.path.basename(code.co_filename)
+        if filename in _PASS_THROUGH:
+            continue
+        return _LEAF_STATES.get((filename, code.co_name)) or _LEAF_STATES.get((filename, None)) or PYTHON
+    return IDLE
+
+
+_POOL_SUFFIX = re.compile(r'[_-]\d+$')
+
+
+def _group(name):
+    """'download_3' -> 'download', 'job-worker-1' -> 'job-worker'"""
+    return _POOL_SUFFIX.sub('', name) or 'thread'
+
+
+def _label(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+_active = None
+
+
+def active():
+    """The profiler of the run in progress, or None"""
+    return _active
@@ -0,0 +1,318 @@
+"""
+progress.py - Per-job download/transcode progress collected from yt-dlp hooks
+
+Workers bind the job they are running to their thread (progress.bind). The
+module-level download_hook/postprocessor_hook are registered on every
+YoutubeDL instance and route yt-dlp's callbacks to that job, so pooled
+instances don't need per-job hook setup.
+
+The tracker keeps the latest state per job (phase, bytes, speed, ETA).
+Subscribers are notified at most every min_interval seconds per job, plus
+immediately on every phase change. Front-ends either subscribe or poll
+snapshot().
+"""
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+QUEUED = 'queued'
+EXTRACTING = 'extracting'
+DOWNLOADING = 'downloading'
+TRANSCODING = 'transcoding'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+DEFAULT_MIN_INTERVAL = 0.25  # seconds between notifications per job
+DEFAULT_STALL_AFTER = 20  # seconds without new bytes before a job counts as stalled
+
+
+class ProgressTracker:
+    """
+    Latest progress state per job
+
+    Args:
+        min_interval: Minimum seconds between subscriber notifications per job
+        stall_after: Seconds without progress before a job is flagged stalled
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, stall_after=DEFAULT_STALL_AFTER):
+        self.min_interval = min_interval
+        self.stall_after = stall_after
+        self._jobs = {}
+        self._notified = {}
+        self._ended = OrderedDict()  # finished/failed jobs by last update, oldest first, for prune()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """callback(job_state_dict) is called from worker threads"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job's state and notify subscribers (throttled)"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._jobs.get(job_id)
+            if state is None:
+                state = self._jobs[job_id] = {
+                    'job': job_id, 'phase': QUEUED, 'title': None,
+                    'downloaded_bytes': 0, 'total_bytes': None, 'speed': None, 'eta': None,
+                    'started': now, 'progressed': now, 'updated': now,
+                }
+            phase_changed = 'phase' in fields and fields['phase'] != state['phase']
+            if fields.get('downloaded_bytes', 0) != state['downloaded_bytes'] or phase_changed:
+                state['progressed'] = now
+            state.update(fields)
+            state['updated'] = now
+            self._ended.pop(job_id, None)
+            if state['phase'] in (FINISHED, FAILED):
+                self._ended[job_id] = now
+
+            last = self._notified.get(job_id, 0)
+            if not phase_changed and now - last < self.min_interval:
+                return
+            self._notified[job_id] = now
+            snapshot = self._describe(state, now)
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception:
+                pass
+
+    def set_phase(self, job_id, phase, **fields):
+        self.update(job_id, phase=phase, **fields)
+
+    def finish(self, job_id, success=True, error=None):
+        self.update(job_id, phase=FINISHED if success else FAILED, error=error, speed=None, eta=None)
+
+    def remove(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._notified.pop(job_id, None)
+            self._ended.pop(job_id, None)
+
+    def prune(self, older_than=5):
+        """Drop finished/failed jobs that ended more than older_than seconds ago"""
+        now = time.monotonic()
+        with self._lock:
+            # Called after every finished job, so only the expired ones are visited
+            while self._ended:
+                job_id, ended = next(iter(self._ended.items()))
+                if now - ended <= older_than:
+                    break
+                del self._ended[job_id]
+                del self._jobs[job_id]
+                self._notified.pop(job_id, None)
+
+    def snapshot(self):
+        """List of job state dicts, oldest first, each with 'percent' and 'stalled'"""
+        now = time.monotonic()
+        with self._lock:
+            return [self._describe(state, now) for state in self._jobs.values()]
+
+    def stalled(self):
+        """Jobs that have made no progress for stall_after seconds"""
+        return [job for job in self.snapshot() if job['stalled']]
+
+    def _describe(self, state, now):
+        job = dict(state)
+        total = job.get('total_bytes')
+        job['percent'] = min(100.0, 100.0 * job['downloaded_bytes'] / total) if total else None
+        job['stalled'] = (job['phase'] in (EXTRACTING, DOWNLOADING)
+                          and now - job['progressed'] > self.stall_after)
+        return job
+
+
+_default_tracker = ProgressTracker()
+_bound = threading.local()
+
+
+def get_tracker():
+    """Shared process-wide tracker"""
+    return _default_tracker
+
+
+@contextmanager
+def bind(job_id, tracker=None, title=None):
+    """Route yt-dlp hook calls made on this thread to job_id"""
+    tracker = tracker or _default_tracker
+    previous = getattr(_bound, 'job', None)
+    _bound.job = (tracker, job_id)
+    if title:
+        tracker.update(job_id, title=title)
+    try:
+        yield tracker
+    finally:
+        _bound.job = previous
+
+
+def current():
+    """(tracker, job_id) bound to this thread, or (None, None)"""
+    return getattr(_bound, 'job', None) or (None, None)
+
+
+def report(phase=None, **fields):
+    """Update the job bound to this thread, if any"""
+    tracker, job_id = current()
+    if tracker is None:
+        return
+    if phase:
+        fields['phase'] = phase
+    tracker.update(job_id, **fields)
+
+
+def download_hook(d):
+    """yt-dlp progress_hooks entry"""
+    tracker, job_id = current()
+    if tracker is None:
+        return
+    info = d.get('info_dict') or {}
+    fields = {
+        'downloaded_bytes': d.get('downloaded_bytes') or 0,
+        'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+        'speed': d.get('speed'),
+        'eta': d.get('eta'),
+    }
+    if info.get('title'):
+        fields['title'] = info['title']
+    status = d.get('status')
+    if status == 'downloading':
+        tracker.update(job_id, phase=DOWNLOADING, **fields)
+    elif status == 'finished':
+        fields['downloaded_bytes'] = fields['total_bytes'] or fields['downloaded_bytes']
+        tracker.update(job_id, **fields)
+    elif status == 'error':
+        tracker.update(job_id, phase=FAILED)
+
+
+def postprocessor_hook(d):
+    """yt-dlp postprocessor_hooks entry"""
+    tracker, job_id = current()
+    if tracker is None:
+        return
+    if d.get('status') == 'started':
+        tracker.update(job_id, phase=TRANSCODING, postprocessor=d.get('postprocessor'))
+
+
+def count_bytes(chunks, job_id, total_bytes=None, tracker=None):
+    """Wrap a byte iterator (streaming downloads) so it reports progress"""
+    tracker = tracker or _default_tracker
+    received = 0
+    started = time.monotonic()
+    tracker.update(job_id, phase=DOWNLOADING, total_bytes=total_bytes)
+    for chunk in chunks:
+        received += len(chunk)
+        elapsed = time.monotonic() - started
+        speed = received / elapsed if elapsed > 0 else None
+        eta = (total_bytes - received) / speed if speed and total_bytes else None
+        tracker.update(job_id, downloaded_bytes=received, speed=speed, eta=eta)
+        yield chunk
+
+
+def format_bytes(n):
+    if n is None:
+        return '?'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n < 1024 or unit == 'GiB':
+            return f'{n:.0f}{unit}' if unit == 'B' else f'{n:.1f}{unit}'
+        n /= 1024
+
+
+def format_line(job, width=100):
+    """One compact status line for a job"""
+    if job['percent'] is not None:
+        amount = f"{job['percent']:5.1f}% of {format_bytes(job['total_bytes'])}"
+    else:
+        amount = format_bytes(job['downloaded_bytes'])
+    speed = f"{format_bytes(job['speed'])}/s" if job.get('speed') else ''
+    eta = f"ETA {int(job['eta'])}s" if job.get('eta') is not None else ''
+    flag = ' STALLED' if job['stalled'] else ''
+    name = job.get('title') or job['job']
+    status = f"{job['phase']:<11} {amount:>18} {speed:>11} {eta:>9}{flag}"
+    room = max(10, width - len(status) - 2)
+    if len(name) > room:
+        name = name[:room - 1] + '…'
+    return f"{name:<{room}}  {status}"
+
+
+class CliProgressDisplay:
+    """
+    Redraw a block of per-job progress lines on a terminal
+
+    Other output should go through print() on this object so it appears
+    above the progress block instead of being overwritten.
+    """
+
+    def __init__(self, tracker=None, stream=None, interval=0.5, max_lines=10):
+        self.tracker = tracker or _default_tracker
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.max_lines = max_lines
+        self._drawn = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def supported(stream=None):
+        stream = stream or sys.stdout
+        return hasattr(stream, 'isatty') and stream.isatty()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._clear()
+            self.stream.flush()
+
+    def print(self, line):
+        with self._lock:
+            self._clear()
+            self.stream.write(f'{line}\n')
+            self._draw()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.tracker.prune()
+            with self._lock:
+                self._clear()
+                self._draw()
+
+    def _clear(self):
+        if self._drawn:
+            self.stream.write(f'\x1b[{self._drawn}F\x1b[J')
+            self._drawn = 0
+
+    def _draw(self):
+        width = shutil.get_terminal_size((100, 20)).columns - 1
+        jobs = [j for j in self.tracker.snapshot() if j['phase'] not in (FINISHED, FAILED)]
+        lines = [format_line(job, width) for job in jobs[:self.max_lines]]
+        if len(jobs) > self.max_lines:
+            lines.append(f'... and {len(jobs) - self.max_lines} more active')
+        for line in lines:
+            self.stream.write(f'{line}\n')
+        self._drawn = len(lines)
+        self.stream.flush()
@@ -0,0 +1,378 @@
+"""
+retry_policy.py - Retry transient failures and rate-limit requests per host
+
+Errors are classified as rate limited (HTTP 429), transient (timeouts,
+dropped connections, 408/5xx) or permanent (everything else, e.g. an
+unavailable or private video). Transient and rate-limited failures are
+retried with exponential backoff and full jitter. Every request first takes
+a token from its host's bucket.
+
+Buckets are adaptive. A 429 halves the host's rate (down to a floor), and
+each success adds a little back, up to the configured rate.
+
+Each failure is retried at one layer only. call() binds one Attempts to
+the thread running a stage. urlopen and the streaming/segmented readers
+count into it and retry their own requests. A request they give up on marks
+it exhausted, and call() doesn't run the stage again on top. Tokens are
+taken just before real network requests: by urlopen, or by throttled()
+around yt-dlp's requests. Those two also slow down or reward the bucket of
+the host the request went to; call() never touches a bucket.
+
+The download stages return {'success': False, 'error': str} instead of
+raising, so classification works on exceptions and on those error strings.
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import tracing
+
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+TRANSIENT_STATUS = (408, 425, 500, 502, 503, 504)
+
+# Substrings of yt-dlp / socket error messages that mean "try again"
+TRANSIENT_MESSAGES = (
+    'timed out', 'timeout', 'connection reset', 'connection aborted', 'connection refused',
+    'remote end closed', 'incompleteread', 'temporary failure in name resolution',
+    'network is unreachable', 'broken pipe', 'unable to download video data',
+)
+_STATUS_PATTERN = re.compile(r'HTTP Error (\d{3})')
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 1.0  # seconds
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_RATE = 2.0  # requests per second per host
+DEFAULT_BURST = 4
+MIN_RATE = 0.1
+
+
+def status_of(error):
+    """HTTP status code carried by an exception or error message, or None"""
+    import urllib.error
+
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code
+    status = getattr(getattr(error, 'response', None), 'status', None)
+    if status:
+        return status
+    match = _STATUS_PATTERN.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify(error):
+    """RATE_LIMITED, TRANSIENT or PERMANENT for an exception or error message"""
+    # Imported here to keep them off the headless start-up path
+    import socket
+    import urllib.error
+
+    status = status_of(error)
+    if status == 429:
+        return RATE_LIMITED
+    if status in TRANSIENT_STATUS:
+        return TRANSIENT
+    if status is not None:
+        return PERMANENT
+    if isinstance(error, (socket.timeout, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if isinstance(error, urllib.error.URLError):
+        return TRANSIENT
+    message = str(error).lower()
+    if any(fragment in message for fragment in TRANSIENT_MESSAGES):
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_after_of(error):
+    """Seconds from a Retry-After header on an HTTPError, or None"""
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def host_of(url):
+    return urlsplit(url or '').hostname or ''
+
+
+class RetryPolicy:
+    """
+    How often and how long to wait between attempts
+
+    Args:
+        max_attempts: Attempts in total, including the first
+        base_delay: Backoff for the first retry; doubles per attempt
+        max_delay: Cap on a single backoff
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        """attempt is the number of attempts made so far"""
+        return kind != PERMANENT and attempt < self.max_attempts
+
+    def delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than a server's Retry-After"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            backoff = max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate backs off on 429s and recovers on success
+
+    Args:
+        rate: Tokens per second at full speed
+        burst: Bucket size
+        min_rate: Floor the rate never drops below
+        recovery: Fraction of the full rate added back per success
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=MIN_RATE, recovery=0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self):
+        """A 429: halve the rate and drop any saved-up burst"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def reward(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class HostLimiter:
+    """One adaptive TokenBucket per host"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def rates(self):
+        """Current rate per host"""
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+class Attempts:
+    """
+    Retry/throttle counters for one job, merged into its result
+
+    exhausted is set once a failure has been given up on (out of attempts,
+    or permanent), telling an outer layer not to retry it again.
+    """
+
+    def __init__(self):
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.rate_limited = 0
+        self.exhausted = False
+
+    def wait_for(self, bucket):
+        waited = bucket.acquire()
+        if waited > 0:
+            self.throttled += 1
+            self.throttle_seconds += waited
+
+    def failed(self, kind, attempt, policy, bucket=None):
+        """
+        Count a failed attempt of the given kind; True if it should be retried
+
+        A 429 also slows down bucket.
+        """
+        if kind == RATE_LIMITED:
+            self.rate_limited += 1
+            if bucket is not None:
+                bucket.penalize()
+        if policy.should_retry(kind, attempt):
+            self.retries += 1
+            return True
+        self.exhausted = True
+        return False
+
+    def annotate(self, result):
+        result['retries'] = self.retries
+        result['throttled'] = self.throttled
+        result['throttle_seconds'] = round(self.throttle_seconds, 3)
+        result['rate_limited'] = self.rate_limited
+        return result
+
+
+_bound = threading.local()
+
+
+@contextmanager
+def bind(attempts):
+    """Make attempts this thread's current_attempts() (call() does this around a stage)"""
+    previous = getattr(_bound, 'attempts', None)
+    _bound.attempts = attempts
+    try:
+        yield attempts
+    finally:
+        _bound.attempts = previous
+
+
+def current_attempts():
+    """Attempts bound to this thread, for work handed to other threads; or None"""
+    return getattr(_bound, 'attempts', None)
+
+
+@contextmanager
+def throttled(url, attempts=None):
+    """
+    Rate-limit a request urlopen doesn't make (yt-dlp's) by url's host
+
+    Takes a token before the block; a 429 raised from it slows the host
+    down, and a clean exit rewards it.
+    """
+    attempts = attempts or current_attempts() or Attempts()
+    bucket = get_limiter().bucket(host_of(url))
+    attempts.wait_for(bucket)
+    try:
+        yield
+    except Exception as e:
+        if classify(e) == RATE_LIMITED:
+            bucket.penalize()
+        raise
+    bucket.reward()
+
+
+def call(fn, url, *args, policy=None, **kwargs):
+    """
+    Run a stage function fn(url, ...) that returns a result dict, retrying
+    transient failures
+
+    The result gets 'retries', 'throttled', 'throttle_seconds' and
+    'rate_limited' counts. A failure also gets 'error_kind'. Numeric
+    'extractions' counts are summed over the attempts. Stage spans opened
+    by fn carry the attempt number (tracing.attempt).
+
+    Failures the HTTP layer already retried and gave up on (urlopen,
+    streaming, segmented) are not retried again here. No token is taken
+    and no bucket adjusted here either: url is the page, while the failing
+    request may have gone to a media host. Requests do that themselves
+    (urlopen, throttled).
+    """
+    policy = policy or get_policy()
+    attempts = Attempts()
+    extractions = 0
+    attempt = 0
+    while True:
+        attempt += 1
+        attempts.exhausted = False
+        try:
+            with tracing.attempt(attempt), bind(attempts):
+                result = fn(url, *args, **kwargs)
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'url': url}
+            error = e
+        else:
+            error = result.get('error')
+        extractions += result.get('extractions') or 0
+
+        if result.get('success'):
+            break
+        kind = classify(error)
+        result['error_kind'] = kind
+        if attempts.exhausted or not attempts.failed(kind, attempt, policy):
+            break
+        time.sleep(policy.delay(attempt, retry_after_of(error)))
+
+    if 'extractions' in result:
+        result['extractions'] = extractions
+    return attempts.annotate(result)
+
+
+def urlopen(request, timeout=30, policy=None, limiter=None, attempts=None):
+    """
+    urllib.request.urlopen with the host's rate limit and retries
+
+    Args:
+        request: urllib.request.Request
+        attempts: Attempts to count into (default: current_attempts(), if any)
+    """
+    import urllib.request
+
+    policy = policy or get_policy()
+    bucket = (limiter or get_limiter()).bucket(host_of(request.full_url))
+    attempts = attempts or current_attempts() or Attempts()
+    attempt = 0
+    while True:
+        attempt += 1
+        attempts.wait_for(bucket)
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except Exception as e:
+            if not attempts.failed(classify(e), attempt, policy, bucket):
+                raise
+            time.sleep(policy.delay(attempt, retry_after_of(e)))
+            continue
+        bucket.reward()
+        return response
+
+
+_default_policy = RetryPolicy()
+_default_limiter = HostLimiter()
+
+
+def get_policy():
+    return _default_policy
+
+
+def get_limiter():
+    return _default_limiter
+
+
+def configure(max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+              max_delay=DEFAULT_MAX_DELAY, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    """Replace the shared policy and per-host limiter"""
+    global _default_policy, _default_limiter
+    _default_policy = RetryPolicy(max_attempts, base_delay, max_delay)
+    _default_limiter = HostLimiter(rate, burst)
+    return _default_policy, _default_limiter
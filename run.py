@@ -24,10 +24,10 @@ def check_dependencies():
     
     # Check for FFmpeg
     print("\nChecking for FFmpeg...")
-    try:
-        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+    from transcoder import ffmpeg_available
+    if ffmpeg_available():
         print("✓ FFmpeg is available")
-    except:
+    else:
         print("⚠ FFmpeg not found in PATH")
         print("\nFFmpeg is required for audio conversion.")
         print("Download from: https://ffmpeg.org/download.html")
@@ -0,0 +1,341 @@
+"""
+segmented.py - Download one HTTP resource over several connections at once
+
+The file is split into contiguous byte ranges. Each range is fetched on its
+own connection and written at its offset in a preallocated .part file, which
+is renamed into place once every range has arrived. Servers that throttle
+per connection then deliver roughly connections x the single-stream rate.
+
+A server that doesn't answer a Range probe with 206, or a file too small to
+be worth splitting, is fetched as a single stream instead.
+
+Interrupted downloads resume. A segmented download keeps a map of how far
+each range got next to the .part file (path + SEGMENTS_SUFFIX), and only
+the missing bytes are fetched again. A .part without a map holds a plain
+prefix (a single stream, or yt-dlp's own .part under the same name): the
+single stream continues it with Range: bytes=<size>-, and a segmented
+download counts it as already received.
+"""
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import retry_policy
+import streaming
+
+DEFAULT_CONNECTIONS = 4
+MIN_SEGMENT = 1024 * 1024  # don't split below this many bytes per connection
+READ_SIZE = 64 * 1024
+SEGMENTS_SUFFIX = '.segments.json'  # per-segment progress of an unfinished segmented download
+SAVE_INTERVAL = 1.0  # seconds between writes of the segment map
+
+
+class SegmentError(Exception):
+    """Raised when a segment can't be fetched or the file comes out short"""
+
+
+def can_segment(fmt):
+    """True if a selected yt-dlp format is a single plain HTTP(S) file"""
+    if not fmt or fmt.get('requested_formats') or fmt.get('fragments') or not fmt.get('url'):
+        return False
+    return fmt.get('protocol', 'https') in streaming.STREAMABLE_PROTOCOLS
+
+
+def probe(url, headers=None, timeout=30, attempts=None):
+    """
+    Ask for the first byte to learn the size and whether ranges work
+
+    Returns:
+        tuple: (total bytes or None, True if the server honours Range)
+    """
+    import urllib.request
+
+    request = urllib.request.Request(url, headers=dict(headers or {}, Range='bytes=0-0'))
+    with retry_policy.urlopen(request, timeout, attempts=attempts) as resp:
+        if resp.status == 206:
+            return streaming._content_range_total(resp.headers.get('Content-Range')), True
+        length = resp.headers.get('Content-Length')
+        return (int(length) if length and length.isdigit() else None), False
+
+
+def split(total, connections, min_segment=MIN_SEGMENT):
+    """Inclusive (start, end) ranges covering total bytes"""
+    count = max(1, min(connections, math.ceil(total / min_segment)))
+    size = math.ceil(total / count)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def download(url, path, headers=None, connections=DEFAULT_CONNECTIONS, chunk_size=None,
+             min_segment=MIN_SEGMENT, timeout=30, on_progress=None, attempts=None):
+    """
+    Download url to path, in parallel ranges when the server allows it
+
+    An interrupted earlier attempt's .part file is continued rather than
+    fetched again (see the module docstring).
+
+    Args:
+        url: Media URL
+        path: Output file; written as path + '.part' and renamed when complete
+        headers: Request headers (the format's http_headers)
+        connections: Maximum parallel connections
+        chunk_size: Largest single Range request; segments bigger than this
+                    are fetched as several sequential requests
+        min_segment: Smallest range worth its own connection
+        on_progress: Optional callable(downloaded_bytes, total_bytes)
+        attempts: retry_policy.Attempts collecting retry counts (default: the
+                  one bound to this thread, if any)
+
+    Returns:
+        dict: {'bytes': int, 'connections': ranges the file was split into,
+               'segmented': bool, 'resumed': bytes already on disk from an
+               earlier attempt}
+    """
+    attempts = attempts or retry_policy.current_attempts() or retry_policy.Attempts()
+    part = path + '.part'
+    total, ranges = (None, False)
+    if connections > 1:
+        total, ranges = probe(url, headers, timeout, attempts)
+
+    if not ranges or not total or total < 2 * min_segment:
+        return _download_stream(url, path, headers, chunk_size, timeout, on_progress, attempts, total)
+
+    fresh = [[start, end, start] for start, end in split(total, connections, min_segment)]
+    segments = _Segments(path + SEGMENTS_SUFFIX, total, _resume_layout(part, path + SEGMENTS_SUFFIX,
+                                                                      total, fresh) or fresh)
+    resumed = segments.received()
+    # The map is written before the file is preallocated, so a sparse .part
+    # never exists without one
+    segments.save()
+    with open(part, 'r+b' if resumed else 'wb') as f:
+        f.truncate(total)
+
+    pending = segments.pending()
+    counter = _Counter(total, on_progress, resumed)
+    failed = threading.Event()
+
+    def fetch(index):
+        try:
+            _fetch_range(url, headers, segments, index, part, chunk_size, timeout, counter, failed, attempts)
+        except BaseException:
+            failed.set()
+            raise
+
+    if pending:
+        # Whatever arrived stays in .part and the map for the next attempt
+        with ThreadPoolExecutor(len(pending), thread_name_prefix='segment') as pool:
+            for future in [pool.submit(fetch, index) for index in pending]:
+                future.result()
+
+    if counter.received != total:
+        segments.discard()
+        os.remove(part)
+        raise SegmentError(f'Expected {total} bytes, received {counter.received}')
+    os.replace(part, path)
+    segments.discard()
+    return {'bytes': total, 'connections': len(segments.layout), 'segmented': True, 'resumed': resumed}
+
+
+def _download_stream(url, path, headers, chunk_size, timeout, on_progress, attempts, total=None):
+    """Single-stream download, appending to a .part prefix left by an earlier attempt"""
+    import urllib.error
+
+    part = path + '.part'
+    offset = 0
+    if not discard_preallocated(path) and os.path.exists(part):
+        offset = os.path.getsize(part)
+        if total is not None and offset >= total:
+            offset = 0
+
+    received = offset
+    try:
+        with open(part, 'ab' if offset else 'wb') as f:
+            for block in streaming.iter_http(url, headers, chunk_size, timeout, attempts=attempts, start=offset):
+                f.write(block)
+                received += len(block)
+                if on_progress:
+                    on_progress(received, total)
+    except urllib.error.HTTPError as e:
+        # 416: nothing at or after offset, so the .part may already be whole
+        if e.code != 416 or not offset:
+            raise
+        if streaming._content_range_total(e.headers.get('Content-Range')) != offset:
+            os.remove(part)
+            raise
+        attempts.exhausted = False
+    os.replace(part, path)
+    return {'bytes': received, 'connections': 1, 'segmented': False, 'resumed': offset}
+
+
+def discard_preallocated(path):
+    """
+    Remove an unfinished segmented download of path; True if there was one
+
+    Its .part is preallocated to full size with holes, so it can't be
+    continued as a prefix (by the single stream or yt-dlp's continuedl).
+    """
+    if not os.path.exists(path + SEGMENTS_SUFFIX):
+        return False
+    _remove(path + '.part')
+    _remove(path + SEGMENTS_SUFFIX)
+    return True
+
+
+def _resume_layout(part, map_path, total, fresh):
+    """
+    Segments [start, end, next byte] to continue an earlier attempt from, or None
+
+    Args:
+        fresh: The layout a new download would use, for a .part without a map
+    """
+    if os.path.exists(map_path):
+        layout = _Segments.load(map_path, total)
+        if layout is not None and os.path.exists(part) and os.path.getsize(part) == total:
+            return layout
+        _remove(map_path)
+        return None
+    size = os.path.getsize(part) if os.path.exists(part) else 0
+    if not 0 < size < total:
+        # Nothing to continue, or a whole-size file whose contents are unknown
+        return None
+    return [[start, end, min(end + 1, max(start, size))] for start, end, _ in fresh]
+
+
+class _Segments:
+    """
+    How far each range of a segmented download got, saved as JSON next to the .part file
+
+    A position is only recorded once the bytes before it were flushed to the
+    .part file, so a resumed download never skips bytes that aren't there.
+    """
+
+    def __init__(self, path, total, layout):
+        self.path = path
+        self.total = total
+        self.layout = [list(segment) for segment in layout]  # [start, end, next byte]
+        self._saved = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path, total):
+        """Layout from a saved map for a file of this size, or None if unusable"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            layout = [[int(start), int(end), int(position)] for start, end, position in saved['segments']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        expected = 0
+        for start, end, position in layout:
+            if start != expected or not start <= position <= end + 1:
+                return None
+            expected = end + 1
+        return layout if saved.get('total') == total and expected == total else None
+
+    def received(self):
+        with self._lock:
+            return sum(position - start for start, _, position in self.layout)
+
+    def pending(self):
+        """Indexes of ranges with bytes still missing"""
+        with self._lock:
+            return [i for i, (_, end, position) in enumerate(self.layout) if position <= end]
+
+    def span(self, index):
+        """(next missing byte, last byte) of one range"""
+        with self._lock:
+            _, end, position = self.layout[index]
+            return position, end
+
+    def update(self, index, position, force=False):
+        """Record a range's progress; saved at most every SAVE_INTERVAL unless force"""
+        with self._lock:
+            self.layout[index][2] = position
+            if force or time.monotonic() - self._saved >= SAVE_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def discard(self):
+        _remove(self.path)
+
+    def _save(self):
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'total': self.total, 'segments': self.layout}, f)
+        os.replace(temp, self.path)
+        self._saved = time.monotonic()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _Counter:
+    """Bytes received across all segments, reported through on_progress"""
+
+    def __init__(self, total, on_progress, received=0):
+        self.total = total
+        self.received = received
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.received += n
+            received = self.received
+        if self._on_progress:
+            self._on_progress(received, self.total)
+
+
+def _fetch_range(url, headers, segments, index, part, chunk_size, timeout, counter, failed, attempts):
+    """Fetch the missing part of one range into its place in the .part file"""
+    import urllib.request
+
+    policy = retry_policy.get_policy()
+    position, end = segments.span(index)
+    failures = 0
+    with open(part, 'r+b') as f:
+        try:
+            while position <= end:
+                if failed.is_set():
+                    return
+                stop = min(end, position + chunk_size - 1) if chunk_size else end
+                request = urllib.request.Request(
+                    url, headers=dict(headers or {}, Range=f'bytes={position}-{stop}'))
+                with retry_policy.urlopen(request, timeout, attempts=attempts) as resp:
+                    if resp.status != 206:
+                        raise SegmentError(f'Server ignored Range for bytes {position}-{stop}')
+                    f.seek(position)
+                    try:
+                        for block in iter(lambda: resp.read(min(READ_SIZE, stop - position + 1)), b''):
+                            f.write(block)
+                            f.flush()
+                            position += len(block)
+                            counter.add(len(block))
+                            segments.update(index, position)
+                            if position > stop or failed.is_set():
+                                break
+                    except Exception as e:
+                        # Dropped mid-range: the loop resumes at the next missing byte
+                        failures += 1
+                        if not attempts.failed(retry_policy.classify(e), failures, policy):
+                            raise
+                        time.sleep(policy.delay(failures))
+                        continue
+                if position <= stop and not failed.is_set():
+                    # Connection closed early without an error; ask for the rest
+                    failures += 1
+                    if failures >= policy.max_attempts:
+                        attempts.exhausted = True
+                        raise SegmentError(f'Range {position}-{stop} kept ending early')
+        finally:
+            f.flush()
+            segments.update(index, position, force=True)
@@ -0,0 +1,161 @@
+"""
+session_pool.py - Reusable yt_dlp.YoutubeDL instances keyed by option profile
+
+Building a YoutubeDL reloads extractor state and opens new HTTP connections
+on first use. The pool keeps warm instances per profile ('info', 'audio',
+'mp3@192', 'mp4@720p', ...) and leases each one to a single thread at a time,
+so its connections are reused across jobs. An instance is closed and
+replaced after max_uses leases so long runs don't accumulate state.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_MAX_USES = 50
+DEFAULT_MAX_IDLE = 8
+
+
+def youtube_dl_factory(opts):
+    """Default factory: a real yt_dlp.YoutubeDL"""
+    import yt_dlp
+    return yt_dlp.YoutubeDL(opts)
+
+
+def set_outtmpl(ydl, template):
+    """Point a leased instance at a per-job output template"""
+    if isinstance(ydl.params.get('outtmpl'), dict):
+        ydl.params['outtmpl']['default'] = template
+    else:
+        ydl.params['outtmpl'] = template
+
+
+class SessionPool:
+    """
+    Pool of YoutubeDL-like sessions
+
+    Args:
+        factory: Callable(opts) -> session (default: yt_dlp.YoutubeDL)
+        max_uses: Leases before an instance is recycled
+        max_idle: Idle instances kept per profile
+    """
+
+    def __init__(self, factory=None, max_uses=DEFAULT_MAX_USES, max_idle=DEFAULT_MAX_IDLE):
+        self.factory = factory or youtube_dl_factory
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+        self._closed = False
+        self._stats = {'created': 0, 'reused': 0, 'recycled': 0}
+
+    @contextmanager
+    def session(self, profile, opts, instance=None):
+        """
+        Lease a session for one job
+
+        Every call with the same profile name must pass the same opts; the
+        profile name is the only thing instances are matched on. Per-job
+        settings such as the output template can be changed on the leased
+        instance (see set_outtmpl) and must be set again on every lease.
+
+        Args:
+            instance: A session this job leased before under profile, to
+                      lease that one again (e.g. to continue a lazy generator
+                      bound to it); waits while another thread holds it. Not
+                      counted as another use. If it has been closed since, a
+                      different session is leased, so compare the result.
+        """
+        session = self._acquire(profile, opts, instance)
+        try:
+            yield session
+        finally:
+            self._release(profile, session)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(v) for v in self._idle.values())
+        return stats
+
+    def close(self):
+        """Close every idle session; leased ones are closed on release"""
+        with self._lock:
+            self._closed = True
+            idle = [s for sessions in self._idle.values() for s in sessions]
+            self._idle.clear()
+            for session in idle:
+                self._uses.pop(id(session), None)
+            self._returned.notify_all()
+        for session in idle:
+            self._close_session(session)
+
+    def _acquire(self, profile, opts, instance=None):
+        with self._lock:
+            # _uses only tracks sessions that haven't been closed
+            while instance is not None and id(instance) in self._uses:
+                idle = self._idle[profile]
+                for i, session in enumerate(idle):
+                    if session is instance:
+                        del idle[i]
+                        self._stats['reused'] += 1
+                        return instance
+                self._returned.wait()
+            if self._idle[profile]:
+                session = self._idle[profile].pop()
+                self._uses[id(session)] += 1
+                self._stats['reused'] += 1
+                return session
+        session = self.factory(dict(opts))
+        with self._lock:
+            self._uses[id(session)] = 1
+            self._stats['created'] += 1
+        return session
+
+    def _release(self, profile, session):
+        with self._lock:
+            worn_out = self._uses.get(id(session), 0) >= self.max_uses
+            keep = not self._closed and not worn_out and len(self._idle[profile]) < self.max_idle
+            self._returned.notify_all()
+            if keep:
+                self._idle[profile].append(session)
+                return
+            self._uses.pop(id(session), None)
+            if worn_out:
+                self._stats['recycled'] += 1
+        self._close_session(session)
+
+    @staticmethod
+    def _close_session(session):
+        try:
+            if hasattr(session, 'close'):
+                session.close()
+            elif hasattr(session, '__exit__'):
+                session.__exit__(None, None, None)
+        except Exception:
+            pass
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared process-wide pool, created on first use"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+        return _default_pool
+
+
+def configure(factory=None, max_uses=DEFAULT_MAX_USES, max_idle=DEFAULT_MAX_IDLE):
+    """Replace the shared pool (e.g. with a stand-in factory for benchmarks)"""
+    global _default_pool
+    pool = SessionPool(factory, max_uses, max_idle)
+    with _default_lock:
+        old, _default_pool = _default_pool, pool
+    if old is not None:
+        old.close()
+    return pool
@@ -0,0 +1,318 @@
+"""
+source_cache.py - Bounded on-disk cache of downloaded source media
+
+Downloaded streams (the audio an MP3 is encoded from, the video and audio
+an MP4 is merged from) are kept under (video ID, yt-dlp format ID) instead
+of being deleted after the conversion. A later job for the same video, at
+another quality or in another format, reads them from local disk instead
+of the network. When no stream with the exact format ID is cached, cached
+audio of the video with at least the same bitrate can stand in for an audio
+download.
+
+Files live in <cache dir>/sources with an SQLite index. The least recently
+used entries are evicted once the total size goes over max_bytes. Entries
+handed out by acquire/put are pinned until release, so an encode never
+loses its input to eviction. The directory is shared by every process (the
+GUI, cli batch, serve, workers), so a pin holds the file open with a shared
+flock, and eviction skips files it can't lock exclusively. On Windows an
+open file can't be deleted, which pins it just the same.
+$YT2MP3_SOURCE_CACHE_MB sets the size (0 turns the cache off).
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from metadata_cache import default_cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: see the module docstring
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+SIZE_ENV = 'YT2MP3_SOURCE_CACHE_MB'  # overrides DEFAULT_MAX_BYTES; 0 disables the cache
+
+
+def default_max_bytes():
+    """$YT2MP3_SOURCE_CACHE_MB in bytes, or DEFAULT_MAX_BYTES"""
+    try:
+        return int(float(os.environ[SIZE_ENV]) * 1024 ** 2)
+    except (KeyError, ValueError):
+        return DEFAULT_MAX_BYTES
+
+
+class SourceCache:
+    """
+    (video ID, format ID) -> source media file, LRU-evicted by total bytes
+
+    Args:
+        directory: Folder for the files and index (default: <cache dir>/sources)
+        max_bytes: Total size kept; 0 disables caching
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        if directory is None:
+            directory = os.path.join(default_cache_dir(), 'sources')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins = {}  # path -> [holders, open file holding the pin]
+        self._stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'stored': 0, 'evictions': 0}
+
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite3'),
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sources ('
+            ' video_id TEXT NOT NULL,'
+            ' format_id TEXT NOT NULL,'
+            ' filename TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' acodec TEXT,'
+            ' vcodec TEXT,'
+            ' abr REAL,'
+            ' last_access REAL NOT NULL,'
+            ' PRIMARY KEY (video_id, format_id))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sources_lru ON sources (last_access)')
+
+    def acquire(self, video_id, format_id=None, fallback_abr=None):
+        """
+        Pin and return a cached source, or None on a miss
+
+        With fallback_abr (the bitrate of the audio format that would be
+        downloaded), a miss on format_id is served by the best cached
+        audio-only stream of the same video with at least that bitrate.
+
+        Returns:
+            dict or None: {'filename', 'format_id', 'size', 'acodec', 'vcodec', 'abr'}
+        """
+        if not video_id or not self.max_bytes:
+            return None
+        with self._lock:
+            row = None
+            if format_id:
+                row = self._db.execute(
+                    'SELECT filename, format_id, size, acodec, vcodec, abr FROM sources'
+                    ' WHERE video_id = ? AND format_id = ?', (video_id, str(format_id))).fetchone()
+            if row is None and fallback_abr:
+                row = self._db.execute(
+                    "SELECT filename, format_id, size, acodec, vcodec, abr FROM sources"
+                    " WHERE video_id = ? AND vcodec = 'none' AND abr >= ? ORDER BY abr DESC LIMIT 1",
+                    (video_id, float(fallback_abr))).fetchone()
+            if row is not None and self._pin(row[0]) and not _intact(row[0], row[2]):
+                self._unpin(row[0])
+            if row is not None and row[0] not in self._pins:
+                # Deleted or truncated behind our back
+                self._db.execute('DELETE FROM sources WHERE filename = ?', (row[0],))
+                row = None
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._db.execute('UPDATE sources SET last_access = ? WHERE filename = ?', (time.time(), row[0]))
+            self._stats['hits'] += 1
+            self._stats['bytes_saved'] += row[2]
+        return dict(zip(('filename', 'format_id', 'size', 'acodec', 'vcodec', 'abr'), row))
+
+    def put(self, video_id, fmt, path):
+        """
+        Move a freshly downloaded file into the cache and pin it
+
+        Args:
+            fmt: The yt-dlp format dict it was downloaded as (format_id,
+                 acodec, vcodec, abr)
+            path: The downloaded file
+
+        Returns:
+            str or None: The cached file, or None if it wasn't cached (no
+                         video ID, caching disabled, or bigger than the cache);
+                         path is left where it was then
+        """
+        format_id = fmt.get('format_id')
+        if not video_id or not format_id or not os.path.exists(path):
+            return None
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            return None
+        ext = os.path.splitext(path)[1]
+        filename = os.path.join(self.directory, f'{video_id}.{_safe(format_id)}{ext}')
+        with self._lock:
+            existing = self._db.execute(
+                'SELECT filename FROM sources WHERE video_id = ? AND format_id = ?',
+                (video_id, str(format_id))).fetchone()
+            if existing is not None and not self._remove(existing[0]) and self._pin(existing[0]):
+                # Another job (maybe in another process) cached it while we
+                # downloaded and has it pinned; keep that copy
+                os.remove(path)
+                self._evict()
+                return existing[0]
+            try:
+                shutil.move(path, filename)
+            except OSError:
+                return None
+            self._db.execute(
+                'INSERT OR REPLACE INTO sources'
+                ' (video_id, format_id, filename, size, acodec, vcodec, abr, last_access)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (video_id, str(format_id), filename, size, fmt.get('acodec'),
+                 fmt.get('vcodec'), fmt.get('abr'), time.time()))
+            self._stats['stored'] += 1
+            self._pin(filename)
+            self._evict()
+        return filename
+
+    def release(self, filename):
+        """Unpin a file handed out by acquire/put"""
+        with self._lock:
+            self._unpin(filename)
+            self._evict()
+
+    def clear(self):
+        """Drop every entry no process has pinned"""
+        with self._lock:
+            rows = self._db.execute('SELECT filename FROM sources').fetchall()
+            for (filename,) in rows:
+                self._remove(filename)
+
+    def stats(self):
+        """Hit/miss/bytes-saved counters plus current entries and bytes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'], stats['bytes'] = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sources').fetchone()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            for _, handle in self._pins.values():
+                handle.close()
+            self._pins.clear()
+            self._db.close()
+
+    def _pin(self, filename):
+        """Pin a file for this process; False if it is gone"""
+        pin = self._pins.get(filename)
+        if pin is not None:
+            pin[0] += 1
+            return True
+        try:
+            handle = open(filename, 'rb')
+        except OSError:
+            return False
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            # Another process may have evicted it while we waited for the lock
+            try:
+                current = os.path.samestat(os.fstat(handle.fileno()), os.stat(filename))
+            except OSError:
+                current = False
+            if not current:
+                handle.close()
+                return False
+        self._pins[filename] = [1, handle]
+        return True
+
+    def _unpin(self, filename):
+        pin = self._pins.get(filename)
+        if pin is not None:
+            pin[0] -= 1
+            if pin[0] <= 0:
+                del self._pins[filename]
+                pin[1].close()  # drops the flock
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM sources').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for filename, size in self._db.execute(
+                'SELECT filename, size FROM sources ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            if self._remove(filename):
+                self._stats['evictions'] += 1
+                total -= size
+
+    def _remove(self, filename):
+        """Delete an entry and its file unless a process has it pinned; True if it was removed"""
+        if filename in self._pins:
+            return False
+        handle = None
+        try:
+            if fcntl is not None:
+                try:
+                    handle = open(filename, 'rb')
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    return False  # pinned by another process
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                return False  # Windows: open in another process
+            self._db.execute('DELETE FROM sources WHERE filename = ?', (filename,))
+            return True
+        finally:
+            if handle is not None:
+                handle.close()
+
+
+def _intact(filename, size):
+    try:
+        return os.path.getsize(filename) == size
+    except OSError:
+        return False
+
+
+def _safe(format_id):
+    """A format ID as a file name part ('251', 'hls-720p', ...)"""
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(format_id))
+
+
+def summary(before=None, after=None):
+    """
+    'N hits, M misses (R%), X MiB not downloaded again' for the shared cache
+
+    Pass stats() taken before a batch to report just that batch.
+    """
+    after = after or get_cache().stats()
+    before = before or {}
+    hits = after['hits'] - before.get('hits', 0)
+    misses = after['misses'] - before.get('misses', 0)
+    saved = after['bytes_saved'] - before.get('bytes_saved', 0)
+    ratio = hits / (hits + misses) if hits + misses else 0.0
+    return (f"{hits} hits, {misses} misses ({ratio:.0%}), "
+            f"{saved / 2 ** 20:.1f} MiB not downloaded again")
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide cache, created on first use"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SourceCache(max_bytes=default_max_bytes())
+        return _default_cache
+
+
+def configure(cache_dir=None, max_bytes=None):
+    """Replace the shared cache, e.g. to point it at a temp directory or resize it"""
+    global _default_cache
+    directory = None
+    if cache_dir is not None:
+        directory = os.path.join(cache_dir, 'sources')
+    cache = SourceCache(directory, default_max_bytes() if max_bytes is None else max_bytes)
+    with _default_lock:
+        old, _default_cache = _default_cache, cache
+    if old is not None:
+        old.close()
+    return cache
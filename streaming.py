@@ -0,0 +1,128 @@
+"""
+streaming.py - Stream a selected yt-dlp format over HTTP straight into FFmpeg
+
+Only plain progressive HTTP(S) formats in a container FFmpeg can demux from
+a non-seekable pipe are streamed. Everything else (HLS/DASH manifests,
+fragmented downloads, merged formats) goes through the regular file-based
+download.
+"""
+import time
+
+import retry_policy
+
+READ_SIZE = 64 * 1024
+STREAMABLE_PROTOCOLS = ('http', 'https')
+# Containers that can be demuxed from a pipe. YouTube's m4a audio is
+# fragmented MP4 with the index up front, so it is safe to read sequentially.
+STREAMABLE_EXTS = ('webm', 'weba', 'm4a', 'mp3', 'ogg', 'opus', 'aac')
+
+
+def can_stream(fmt):
+    """True if a selected format can be piped straight into FFmpeg"""
+    if not fmt or fmt.get('requested_formats') or fmt.get('fragments'):
+        return False
+    if not fmt.get('url'):
+        return False
+    return fmt.get('protocol', 'https') in STREAMABLE_PROTOCOLS and fmt.get('ext') in STREAMABLE_EXTS
+
+
+def iter_http(url, headers=None, chunk_size=None, timeout=30, read_size=READ_SIZE, attempts=None,
+              start=0):
+    """
+    Yield the body of an HTTP resource as byte chunks
+
+    Requests go through retry_policy: the host's rate limit applies and
+    429/5xx responses are retried. In chunked mode a connection that drops
+    part way through a range is resumed from the last byte received.
+
+    Args:
+        url: Media URL
+        headers: Request headers (the format's http_headers)
+        chunk_size: If set, fetch in sequential Range requests of this size.
+                    YouTube throttles long single requests, which is why
+                    yt-dlp uses chunked ranges for it as well.
+        timeout: Socket timeout in seconds
+        attempts: retry_policy.Attempts collecting retry counts (default: the
+                  one bound to the thread that starts iterating, if any)
+        start: First byte to yield, to continue a partial download. A server
+               that ignores Range sends everything; the bytes before start
+               are dropped.
+    """
+    # Imported on first use; http.client/email are a noticeable share of startup
+    import urllib.request
+
+    attempts = attempts or retry_policy.current_attempts() or retry_policy.Attempts()
+    headers = dict(headers or {})
+    if not chunk_size:
+        if start:
+            headers['Range'] = f'bytes={start}-'
+        request = urllib.request.Request(url, headers=headers)
+        with retry_policy.urlopen(request, timeout, attempts=attempts) as resp:
+            blocks = iter(lambda: resp.read(read_size), b'')
+            if start and resp.status == 200:
+                blocks = _skipping(blocks, start)
+            for block in blocks:
+                yield block
+        return
+
+    policy = retry_policy.get_policy()
+    failures = 0
+    while True:
+        end = start + chunk_size - 1
+        request = urllib.request.Request(url, headers=dict(headers, Range=f'bytes={start}-{end}'))
+        received = 0
+        with retry_policy.urlopen(request, timeout, attempts=attempts) as resp:
+            total = _content_range_total(resp.headers.get('Content-Range'))
+            blocks = iter(lambda: resp.read(read_size), b'')
+            if start and resp.status == 200:
+                blocks = _skipping(blocks, start)
+            try:
+                for block in blocks:
+                    received += len(block)
+                    yield block
+            except Exception as e:
+                # Dropped mid-range: resume at the next byte, unless the
+                # server ignored Range (nothing to resume from)
+                failures += 1
+                if resp.status == 200:
+                    attempts.exhausted = True
+                    raise
+                if not attempts.failed(retry_policy.classify(e), failures, policy):
+                    raise
+                time.sleep(policy.delay(failures))
+                start += received
+                continue
+            if resp.status == 200:
+                # Server ignored the Range header and sent everything
+                return
+        if received == 0:
+            return
+        start += received
+        if total is not None and start >= total:
+            return
+        if received < chunk_size and total is None:
+            return
+
+
+def iter_format(fmt, timeout=30, attempts=None):
+    """Yield the bytes of a selected yt-dlp format"""
+    chunk_size = (fmt.get('downloader_options') or {}).get('http_chunk_size')
+    return iter_http(fmt['url'], fmt.get('http_headers'), chunk_size, timeout, attempts=attempts)
+
+
+def _skipping(blocks, count):
+    """blocks without their first count bytes"""
+    for block in blocks:
+        if count >= len(block):
+            count -= len(block)
+            continue
+        yield block[count:]
+        count = 0
+
+
+def _content_range_total(value):
+    """Total size from 'bytes 0-99/1234', or None"""
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
@@ -0,0 +1,9 @@
+"""
+conftest.py - Shared pytest setup: puts the repo root on sys.path
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,97 @@
+"""
+test_batch_processor.py - VideoIdSet's packed table and streamed results files
+"""
+import json
+import random
+import string
+
+import pytest
+
+from batch_processor import VideoIdSet, save_batch_results
+
+ALPHABET = string.ascii_letters + string.digits + '-_'
+LAST = 'AEIMQUYcgkosw048'  # the 16 characters that can end an ID
+
+
+def random_ids(count, seed=1):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(ALPHABET) for _ in range(10)) + rng.choice(LAST) for _ in range(count)]
+
+
+def test_add_and_contains():
+    ids = VideoIdSet(['dQw4w9WgXcQ'])
+    ids.add('9bZkp7q19f0')
+    ids.add('dQw4w9WgXcQ')
+    assert len(ids) == 2
+    assert 'dQw4w9WgXcQ' in ids and '9bZkp7q19f0' in ids
+    assert 'jNQXAC9IVRw' not in ids
+
+
+def test_growth_keeps_every_id():
+    added = random_ids(5000)
+    ids = VideoIdSet(added[:100])
+    initial = ids.nbytes()
+    for video_id in added[100:]:
+        ids.add(video_id)
+    # The table was rehashed several times; IDs from before still hit
+    assert ids.nbytes() > initial
+    assert all(video_id in ids for video_id in added)
+    assert len(ids) == len(set(added))
+    assert not any(video_id in ids for video_id in random_ids(1000, seed=2))
+
+
+def test_load_factor_stays_under_two_thirds():
+    ids = VideoIdSet(random_ids(3000))
+    assert len(ids) * 3 <= (ids.nbytes() // 8) * 2
+
+
+@pytest.mark.parametrize('video_id', [
+    '----------A',
+    '__________w',
+    '-_-_-_-_-_0',
+    '_-_-_-_-_-8',
+    'AAAAAAAAAAA',  # packs to 0, the empty-slot marker
+    'zzzzzzzzzzw',
+])
+def test_url_safe_and_edge_ids(video_id):
+    ids = VideoIdSet()
+    assert video_id not in ids
+    ids.add(video_id)
+    assert video_id in ids
+    assert len(ids) == 1
+    ids.add(video_id)
+    assert len(ids) == 1
+
+
+def test_dash_and_underscore_are_distinct():
+    ids = VideoIdSet(['a-b-c-d-e-A'])
+    assert 'a-b-c-d-e-A' in ids
+    assert 'a_b_c_d_e_A' not in ids
+    assert 'a+b+c+d+e+A' not in ids  # standard base64 would pack the same bits
+
+
+@pytest.mark.parametrize('value', [
+    'https://www.youtube.com/playlist?list=PLxyz',
+    'dQw4w9WgXcZ',   # 'Z' can't end an ID, so it isn't packed
+    'dQw4w9WgXc',
+    'dQw4w9WgXcQQ',
+    '',
+    None,
+])
+def test_other_values_fall_back_to_a_set(value):
+    ids = VideoIdSet(random_ids(10))
+    ids.add(value)
+    assert value in ids
+    assert len(ids) == 11
+    assert 'dQw4w9WgXcQ' not in ids
+
+
+@pytest.mark.parametrize('results', [
+    [],
+    [{'success': True, 'title': 'Café\nline', 'stages': {'download': {'seconds': 1.5}}}],
+    [{'success': True, 'outputs': [{'format': 'mp3'}, {'format': 'mp4'}]}, {'success': False, 'error': 'x'}],
+])
+def test_results_are_streamed_in_json_dump_layout(tmp_path, results):
+    path = tmp_path / 'batch_results.json'
+    assert save_batch_results(iter(results), str(path))
+    assert path.read_text(encoding='utf-8') == json.dumps(results, indent=2, ensure_ascii=False)
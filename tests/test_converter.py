@@ -0,0 +1,191 @@
+"""
+test_converter.py - Multi-output specs and the fan-out job against fake download and encode stages
+"""
+import os
+
+import pytest
+
+import converter
+import download_archive
+import transcoder
+from converter import OutputSpec, parse_outputs
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+INFO = {'id': 'dQw4w9WgXcQ', 'title': 'Song', 'uploader': 'Artist'}
+
+
+@pytest.mark.parametrize('outputs, expected', [
+    ('mp3:192,mp3:320,mp4:720p', [('mp3', '192', None), ('mp3', '320', None), ('mp4', '720p', None)]),
+    ('MP3', [('mp3', '192', None)]),
+    ('mp4', [('mp4', 'best', None)]),
+    ('flac:320', [('flac', 'best', None)]),  # lossless ignores the bitrate
+    ('mp3:best', [('mp3', 'best', None)]),
+    ('mp3:192:normalize', [('mp3', '192', transcoder.SINGLE_PASS)]),
+    ('opus:128:two-pass', [('opus', '128', transcoder.TWO_PASS)]),
+    (' mp3:192 , , m4a:256 ', [('mp3', '192', None), ('m4a', '256', None)]),
+    ([('mp3', '320'), {'format': 'mp4', 'quality': '1080p'}],
+     [('mp3', '320', None), ('mp4', '1080p', None)]),
+])
+def test_parse_outputs(outputs, expected):
+    assert parse_outputs(outputs) == [OutputSpec(*spec) for spec in expected]
+
+
+@pytest.mark.parametrize('quality', ['360p', '480p', '720p', '1080p', 'best'])
+def test_parse_outputs_mp4_qualities(quality):
+    assert parse_outputs(f'mp4:{quality}') == [OutputSpec('mp4', quality, None)]
+
+
+def test_parse_outputs_drops_duplicates():
+    specs = parse_outputs('mp3:192,mp3,mp3:192:normalize,mp3:192:single,mp4:best,mp4')
+    assert specs == [OutputSpec('mp3', '192', None), OutputSpec('mp3', '192', transcoder.SINGLE_PASS),
+                     OutputSpec('mp4', 'best', None)]
+
+
+@pytest.mark.parametrize('outputs, message', [
+    ('wav:192', 'Unknown output format'),
+    ('mp3:192,aac', 'Unknown output format'),
+    (':192', 'Unknown output format'),
+    ('mp3:loud', 'Audio quality must be a bitrate'),
+    ('mp3:192:louder', 'normalize must be one of'),
+    ('mp4:4k', 'MP4 quality must be one of'),
+    ('mp4:720p:normalize', 'audio outputs only'),
+    ('mp3:192:normalize:extra', 'Bad output spec'),
+    ('', 'No outputs given'),
+    (' , ', 'No outputs given'),
+])
+def test_parse_outputs_rejects(outputs, message):
+    with pytest.raises(ValueError, match=message):
+        parse_outputs(outputs)
+
+
+def test_output_label_round_trips():
+    for label in ('mp3:192', 'mp3:192:two-pass', 'mp4:720p', 'flac:best'):
+        assert converter.output_label(parse_outputs(label)[0]) == label
+
+
+class FakeStages:
+    """Stand-ins for the audio download, the MP4 merge and the multi-output encode"""
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.downloads = []
+        self.videos = []
+        self.encodes = []
+
+    def download_audio(self, url, output_folder, ffmpeg_location, info, codec, connections):
+        self.downloads.append(codec)
+        source = self.tmp_path / f'source-{len(self.downloads)}.webm'
+        source.write_bytes(b'audio')
+        return {'success': True, 'source': str(source), 'source_acodec': 'opus', 'source_abr': 160,
+                'title': info['title'], 'uploader': info['uploader'], 'url': url}
+
+    def download_video(self, url, output_folder, quality, info, ffmpeg_location, connections, audio,
+                       output_file):
+        self.videos.append((quality, audio['source']))
+        with open(output_file, 'wb') as f:
+            f.write(b'video ' + quality.encode())
+        return {'success': True, 'filename': output_file, 'title': info['title'], 'url': url}
+
+    def encode_outputs(self, source, jobs, ffmpeg_location=None, acodec=None, abr=None):
+        self.encodes.append([os.path.basename(output_file) for _, output_file in jobs])
+        for job, output_file in jobs:
+            with open(output_file, 'wb') as f:
+                f.write(f'{job.codec} {job.quality}'.encode())
+        return ['encode'] * len(jobs)
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = download_archive.DownloadArchive(str(tmp_path / 'archive.sqlite3'))
+    monkeypatch.setattr(download_archive, '_default_archive', archive)
+    yield archive
+    archive.close()
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch, archive):
+    stages = FakeStages(tmp_path)
+    monkeypatch.setattr(converter, 'download_audio', stages.download_audio)
+    monkeypatch.setattr(converter, '_download_video', stages.download_video)
+    monkeypatch.setattr(transcoder, 'encode_outputs', stages.encode_outputs)
+    return stages
+
+
+def convert(tmp_path, outputs='mp3:192,mp3:320,mp4:720p', force=False):
+    return converter.convert_outputs(URL, outputs, str(tmp_path / 'out'), info=dict(INFO), force=force)
+
+
+def test_fanout_downloads_once_and_encodes_once(tmp_path, stages):
+    result = convert(tmp_path)
+
+    assert result['success'] and not result['skipped']
+    assert stages.downloads == ['mp3']
+    assert [quality for quality, _ in stages.videos] == ['720p']
+    assert stages.encodes == [['Song (192k).mp3', 'Song (320k).mp3']]
+    assert [o['output'] for o in result['outputs']] == ['mp4:720p', 'mp3:192', 'mp3:320']
+    assert sorted(os.listdir(tmp_path / 'out')) == ['Song (192k).mp3', 'Song (320k).mp3', 'Song.mp4']
+    # The shared source is released once every output is written
+    assert not os.path.exists(tmp_path / 'source-1.webm')
+
+
+def test_fanout_skips_archived_outputs(tmp_path, stages):
+    convert(tmp_path)
+
+    again = convert(tmp_path)
+
+    assert again['success'] and again['skipped']
+    assert stages.downloads == ['mp3']
+    assert all(o['skipped'] for o in again['outputs'])
+    assert [o['output'] for o in again['outputs']] == ['mp3:192', 'mp3:320', 'mp4:720p']
+
+
+def test_fanout_redoes_only_missing_outputs(tmp_path, stages):
+    convert(tmp_path)
+    os.remove(tmp_path / 'out' / 'Song (320k).mp3')
+
+    result = convert(tmp_path)
+
+    assert result['success'] and not result['skipped']
+    assert stages.downloads == ['mp3', 'mp3']
+    assert len(stages.videos) == 1
+    assert stages.encodes[-1] == ['Song (320k).mp3']
+    skipped = {o['output']: o.get('skipped', False) for o in result['outputs']}
+    assert skipped == {'mp3:192': True, 'mp4:720p': True, 'mp3:320': False}
+
+
+def test_fanout_force_converts_everything_again(tmp_path, stages):
+    convert(tmp_path)
+    convert(tmp_path, force=True)
+    assert stages.downloads == ['mp3', 'mp3']
+    assert len(stages.videos) == 2
+
+
+def test_mp4_only_outputs_share_an_aac_source(tmp_path, stages):
+    result = convert(tmp_path, 'mp4:720p,mp4:1080p')
+    assert result['success']
+    assert stages.downloads == ['m4a']
+    assert [quality for quality, _ in stages.videos] == ['720p', '1080p']
+    assert len({source for _, source in stages.videos}) == 1
+    assert stages.encodes == []
+
+
+def test_failed_download_fails_every_pending_output(tmp_path, stages, monkeypatch):
+    monkeypatch.setattr(converter, 'download_audio',
+                        lambda *args: {'success': False, 'error': 'HTTP Error 403', 'url': URL})
+
+    result = convert(tmp_path, 'mp3:192,mp4:720p')
+
+    assert not result['success'] and not result['skipped']
+    assert result['error'] == 'mp3:192: HTTP Error 403; mp4:720p: HTTP Error 403'
+    assert result['filename'] is None
+
+
+def test_fanout_result_summarizes_outputs():
+    ok = {'success': True, 'filename': 'a.mp3', 'title': 'Song', 'output': 'mp3:192', 'skipped': True}
+    failed = {'success': False, 'error': 'boom', 'output': 'mp4:720p'}
+
+    assert converter.fanout_result(URL, [ok])['skipped']
+    result = converter.fanout_result(URL, [failed, ok], extractions=1)
+    assert (result['success'], result['skipped'], result['filename']) == (False, False, 'a.mp3')
+    assert result['title'] == 'Song' and result['extractions'] == 1
+    assert result['error'] == 'mp4:720p: boom'
@@ -0,0 +1,99 @@
+"""
+test_download_archive.py - Archive hits, stale outputs and format/quality keying
+"""
+import os
+
+import pytest
+
+import download_archive
+from download_archive import archive_format, archived_result, record_result
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = download_archive.DownloadArchive(str(tmp_path / 'archive.sqlite3'))
+    yield archive
+    archive.close()
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / 'Song.mp3'
+    path.write_bytes(b'ID3' + b'\0' * 1000)
+    return str(path)
+
+
+def converted(filename, **fields):
+    return dict({'success': True, 'filename': filename, 'title': 'Song', 'url': URL}, **fields)
+
+
+def test_recorded_output_is_a_hit(archive, output):
+    result = converted(output)
+    assert record_result(archive, result, 'mp3', '192') is result
+
+    hit = archived_result(archive, f'https://youtu.be/{URL[-11:]}', 'mp3', '192')
+
+    assert hit == {'success': True, 'filename': output, 'title': 'Song', 'size': 1003, 'skipped': True,
+                   'url': f'https://youtu.be/{URL[-11:]}'}
+    assert archive.stats()['hits'] == 1
+
+
+def test_deleted_output_is_a_miss_and_forgotten(archive, output):
+    record_result(archive, converted(output), 'mp3', '192')
+    os.remove(output)
+
+    assert archived_result(archive, URL, 'mp3', '192') is None
+    assert archive.stats() == {'hits': 0, 'misses': 1, 'stale': 1}
+    # The stale row is gone, so the next lookup is a plain miss
+    assert archived_result(archive, URL, 'mp3', '192') is None
+    assert archive.stats()['stale'] == 1
+
+
+def test_changed_output_is_a_miss(archive, output):
+    record_result(archive, converted(output), 'mp3', '192')
+    with open(output, 'r+b') as f:
+        f.write(b'XXX')
+    os.utime(output, (1, 1))
+
+    assert archived_result(archive, URL, 'mp3', '192') is None
+
+
+def test_touched_but_identical_output_is_still_a_hit(archive, output):
+    record_result(archive, converted(output), 'mp3', '192')
+    os.utime(output, (1, 1))
+
+    assert archived_result(archive, URL, 'mp3', '192')['filename'] == output
+
+
+@pytest.mark.parametrize('format_type, quality, normalize', [
+    ('mp3', '320', None),     # another bitrate
+    ('m4a', '192', None),     # another codec
+    ('mp3', '192', 'single'),  # a loudness-normalized output is a different file
+    ('mp3', '192', 'two-pass'),
+])
+def test_other_format_quality_or_normalize_is_a_miss(archive, output, format_type, quality, normalize):
+    record_result(archive, converted(output), archive_format('mp3'), '192')
+    assert archived_result(archive, URL, archive_format(format_type, normalize), quality) is None
+
+
+def test_normalized_output_is_keyed_apart(archive, output):
+    record_result(archive, converted(output), archive_format('MP3', 'single'), '192')
+    assert archive_format('MP3', 'single') == 'mp3+loudnorm'
+    assert archived_result(archive, URL, 'mp3+loudnorm', '192')
+    assert archived_result(archive, URL, 'mp3', '192') is None
+
+
+@pytest.mark.parametrize('result', [
+    converted(None, success=False, error='HTTP Error 403'),
+    converted('Song.mp3', skipped=True),  # an archive hit is not recorded again
+    converted('missing.mp3'),             # no output on disk
+    dict(converted('Song.mp3'), url='https://example.com/not-youtube'),
+])
+def test_only_fresh_successes_with_an_output_are_recorded(archive, tmp_path, result):
+    if result.get('filename') == 'Song.mp3':
+        result['filename'] = str(tmp_path / 'Song.mp3')
+        (tmp_path / 'Song.mp3').write_bytes(b'x')
+    record_result(archive, result, 'mp3', '192')
+    assert archived_result(archive, URL, 'mp3', '192') is None
@@ -0,0 +1,132 @@
+"""
+test_job_journal.py - Journal replay after a crash, pending items and resuming from the source file
+"""
+import json
+import os
+
+import pytest
+
+import cli
+from job_journal import DONE, DOWNLOADING, EXPANDED, FAILED, QUEUED, SKIPPED, JobJournal
+
+A, B, C, D, E = (f'https://www.youtube.com/watch?v={c * 10}Q' for c in 'abcde')
+PLAYLIST = 'https://www.youtube.com/playlist?list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+
+
+def result(url, success=True, **fields):
+    return dict({'success': success, 'url': url, 'title': url[-11:]}, **fields)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'urls.txt'
+    path.write_text('\n'.join([A, B, '# comment', C, D, E]) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def crashed(tmp_path, source):
+    """
+    A streamed batch killed while writing D's queued record
+
+    A finished, B failed, C was downloading; D and E were never journaled.
+    """
+    path = str(tmp_path / 'job.jsonl')
+    with JobJournal.create((), {'quality': '192'}, path, source=source) as journal:
+        for url in journal.feed([A, B, C]):
+            journal.record(url, DOWNLOADING)
+        journal.record_result(result(A))
+        journal.record_result(result(B, False, error='HTTP Error 403'))
+        size = os.path.getsize(path)
+        journal.record(D, QUEUED)
+    with open(path, 'r+b') as f:
+        f.truncate(size + 20)
+    return path
+
+
+def test_replay_ignores_the_torn_line(crashed):
+    with JobJournal.open(crashed) as journal:
+        assert journal.options == {'quality': '192'}
+        assert [journal.state(url) for url in (A, B, C, D)] == [DONE, FAILED, DOWNLOADING, None]
+        assert journal.counts() == {DONE: 1, FAILED: 1, DOWNLOADING: 1}
+        assert list(journal.pending()) == [C]
+        assert list(journal.pending(retry_failed=True)) == [B, C]
+        assert not journal.needs_work(A)
+        assert not journal.needs_work(B)
+        assert journal.needs_work(B, retry_failed=True)
+        assert journal.needs_work(D)
+
+
+def test_records_after_reopening_start_on_a_new_line(crashed):
+    with JobJournal.open(crashed) as journal:
+        journal.record_result(result(C))
+    lines = open(crashed, encoding='utf-8').read().splitlines()
+    json.loads(lines[-1])
+    with JobJournal.open(crashed) as journal:
+        assert journal.state(C) == DONE
+        assert list(journal.pending()) == []
+
+
+def test_results_view_after_replay(crashed):
+    with JobJournal.open(crashed) as journal:
+        results = list(journal.results())
+    assert [(r['url'], r['success']) for r in results] == [(C, False), (A, True), (B, False)]
+    assert results[0] == {'success': False, 'error': 'Not finished', 'state': DOWNLOADING, 'url': C}
+    assert results[2]['error'] == 'HTTP Error 403'
+
+
+def test_retried_item_reports_its_latest_result(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    with JobJournal.create([A, PLAYLIST], path=path) as journal:
+        journal.record(PLAYLIST, EXPANDED)
+        journal.record_result(result(A, False, error='timeout'))
+        journal.record(A, DOWNLOADING)
+        # Still failed until the retry finishes
+        assert journal.state(A) == FAILED
+        journal.record_result(result(A))
+        journal.record_result(result(B, skipped=True))
+    with JobJournal.open(path) as journal:
+        assert journal.counts() == {DONE: 1, SKIPPED: 1, EXPANDED: 1}
+        assert [(r['url'], r['success']) for r in journal.results()] == [(A, True), (B, True)]
+
+
+def test_url_forms_of_one_video_are_one_item(tmp_path):
+    with JobJournal.create((), path=str(tmp_path / 'job.jsonl')) as journal:
+        assert list(journal.feed([A, f'https://youtu.be/{A[-11:]}'])) == [A, f'https://youtu.be/{A[-11:]}']
+        journal.record_result(result(A))
+        assert not journal.needs_work(f'https://youtu.be/{A[-11:]}')
+        assert journal.counts() == {DONE: 1}
+
+
+@pytest.fixture
+def fed(monkeypatch):
+    """URLs a resume hands to the batch, instead of running it"""
+    urls = []
+
+    def run_journal(journal, pending, *args):
+        urls.extend(pending)
+        return 0
+
+    monkeypatch.setattr(cli, '_run_journal', run_journal)
+    return urls
+
+
+def test_resume_reads_on_from_the_source(crashed, fed):
+    assert cli.main(['resume', crashed]) == 0
+    # C is pending and still unfinished when the source reaches it; the batch
+    # drops the repeat by video ID
+    assert fed == [C, C, D, E]
+    with JobJournal.open(crashed) as journal:
+        assert [journal.state(url) for url in (C, D, E)] == [DOWNLOADING, QUEUED, QUEUED]
+
+
+def test_resume_retry_failed(crashed, fed):
+    cli.main(['resume', crashed, '--retry-failed'])
+    assert fed == [B, C, B, C, D, E]
+
+
+def test_resume_without_the_source_runs_journaled_items(crashed, source, fed, capsys):
+    os.remove(source)
+    cli.main(['resume', crashed])
+    assert fed == [C]
+    assert 'Source file is gone' in capsys.readouterr().out
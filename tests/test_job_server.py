@@ -0,0 +1,310 @@
+"""
+test_job_server.py - HTTP API of the job server, with a stub in place of the converter
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metadata_cache
+import source_cache
+import tracing
+from job_server import STOPPED_ERROR, JobQueue, JobServer, output_folder
+
+
+def watch(video_id):
+    return f'https://www.youtube.com/watch?v={video_id}'
+
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data, {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, resp.read(), resp.headers
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), e.headers
+
+
+def get_json(url, body=None):
+    status, payload, headers = request(url, body)
+    return status, json.loads(payload), headers
+
+
+class StubConverter:
+    """
+    Records (url, options) and returns a traced result; hold() blocks workers until release()
+
+    overlaps counts calls that started while another call for the same video
+    was still running.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.overlaps = 0
+        self._running = set()
+        self._lock = threading.Lock()
+        self._open = threading.Event()
+        self._open.set()
+
+    def hold(self):
+        self._open.clear()
+
+    def release(self):
+        self._open.set()
+
+    def __call__(self, url, options):
+        video_id = url[-11:]
+        with self._lock:
+            self.overlaps += video_id in self._running
+            self._running.add(video_id)
+        try:
+            self._open.wait(10)
+            self.calls.append((url, options))
+            with tracing.span(tracing.DOWNLOAD, url, bytes=100):
+                pass
+            return tracing.finish({'success': True, 'url': url, 'title': video_id, 'quality': options['quality']})
+        finally:
+            with self._lock:
+                self._running.discard(video_id)
+
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path):
+    metadata_cache.configure(str(tmp_path))
+    source_cache.configure(str(tmp_path))
+    yield
+    metadata_cache.configure(str(tmp_path)).close()
+    metadata_cache._default_cache = None
+    source_cache.configure(str(tmp_path)).close()
+    source_cache._default_cache = None
+
+
+@pytest.fixture
+def stub():
+    stub = StubConverter()
+    yield stub
+    stub.release()
+
+
+@pytest.fixture
+def make_server(tmp_path, stub):
+    servers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('defaults', {'output': str(tmp_path / 'out')})
+        server = JobServer(JobQueue(stub, **kwargs), port=0).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met')
+        time.sleep(0.01)
+
+
+def wait_done(server, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        _, status, _ = get_json(f'{server.base_url}/jobs/{job_id}')
+        if status['state'] == 'done':
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_enqueue_and_poll_until_done(make_server, stub, tmp_path):
+    server = make_server(workers=2)
+    urls = [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0')]
+    status, job, headers = get_json(f'{server.base_url}/jobs', {'urls': urls + ['not a url'],
+                                                                'quality': 320})
+    assert status == 202
+    assert headers['Location'] == f"/jobs/{job['job']}"
+    assert job['total'] == 2
+    assert job['invalid'] == ['not a url']
+    assert job['options']['quality'] == '320'
+    assert job['options']['output'] == str(tmp_path / 'out')
+
+    done = wait_done(server, job['job'])
+    assert (done['succeeded'], done['failed'], done['queued'], done['running']) == (2, 0, 0, 0)
+    assert sorted(url for url, _ in stub.calls) == sorted(urls)
+
+    _, results, _ = get_json(f"{server.base_url}/jobs/{job['job']}/results")
+    assert [r['url'] for r in results] == urls
+    _, listing, _ = get_json(f'{server.base_url}/jobs')
+    assert [j['job'] for j in listing['jobs']] == [job['job']]
+
+
+def test_single_url_body(make_server):
+    server = make_server()
+    status, job, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    assert status == 202
+    assert wait_done(server, job['job'])['succeeded'] == 1
+
+
+def test_status_reports_queue_and_caches(make_server):
+    server = make_server(workers=3, max_queued=7)
+    status, payload, _ = get_json(f'{server.base_url}/status')
+    assert status == 200
+    assert payload['queue']['workers'] == 3
+    assert payload['queue']['max_queued'] == 7
+    assert payload['queue']['free'] == 7
+    assert 'hits' in payload['metadata_cache']
+    assert 'session_pool' in payload
+
+
+def test_full_queue_is_refused_with_retry_after(make_server, stub):
+    stub.hold()
+    server = make_server(workers=1, max_queued=2)
+    too_many = [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0'), watch('jNQXAC9IVRw')]
+    status, payload, headers = get_json(f'{server.base_url}/jobs', {'urls': too_many})
+    assert status == 429
+    assert int(headers['Retry-After']) >= 1
+    assert payload['free'] == 2
+
+    # One item on the held worker, two waiting: the queue is full
+    status, first, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    assert status == 202
+    deadline = time.monotonic() + 10
+    while server.jobs.stats()['active'] != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    status, second, _ = get_json(f'{server.base_url}/jobs', {'urls': too_many[1:]})
+    assert status == 202
+    status, payload, headers = get_json(f'{server.base_url}/jobs', {'url': watch('M7lc1UVf-VE')})
+    assert status == 429
+    assert payload['free'] == 0
+    assert 'Retry-After' in headers
+
+    stub.release()
+    wait_done(server, first['job'])
+    wait_done(server, second['job'])
+    assert server.jobs.stats()['free'] == 2
+    status, _, _ = get_json(f'{server.base_url}/jobs', {'url': watch('M7lc1UVf-VE')})
+    assert status == 202
+
+
+def test_bad_requests(make_server):
+    server = make_server()
+    assert get_json(f'{server.base_url}/jobs', {'urls': 'x'})[0] == 400
+    assert get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ'), 'codec': 'wav'})[0] == 400
+    assert get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ'), 'color': 'red'})[0] == 400
+    assert get_json(f'{server.base_url}/jobs', {'urls': ['not a url']})[0] == 400
+    assert get_json(f'{server.base_url}/jobs/nope')[0] == 404
+    assert get_json(f'{server.base_url}/nope')[0] == 404
+
+
+@pytest.mark.parametrize('output', ['../elsewhere', '/etc', 'sub/../../escape', ''])
+def test_output_outside_the_output_folder_is_refused(make_server, stub, output):
+    server = make_server()
+    status, payload, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ'), 'output': output})
+    assert status == 400
+    assert 'output' in payload['error']
+    assert stub.calls == []
+
+
+def test_output_inside_the_output_folder_is_used(make_server, stub, tmp_path):
+    server = make_server()
+    status, job, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ'), 'output': 'alice/mix'})
+    assert status == 202
+    wait_done(server, job['job'])
+    assert stub.calls[0][1]['output'] == os.path.realpath(tmp_path / 'out' / 'alice' / 'mix')
+
+
+def test_output_folder_rejects_symlink_escape(tmp_path):
+    root = tmp_path / 'out'
+    root.mkdir()
+    (root / 'link').symlink_to(tmp_path)
+    with pytest.raises(ValueError):
+        output_folder(str(root), 'link/x')
+    assert output_folder(str(root), 'a/../b') == os.path.realpath(root / 'b')
+
+
+def test_metrics_exposes_stage_counters(make_server):
+    server = make_server()
+    _, job, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    wait_done(server, job['job'])
+
+    status, body, headers = request(f'{server.base_url}/metrics')
+    assert status == 200
+    assert headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = body.decode()
+    assert 'yt2mp3_jobs_total{outcome="succeeded"}' in text
+    assert 'stage="download"' in text
+
+
+def test_duplicate_in_one_job_is_converted_once(make_server, stub):
+    stub.hold()
+    server = make_server(workers=2)
+    # Straight to the queue: the HTTP handler would canonicalize both URLs
+    urls = [watch('dQw4w9WgXcQ'), 'https://youtu.be/dQw4w9WgXcQ']
+    job = server.jobs.submit(urls)
+    # One worker converts, the other attaches to it
+    wait_for(lambda: server.jobs.status(job['job'])['running'] == 2)
+    assert server.jobs.stats()['active'] == 1
+
+    stub.release()
+    done = wait_done(server, job['job'])
+    assert done['succeeded'] == 2
+    assert len(stub.calls) == 1
+    _, results, _ = get_json(f"{server.base_url}/jobs/{job['job']}/results")
+    assert [r['url'] for r in results] == urls
+    assert all(r['success'] for r in results)
+
+
+def test_duplicate_across_jobs_shares_the_running_conversion(make_server, stub):
+    stub.hold()
+    server = make_server(workers=2)
+    _, first, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    wait_for(lambda: server.jobs.stats()['active'] == 1)
+    _, second, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    wait_for(lambda: server.jobs.status(second['job'])['running'] == 1)
+
+    stub.release()
+    assert wait_done(server, first['job'])['succeeded'] == 1
+    assert wait_done(server, second['job'])['succeeded'] == 1
+    assert len(stub.calls) == 1
+
+
+def test_duplicate_with_other_options_waits_for_the_running_one(make_server, stub):
+    stub.hold()
+    server = make_server(workers=2)
+    _, first, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ')})
+    wait_for(lambda: server.jobs.stats()['active'] == 1)
+    _, second, _ = get_json(f'{server.base_url}/jobs', {'url': watch('dQw4w9WgXcQ'), 'quality': '320'})
+    # The second worker picked it up but left it queued behind the first
+    wait_for(lambda: server.jobs._items.empty())
+    assert server.jobs.status(second['job'])['queued'] == 1
+    assert server.jobs.stats()['active'] == 1
+
+    stub.release()
+    wait_done(server, first['job'])
+    wait_done(server, second['job'])
+    assert [options['quality'] for _, options in stub.calls] == ['192', '320']
+    assert stub.overlaps == 0
+
+
+def test_stop_fails_items_that_never_started(make_server, stub):
+    stub.hold()
+    server = make_server(workers=1)
+    urls = [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0'), watch('jNQXAC9IVRw')]
+    _, job, _ = get_json(f'{server.base_url}/jobs', {'urls': urls})
+    wait_for(lambda: server.jobs.stats()['active'] == 1)
+
+    server.jobs.stop(wait=False)
+    stub.release()
+    done = wait_done(server, job['job'])
+    assert (done['succeeded'], done['failed'], done['queued']) == (1, 2, 0)
+    assert server.jobs.stats()['queued'] == 0
+    results = server.jobs.results(job['job'])
+    assert [r['error'] for r in results[1:]] == [STOPPED_ERROR, STOPPED_ERROR]
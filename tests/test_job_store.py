@@ -0,0 +1,160 @@
+"""
+test_job_store.py - Several worker processes sharing one JobStore file
+"""
+import functools
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pytest
+
+import job_store
+from job_store import CLAIMED, DONE, JobStore, StoreWorker
+
+
+def watch(index):
+    return f'https://www.youtube.com/watch?v={index:011d}'
+
+
+def fake_convert(log_path, hang, url, options):
+    """Stand-in converter: logs 'start'/'done' lines, or never returns with hang"""
+    with open(log_path, 'a') as log:
+        log.write(f'start {url} {os.getpid()}\n')
+    if hang:
+        time.sleep(3600)
+    time.sleep(0.01)
+    with open(log_path, 'a') as log:
+        log.write(f'done {url} {os.getpid()}\n')
+    return {'success': True, 'url': url, 'title': url[-11:]}
+
+
+def run_worker(path, log_path, worker_id, lease=60, hang=False):
+    store = JobStore(path, lease=lease)
+    try:
+        StoreWorker(store, functools.partial(fake_convert, log_path, hang), concurrency=2,
+                    worker_id=worker_id, poll_interval=0.05, exit_when_empty=True).run()
+    finally:
+        store.close()
+
+
+def read_log(log_path):
+    with open(log_path) as log:
+        return [line.split() for line in log]
+
+
+@pytest.fixture
+def spawn():
+    context = multiprocessing.get_context('spawn')
+    processes = []
+
+    def start(*args, **kwargs):
+        process = context.Process(target=run_worker, args=args, kwargs=kwargs)
+        process.start()
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+def test_every_item_completes_exactly_once(tmp_path, spawn):
+    path = str(tmp_path / 'store.sqlite3')
+    log_path = str(tmp_path / 'calls.log')
+    urls = [watch(i) for i in range(40)]
+    store = JobStore(path)
+    assert store.add(urls, {'codec': 'mp3', 'quality': '192'}) == (40, 0)
+
+    workers = [spawn(path, log_path, f'worker-{i}') for i in range(3)]
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    calls = read_log(log_path)
+    started = [url for event, url, _ in calls if event == 'start']
+    assert sorted(started) == sorted(urls)
+    assert sorted(url for event, url, _ in calls if event == 'done') == sorted(urls)
+    assert store.counts() == {DONE: 40}
+    results = store.results()
+    assert [r['url'] for r in results] == urls
+    assert all(r['attempts'] == 1 for r in results)
+    store.close()
+
+
+def test_expired_lease_is_reclaimed_after_a_worker_is_killed(tmp_path, spawn):
+    path = str(tmp_path / 'store.sqlite3')
+    log_path = str(tmp_path / 'calls.log')
+    store = JobStore(path, lease=1)
+    store.add([watch(1)])
+
+    stuck = spawn(path, log_path, 'stuck', lease=1, hang=True)
+    wait_for(lambda: os.path.exists(log_path) and read_log(log_path))
+    assert store.counts() == {CLAIMED: 1}
+    stuck.kill()
+    stuck.join()
+
+    rescuer = spawn(path, log_path, 'rescuer', lease=1)
+    rescuer.join(60)
+    assert rescuer.exitcode == 0
+
+    assert [event for event, _, _ in read_log(log_path)] == ['start', 'start', 'done']
+    [result] = store.results()
+    assert result['success']
+    assert result['worker'] == 'rescuer'
+    assert result['attempts'] == 2
+    store.close()
+
+
+def test_worker_retries_while_the_store_is_locked(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(job_store, 'STORE_RETRY_DELAY', 0.01)
+    store = JobStore(str(tmp_path / 'store.sqlite3'))
+    store.add([watch(1), watch(2)])
+
+    failures = {'claim': 1, 'complete': 2}
+
+    def flaky(name):
+        method = getattr(store, name)
+
+        def call(*args, **kwargs):
+            if failures[name]:
+                failures[name] -= 1
+                raise sqlite3.OperationalError('database is locked')
+            return method(*args, **kwargs)
+        return call
+
+    monkeypatch.setattr(store, 'claim', flaky('claim'))
+    monkeypatch.setattr(store, 'complete', flaky('complete'))
+    worker = StoreWorker(store, lambda url, options: {'success': True, 'url': url}, concurrency=1,
+                         poll_interval=0.01, exit_when_empty=True)
+    stats = worker.run()
+
+    assert stats == {'claimed': 2, 'done': 2, 'failed': 0, 'lost': 0}
+    assert store.counts() == {DONE: 2}
+    assert capsys.readouterr().out.count('database is locked') == 3
+    store.close()
+
+
+def test_run_finishes_items_in_progress_before_returning(tmp_path):
+    store = JobStore(str(tmp_path / 'store.sqlite3'))
+    store.add([watch(1)])
+    worker = None
+
+    def convert(url, options):
+        worker.stop()  # e.g. Ctrl+C while an item is converting
+        time.sleep(0.2)
+        return {'success': True, 'url': url}
+
+    worker = StoreWorker(store, convert, concurrency=1, poll_interval=0.01)
+    assert worker.run()['done'] == 1
+    assert store.counts() == {DONE: 1}
+    store.close()
@@ -0,0 +1,174 @@
+"""
+test_metadata_cache.py - TTL expiry, LRU eviction and the in-memory front layer
+"""
+import pytest
+
+import metadata_cache
+
+INFO = {'id': 'dQw4w9WgXcQ', 'title': 'Song', 'duration': 212}
+
+
+class Clock:
+    """Stands in for time.time(); advance() moves it forward"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metadata_cache.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = metadata_cache.configure(str(tmp_path), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        try:
+            cache.close()
+        except Exception:
+            pass
+    metadata_cache._default_cache = None
+
+
+def test_configure_uses_cache_dir(tmp_path, make_cache):
+    cache = make_cache()
+    assert metadata_cache.get_cache() is cache
+    assert cache.path == str(tmp_path / 'metadata.sqlite3')
+    assert (tmp_path / 'metadata.sqlite3').exists()
+
+
+def test_round_trip_and_miss(clock, make_cache):
+    cache = make_cache()
+    assert cache.get('dQw4w9WgXcQ') is None
+    cache.put('dQw4w9WgXcQ', INFO)
+    assert cache.get('dQw4w9WgXcQ') == INFO
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_entry_expires_after_ttl(clock, make_cache):
+    cache = make_cache(ttl=60)
+    cache.put('dQw4w9WgXcQ', INFO)
+
+    clock.advance(60)
+    assert cache.get('dQw4w9WgXcQ') == INFO
+
+    clock.advance(1)
+    assert cache.get('dQw4w9WgXcQ') is None
+    stats = cache.stats()
+    assert stats['expired'] == 1
+    assert stats['entries'] == 0
+
+
+def test_expiry_counts_from_store_time_not_last_access(clock, make_cache):
+    cache = make_cache(ttl=60, memory_entries=0)
+    cache.put('dQw4w9WgXcQ', INFO)
+    for _ in range(3):
+        clock.advance(20)
+        cache.get('dQw4w9WgXcQ')
+    clock.advance(1)
+    assert cache.get('dQw4w9WgXcQ') is None
+
+
+def test_expired_entry_in_memory_is_not_served(clock, make_cache):
+    cache = make_cache(ttl=60)
+    cache.put('dQw4w9WgXcQ', INFO)
+    assert 'dQw4w9WgXcQ' in cache._memory
+
+    clock.advance(61)
+    assert cache.get('dQw4w9WgXcQ') is None
+    assert 'dQw4w9WgXcQ' not in cache._memory
+    assert cache.stats()['memory_hits'] == 0
+
+
+def test_lru_evicts_least_recently_used(clock, make_cache):
+    cache = make_cache(max_entries=3)
+    for video_id in ('aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc'):
+        cache.put(video_id, {'id': video_id})
+        clock.advance(1)
+
+    # Touch the oldest entry in SQLite (bypass the memory layer)
+    cache._memory.clear()
+    assert cache.get('aaaaaaaaaaa') == {'id': 'aaaaaaaaaaa'}
+    clock.advance(1)
+
+    cache.put('ddddddddddd', {'id': 'ddddddddddd'})
+    cache._memory.clear()
+    assert cache.get('bbbbbbbbbbb') is None
+    for video_id in ('aaaaaaaaaaa', 'ccccccccccc', 'ddddddddddd'):
+        assert cache.get(video_id) == {'id': video_id}
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 3
+
+
+def test_eviction_also_drops_memory_copy(clock, make_cache):
+    cache = make_cache(max_entries=1)
+    cache.put('aaaaaaaaaaa', {'id': 'aaaaaaaaaaa'})
+    clock.advance(1)
+    cache.put('bbbbbbbbbbb', {'id': 'bbbbbbbbbbb'})
+    assert 'aaaaaaaaaaa' not in cache._memory
+    assert cache.get('aaaaaaaaaaa') is None
+
+
+def test_memory_layer_serves_repeat_lookups(clock, make_cache):
+    cache = make_cache()
+    cache.put('dQw4w9WgXcQ', INFO)
+    cache.get('dQw4w9WgXcQ')
+    cache.get('dQw4w9WgXcQ')
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['memory_hits'] == 2
+
+
+def test_memory_layer_is_filled_from_sqlite(clock, make_cache):
+    make_cache().put('dQw4w9WgXcQ', INFO)
+
+    # A fresh process: same file, empty memory layer
+    cache = make_cache()
+    assert cache.get('dQw4w9WgXcQ') == INFO
+    assert cache.get('dQw4w9WgXcQ') == INFO
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['memory_hits'] == 1
+
+
+def test_memory_layer_is_bounded(clock, make_cache):
+    cache = make_cache(memory_entries=2)
+    for video_id in ('aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc'):
+        cache.put(video_id, {'id': video_id})
+    assert list(cache._memory) == ['bbbbbbbbbbb', 'ccccccccccc']
+
+    # Dropped from memory, still in SQLite
+    assert cache.get('aaaaaaaaaaa') == {'id': 'aaaaaaaaaaa'}
+    assert cache.stats()['memory_hits'] == 0
+    assert list(cache._memory) == ['ccccccccccc', 'aaaaaaaaaaa']
+
+
+def test_invalidate_and_clear(clock, make_cache):
+    cache = make_cache()
+    cache.put('aaaaaaaaaaa', {'id': 'aaaaaaaaaaa'})
+    cache.put('bbbbbbbbbbb', {'id': 'bbbbbbbbbbb'})
+    cache.invalidate('aaaaaaaaaaa')
+    assert cache.get('aaaaaaaaaaa') is None
+    assert cache.get('bbbbbbbbbbb') == {'id': 'bbbbbbbbbbb'}
+
+    cache.clear()
+    assert cache.get('bbbbbbbbbbb') is None
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,130 @@
+"""
+test_playlist.py - Deduplication in playlist.expand_urls and paged listing in iter_entries
+"""
+import pytest
+
+import playlist
+import session_pool
+
+PLAYLIST = 'https://www.youtube.com/playlist?list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+
+
+def watch(video_id):
+    return f'https://www.youtube.com/watch?v={video_id}'
+
+
+def expand(monkeypatch, urls, entries):
+    monkeypatch.setattr(playlist, 'iter_entries', lambda url, depth=0: iter(entries))
+    return list(playlist.expand_urls(urls))
+
+
+def test_duplicates_are_dropped_across_urls_and_playlists(monkeypatch):
+    urls = [watch('dQw4w9WgXcQ'), PLAYLIST, 'https://youtu.be/dQw4w9WgXcQ']
+    entries = [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0'), watch('9bZkp7q19f0')]
+    assert expand(monkeypatch, urls, entries) == [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0')]
+
+
+def test_entries_without_a_video_id_are_all_kept(monkeypatch):
+    # Entry IDs that aren't 11 characters leave extract_video_id with None
+    entries = [watch('short'), watch('also-short'), watch('dQw4w9WgXcQ')]
+    assert expand(monkeypatch, [PLAYLIST], entries) == entries
+
+
+def test_on_expanded_counts_new_entries(monkeypatch):
+    counts = []
+    monkeypatch.setattr(playlist, 'iter_entries', lambda url, depth=0: iter([watch('dQw4w9WgXcQ'), watch('x')]))
+    list(playlist.expand_urls([watch('dQw4w9WgXcQ'), PLAYLIST],
+                              on_expanded=lambda url, count: counts.append((url, count))))
+    assert counts == [(PLAYLIST, 1)]
+
+
+class FakeYoutubeDL:
+    """Serves COLLECTIONS lazily, noting whether it was leased for each entry"""
+
+    def __init__(self, pool, collections):
+        self.pool = pool
+        self.collections = collections
+        self.extractions = 0
+        self.pulled_while_idle = 0
+
+    def extract_info(self, url, download=False, process=True):
+        self.extractions += 1
+        return {'entries': self._entries(url)}
+
+    def _entries(self, url):
+        for entry in self.collections[url]:
+            if any(self in idle for idle in self.pool._idle.values()):
+                self.pulled_while_idle += 1
+            yield entry
+
+
+@pytest.fixture
+def fake_pool():
+    created = []
+
+    def configure(collections, max_uses=session_pool.DEFAULT_MAX_USES):
+        def factory(opts):
+            created.append(FakeYoutubeDL(pool, collections))
+            return created[-1]
+
+        pool = session_pool.configure(factory, max_uses=max_uses)
+        return pool
+
+    yield configure, created
+    session_pool.configure()
+
+
+def entry(video_id, **extra):
+    return dict({'_type': 'url', 'id': video_id, 'url': watch(video_id)}, **extra)
+
+
+def test_entries_that_are_not_videos_are_skipped_or_expanded(fake_pool):
+    configure, _ = fake_pool
+    channel = 'https://www.youtube.com/@someone/videos'
+    configure({
+        PLAYLIST: [
+            {'_type': 'url', 'id': 'dQw4w9WgXcQ', 'url': ''},
+            # A channel ID and a shorts tab ID aren't video IDs
+            {'_type': 'url', 'id': 'UCuAXFkgsw1L7xaCfnd5JJOw', 'url': ''},
+            {'_type': 'url', 'id': 'UCuAXFkgsw1L7xaCfnd5JJOw-shorts', 'url': ''},
+            {'_type': 'url', 'id': 'someone', 'url': channel},
+        ],
+        channel: [entry('9bZkp7q19f0'), entry('a-_b-_c-_d-')],
+    })
+    assert list(playlist.iter_entries(PLAYLIST)) == [watch('dQw4w9WgXcQ'), watch('9bZkp7q19f0'),
+                                                      watch('a-_b-_c-_d-')]
+
+
+def test_lease_is_released_between_pages(fake_pool, monkeypatch):
+    configure, created = fake_pool
+    monkeypatch.setattr(playlist, 'PAGE_SIZE', 2)
+    ids = [f'video{n:04d}xx'[:11] for n in range(5)]
+    pool = configure({PLAYLIST: [entry(video_id) for video_id in ids]})
+
+    seen = []
+    for url in playlist.iter_entries(PLAYLIST):
+        # The consumer holds an entry: nothing is leased
+        assert pool.stats()['idle'] == 1
+        seen.append(url)
+    assert seen == [watch(video_id) for video_id in ids]
+    assert len(created) == 1
+    assert created[0].extractions == 1
+    assert created[0].pulled_while_idle == 0
+
+
+def test_listing_restarts_if_the_session_was_recycled_between_pages(fake_pool, monkeypatch):
+    configure, created = fake_pool
+    monkeypatch.setattr(playlist, 'PAGE_SIZE', 2)
+    ids = [f'video{n:04d}xx'[:11] for n in range(5)]
+    pool = configure({PLAYLIST: [entry(video_id) for video_id in ids]}, max_uses=2)
+
+    seen = []
+    for url in playlist.iter_entries(PLAYLIST):
+        seen.append(url)
+        if len(seen) == 2:
+            # Another listing leases the idle session and wears it out
+            with pool.session('playlist', playlist.FLAT_OPTS):
+                pass
+    assert seen == [watch(video_id) for video_id in ids]
+    assert len(created) == 2
+    assert created[1].extractions == 1
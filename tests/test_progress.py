@@ -0,0 +1,26 @@
+"""
+test_progress.py - ProgressTracker state and pruning of ended jobs
+"""
+import time
+
+import progress
+
+
+def test_prune_drops_only_jobs_ended_long_enough_ago():
+    tracker = progress.ProgressTracker()
+    tracker.finish('old')
+    tracker.finish('failed', success=False, error='x')
+    tracker.set_phase('running', progress.DOWNLOADING)
+    time.sleep(0.05)
+    tracker.finish('recent')
+    tracker.prune(older_than=0.03)
+    assert [job['job'] for job in tracker.snapshot()] == ['running', 'recent']
+
+
+def test_job_started_again_is_not_pruned():
+    tracker = progress.ProgressTracker()
+    tracker.finish('retried', success=False)
+    tracker.set_phase('retried', progress.DOWNLOADING)
+    time.sleep(0.02)
+    tracker.prune(older_than=0)
+    assert [job['job'] for job in tracker.snapshot()] == ['retried']
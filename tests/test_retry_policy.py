@@ -0,0 +1,244 @@
+"""
+test_retry_policy.py - Retries and rate limiting against a local HTTP stub
+"""
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import retry_policy
+import segmented
+import streaming
+
+BODY = b'x' * 4096
+
+
+class StubServer:
+    """Answers with the scripted status codes first, then 200 with BODY"""
+
+    def __init__(self, script=(), retry_after=None):
+        self.script = list(script)
+        self.retry_after = retry_after
+        self.requests = 0
+        self.times = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    stub.times.append(time.monotonic())
+                    status = stub.script.pop(0) if stub.script else 200
+                if status != 200:
+                    self.send_response(status)
+                    if status == 429 and stub.retry_after is not None:
+                        self.send_header('Retry-After', str(stub.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(BODY)))
+                self.end_headers()
+                self.wfile.write(BODY)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/media'
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def policy():
+    policy, _ = retry_policy.configure(max_attempts=3, base_delay=0.01, max_delay=0.5, rate=1000, burst=1000)
+    yield policy
+    retry_policy.configure()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(script=(), retry_after=None):
+        server = StubServer(script, retry_after)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def fetch(url, attempts=None):
+    return b''.join(streaming.iter_http(url, attempts=attempts))
+
+
+def test_5xx_is_retried(policy, serve):
+    server = serve([503, 500])
+    attempts = retry_policy.Attempts()
+    assert fetch(server.url, attempts) == BODY
+    assert server.requests == 3
+    assert attempts.retries == 2
+    assert not attempts.exhausted
+
+
+def test_429_backs_off_and_slows_the_host(policy, serve):
+    server = serve([429], retry_after=0.3)
+    attempts = retry_policy.Attempts()
+    assert fetch(server.url, attempts) == BODY
+    assert server.requests == 2
+    assert server.times[1] - server.times[0] >= 0.3  # Retry-After honoured
+    assert attempts.rate_limited == 1
+    assert retry_policy.get_limiter().rates()['127.0.0.1'] < 1000
+
+
+def test_gives_up_after_max_attempts(policy, serve):
+    server = serve([503] * 10)
+    attempts = retry_policy.Attempts()
+    with pytest.raises(urllib.error.HTTPError) as error:
+        fetch(server.url, attempts)
+    assert error.value.code == 503
+    assert server.requests == policy.max_attempts
+    assert attempts.retries == policy.max_attempts - 1
+    assert attempts.exhausted
+
+
+@pytest.mark.parametrize('status', [400, 403, 404])
+def test_4xx_is_not_retried(policy, serve, status):
+    server = serve([status])
+    attempts = retry_policy.Attempts()
+    with pytest.raises(urllib.error.HTTPError):
+        fetch(server.url, attempts)
+    assert server.requests == 1
+    assert attempts.retries == 0
+
+
+def test_call_does_not_retry_what_the_http_layer_gave_up_on(policy, serve, tmp_path):
+    server = serve([503] * 20)
+
+    def stage(url):
+        try:
+            segmented.download(url, str(tmp_path / 'out.bin'), connections=1)
+        except Exception as e:
+            return {'success': False, 'error': str(e), 'url': url}
+        return {'success': True, 'url': url}
+
+    result = retry_policy.call(stage, server.url)
+    assert not result['success']
+    assert result['error_kind'] == retry_policy.TRANSIENT
+    # One retry budget, not max_attempts x max_attempts requests
+    assert server.requests == policy.max_attempts
+    assert result['retries'] == policy.max_attempts - 1
+
+
+def test_call_retries_failures_outside_the_http_layer(policy):
+    outcomes = ['HTTP Error 503: Service Unavailable', 'timed out', None]
+
+    def stage(url):
+        error = outcomes.pop(0)
+        return {'success': error is None, 'error': error, 'url': url}
+
+    result = retry_policy.call(stage, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    assert result['success']
+    assert result['retries'] == 2
+
+
+def test_call_counts_http_retries_of_a_successful_stage(policy, serve):
+    server = serve([502])
+
+    def stage(url):
+        return {'success': fetch(url) == BODY, 'url': url}
+
+    result = retry_policy.call(stage, server.url)
+    assert result['success']
+    assert result['retries'] == 1
+    assert server.requests == 2
+
+
+def test_call_takes_no_token_without_a_request():
+    retry_policy.configure(rate=0.5, burst=1)
+    try:
+        started = time.monotonic()
+        for _ in range(3):
+            # e.g. served from the download archive or source cache
+            result = retry_policy.call(lambda url: {'success': True, 'url': url}, 'https://www.youtube.com/')
+            assert result['throttled'] == 0
+        assert time.monotonic() - started < 0.5
+    finally:
+        retry_policy.configure()
+
+
+def test_throttled_counts_into_the_bound_attempts():
+    retry_policy.configure(rate=20, burst=1)
+    try:
+        def stage(url):
+            for _ in range(2):
+                with retry_policy.throttled(url):
+                    pass
+            return {'success': True, 'url': url}
+
+        result = retry_policy.call(stage, 'https://www.youtube.com/')
+        assert result['throttled'] == 1
+        assert result['throttle_seconds'] > 0
+    finally:
+        retry_policy.configure()
+
+
+def test_throttled_adjusts_the_request_host_only():
+    _, limiter = retry_policy.configure(max_attempts=2, base_delay=0.01, rate=100, burst=100)
+    try:
+        def stage(url):
+            with retry_policy.throttled('https://media.example/v.webm'):
+                raise urllib.error.HTTPError(url, 429, 'Too Many Requests', {}, None)
+
+        result = retry_policy.call(stage, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        assert result['rate_limited'] == 2
+        rates = limiter.rates()
+        assert rates['media.example'] == 25
+        # call() never adjusted (or created) the page host's bucket
+        assert 'www.youtube.com' not in rates
+
+        with retry_policy.throttled('https://media.example/v.webm'):
+            pass
+        assert limiter.rates()['media.example'] > 25
+    finally:
+        retry_policy.configure()
+
+
+def test_call_leaves_page_host_alone_on_media_failures(policy, serve):
+    server = serve([429] * 10)
+    limiter = retry_policy.get_limiter()
+
+    def stage(url):
+        try:
+            fetch(server.url)
+        except Exception as e:
+            return {'success': False, 'error': str(e), 'url': url}
+        return {'success': True, 'url': url}
+
+    result = retry_policy.call(stage, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    assert not result['success']
+    assert result['rate_limited'] == policy.max_attempts
+    # Halved once per 429 by urlopen, not again by call()
+    assert limiter.rates()['127.0.0.1'] == 1000 / 2 ** policy.max_attempts
+    assert 'www.youtube.com' not in limiter.rates()
+
+
+def test_urlopen_uses_the_bound_attempts(policy, serve):
+    server = serve([500])
+    attempts = retry_policy.Attempts()
+    with retry_policy.bind(attempts):
+        with retry_policy.urlopen(urllib.request.Request(server.url)) as resp:
+            assert resp.read() == BODY
+    assert attempts.retries == 1
+    assert retry_policy.current_attempts() is None
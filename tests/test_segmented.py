@@ -0,0 +1,229 @@
+"""
+test_segmented.py - Segmented downloads and resuming .part files against a local HTTP stub
+"""
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import retry_policy
+import segmented
+
+BODY = bytes(range(256)) * 40  # 10240 bytes
+MIN_SEGMENT = 1024
+
+
+class RangeServer:
+    """
+    Serves BODY, honouring Range unless ranges is False
+
+    Requests for a range starting at or after fail_from get a 404.
+    """
+
+    def __init__(self, ranges=True, fail_from=None):
+        self.ranges = ranges
+        self.fail_from = fail_from
+        self.requested = []  # (start, end) per Range request, end None if open
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+                if not match or not stub.ranges:
+                    self._send(200, BODY)
+                    return
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else None
+                with stub._lock:
+                    stub.requested.append((start, end))
+                if stub.fail_from is not None and start >= stub.fail_from:
+                    self._send(404, b'')
+                    return
+                if start >= len(BODY):
+                    self._send(416, b'', {'Content-Range': f'bytes */{len(BODY)}'})
+                    return
+                end = min(len(BODY) - 1, end if end is not None else len(BODY) - 1)
+                self._send(206, BODY[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(BODY)}'})
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/media'
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def fetched(self):
+        """Range requests other than the 0-0 probe"""
+        return [requested for requested in self.requested if requested != (0, 0)]
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def policy():
+    policy, _ = retry_policy.configure(max_attempts=2, base_delay=0.01, max_delay=0.1, rate=1000, burst=1000)
+    yield policy
+    retry_policy.configure()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server = RangeServer(**kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def download(server, path, connections=4):
+    return segmented.download(server.url, str(path), connections=connections, min_segment=MIN_SEGMENT)
+
+
+def test_segmented_download_leaves_no_partial_files(serve, tmp_path):
+    server = serve()
+    path = tmp_path / 'a.source.webm'
+
+    result = download(server, path)
+
+    assert path.read_bytes() == BODY
+    assert result == {'bytes': len(BODY), 'connections': 4, 'segmented': True, 'resumed': 0}
+    assert os.listdir(tmp_path) == ['a.source.webm']
+
+
+def test_failure_keeps_part_and_segment_map(serve, tmp_path):
+    server = serve(fail_from=len(BODY) // 2)
+    path = tmp_path / 'a.source.webm'
+
+    with pytest.raises(Exception):
+        download(server, path)
+
+    part = tmp_path / 'a.source.webm.part'
+    assert part.stat().st_size == len(BODY)
+    saved = json.loads((tmp_path / ('a.source.webm' + segmented.SEGMENTS_SUFFIX)).read_text())
+    assert saved['total'] == len(BODY)
+    data = part.read_bytes()
+    for start, end, position in saved['segments']:
+        assert data[start:position] == BODY[start:position]
+
+
+def test_segmented_resume_fetches_only_missing_ranges(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    with pytest.raises(Exception):
+        download(serve(fail_from=len(BODY) // 2), path)
+    saved = json.loads((tmp_path / ('a.source.webm' + segmented.SEGMENTS_SUFFIX)).read_text())
+    missing = [(position, end) for _, end, position in saved['segments'] if position <= end]
+
+    server = serve()
+    result = download(server, path)
+
+    assert path.read_bytes() == BODY
+    assert sorted(server.fetched()) == missing
+    assert result['connections'] == len(saved['segments'])
+    assert result['resumed'] == len(BODY) - sum(end - position + 1 for position, end in missing)
+    assert os.listdir(tmp_path) == ['a.source.webm']
+
+
+def test_resume_with_nothing_missing_reports_all_ranges(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    (tmp_path / 'a.source.webm.part').write_bytes(BODY)
+    layout = [[start, end, end + 1] for start, end in segmented.split(len(BODY), 4, MIN_SEGMENT)]
+    (tmp_path / ('a.source.webm' + segmented.SEGMENTS_SUFFIX)).write_text(
+        json.dumps({'total': len(BODY), 'segments': layout}))
+    server = serve()
+
+    result = download(server, path)
+
+    assert path.read_bytes() == BODY
+    assert result == {'bytes': len(BODY), 'connections': 4, 'segmented': True, 'resumed': len(BODY)}
+    assert server.fetched() == []
+
+
+def test_prefix_part_is_counted_as_received(serve, tmp_path):
+    # e.g. yt-dlp's own .part from an earlier attempt
+    path = tmp_path / 'a.source.webm'
+    (tmp_path / 'a.source.webm.part').write_bytes(BODY[:6000])
+    server = serve()
+
+    result = download(server, path)
+
+    assert path.read_bytes() == BODY
+    assert result['resumed'] == 6000
+    assert all(start >= 6000 for start, _ in server.fetched())
+
+
+def test_single_stream_resumes_with_open_range(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    (tmp_path / 'a.source.webm.part').write_bytes(BODY[:3000])
+    server = serve()
+
+    result = download(server, path, connections=1)
+
+    assert path.read_bytes() == BODY
+    assert result == {'bytes': len(BODY), 'connections': 1, 'segmented': False, 'resumed': 3000}
+    assert server.requested == [(3000, None)]
+
+
+def test_single_stream_resume_when_server_ignores_range(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    (tmp_path / 'a.source.webm.part').write_bytes(BODY[:3000])
+
+    download(serve(ranges=False), path)
+
+    assert path.read_bytes() == BODY
+
+
+def test_single_stream_complete_part_is_kept(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    (tmp_path / 'a.source.webm.part').write_bytes(BODY)
+
+    result = download(serve(), path, connections=1)
+
+    assert path.read_bytes() == BODY
+    assert result['resumed'] == len(BODY)
+
+
+def test_single_stream_discards_preallocated_part(serve, tmp_path):
+    path = tmp_path / 'a.source.webm'
+    with pytest.raises(Exception):
+        download(serve(fail_from=len(BODY) // 2), path)
+
+    server = serve()
+    result = download(server, path, connections=1)
+
+    assert path.read_bytes() == BODY
+    assert result['resumed'] == 0
+    assert server.requested == []
+    assert os.listdir(tmp_path) == ['a.source.webm']
+
+
+def test_discard_preallocated_only_removes_segmented_parts(tmp_path):
+    path = str(tmp_path / 'a.source.webm')
+    with open(path + '.part', 'wb') as f:
+        f.write(BODY[:100])
+    assert not segmented.discard_preallocated(path)
+    assert os.path.exists(path + '.part')
+
+    with open(path + segmented.SEGMENTS_SUFFIX, 'w') as f:
+        f.write('{}')
+    assert segmented.discard_preallocated(path)
+    assert os.listdir(tmp_path) == []
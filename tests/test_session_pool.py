@@ -0,0 +1,71 @@
+"""
+test_session_pool.py - Leasing, reuse and re-leasing a particular session
+"""
+import threading
+import time
+
+import session_pool
+
+
+class FakeSession:
+    def __init__(self, opts):
+        self.opts = opts
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_sessions_are_reused_per_profile():
+    pool = session_pool.SessionPool(FakeSession)
+    with pool.session('info', {}) as first:
+        pass
+    with pool.session('info', {}) as second:
+        assert second is first
+    with pool.session('audio', {}) as other:
+        assert other is not first
+    assert pool.stats()['created'] == 2
+
+
+def test_instance_is_leased_again_without_counting_a_use():
+    pool = session_pool.SessionPool(FakeSession, max_uses=2)
+    with pool.session('playlist', {}) as first:
+        pass
+    for _ in range(5):
+        with pool.session('playlist', {}, instance=first) as again:
+            assert again is first
+    assert not first.closed
+
+
+def test_instance_waits_while_another_thread_holds_it():
+    pool = session_pool.SessionPool(FakeSession)
+    with pool.session('playlist', {}) as first:
+        pass
+    leased = threading.Event()
+    release = threading.Event()
+
+    def other():
+        with pool.session('playlist', {}) as session:
+            assert session is first
+            leased.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    leased.wait(5)
+    threading.Timer(0.2, release.set).start()
+    started = time.monotonic()
+    with pool.session('playlist', {}, instance=first) as again:
+        assert again is first
+        assert time.monotonic() - started >= 0.15
+    thread.join()
+
+
+def test_closed_instance_is_replaced():
+    pool = session_pool.SessionPool(FakeSession)
+    with pool.session('playlist', {}) as first:
+        pass
+    pool.close()
+    assert first.closed
+    with pool.session('playlist', {}, instance=first) as again:
+        assert again is not first
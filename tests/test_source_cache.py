@@ -0,0 +1,117 @@
+"""
+test_source_cache.py - Pins, eviction and audio fallback in the source cache
+"""
+import multiprocessing
+import os
+
+import pytest
+
+from source_cache import SourceCache
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+def audio(format_id, abr, acodec='opus'):
+    return {'format_id': format_id, 'acodec': acodec, 'vcodec': 'none', 'abr': abr}
+
+
+def download(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SourceCache(str(tmp_path / 'sources'), max_bytes=250)
+    yield cache
+    cache.close()
+
+
+def test_put_then_acquire(cache, tmp_path):
+    stored = cache.put(VIDEO_ID, audio('251', 160), download(tmp_path, 'a.webm'))
+    cache.release(stored)
+
+    hit = cache.acquire(VIDEO_ID, '251')
+    assert hit['filename'] == stored
+    assert (hit['format_id'], hit['size'], hit['abr']) == ('251', 100, 160)
+    cache.release(stored)
+    assert cache.acquire(VIDEO_ID, '140') is None
+    assert cache.acquire('9bZkp7q19f0', '251') is None
+
+
+def test_deleted_file_is_a_miss(cache, tmp_path):
+    stored = cache.put(VIDEO_ID, audio('251', 160), download(tmp_path, 'a.webm'))
+    cache.release(stored)
+    os.remove(stored)
+    assert cache.acquire(VIDEO_ID, '251') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_eviction_skips_pinned_entries(cache, tmp_path):
+    first = cache.put('aaaaaaaaaaa', audio('251', 160), download(tmp_path, 'a.webm'))
+    second = cache.put('bbbbbbbbbbb', audio('251', 160), download(tmp_path, 'b.webm'))
+    cache.release(second)
+    # first is still pinned: the unpinned second goes instead
+    third = cache.put('ccccccccccc', audio('251', 160), download(tmp_path, 'c.webm'))
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert os.path.exists(third)
+
+
+@pytest.mark.parametrize('fallback_abr, expected', [
+    (None, None),      # no fallback asked for
+    (128, '251'),      # the best cached audio is good enough
+    (160, '251'),
+    (192, None),       # nothing cached is as good as what would be downloaded
+])
+def test_audio_fallback_needs_the_same_bitrate_or_better(cache, tmp_path, fallback_abr, expected):
+    for format_id, abr in (('249', 50), ('251', 160)):
+        cache.release(cache.put(VIDEO_ID, audio(format_id, abr), download(tmp_path, f'{format_id}.webm', 10)))
+    video = {'format_id': '137', 'acodec': 'none', 'vcodec': 'avc1', 'abr': None}
+    cache.release(cache.put(VIDEO_ID, video, download(tmp_path, 'v.mp4', 10)))
+
+    hit = cache.acquire(VIDEO_ID, '140', fallback_abr=fallback_abr)
+    assert (hit and hit['format_id']) == expected
+
+
+def pin_in_other_process(directory, format_id, pinned, done):
+    cache = SourceCache(directory, max_bytes=250)
+    try:
+        assert cache.acquire(VIDEO_ID, format_id) is not None
+        pinned.set()
+        done.wait(30)
+    finally:
+        cache.close()
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='flock pins')
+def test_pin_in_another_process_blocks_eviction(tmp_path):
+    directory = str(tmp_path / 'sources')
+    cache = SourceCache(directory, max_bytes=250)
+    try:
+        shared = cache.put(VIDEO_ID, audio('251', 160), download(tmp_path, 'a.webm'))
+        cache.release(shared)
+
+        context = multiprocessing.get_context('spawn')
+        pinned, done = context.Event(), context.Event()
+        process = context.Process(target=pin_in_other_process, args=(directory, '251', pinned, done))
+        process.start()
+        try:
+            assert pinned.wait(30)
+            # Over the limit twice; the least recently used entry is pinned
+            # elsewhere, so it is never the one evicted
+            for name in ('bbbbbbbbbbb', 'ccccccccccc'):
+                cache.release(cache.put(name, audio('251', 160), download(tmp_path, f'{name}.webm')))
+            assert os.path.exists(shared)
+            assert not os.path.exists(os.path.join(directory, 'bbbbbbbbbbb.251.webm'))
+        finally:
+            done.set()
+            process.join(30)
+        assert process.exitcode == 0
+
+        # Unpinned everywhere now, so it can go
+        cache.release(cache.put('ddddddddddd', audio('251', 160), download(tmp_path, 'd.webm')))
+        assert not os.path.exists(shared)
+    finally:
+        cache.close()
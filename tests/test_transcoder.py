@@ -0,0 +1,106 @@
+"""
+test_transcoder.py - FFmpeg runs against a stand-in ffmpeg script
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import profiler
+import transcoder
+
+# Burns CPU, logs to stderr, reads stdin when asked to and writes the output
+# file; exits with $FAKE_FFMPEG_EXIT
+FAKE_FFMPEG = '''#!{python}
+import os, sys, time
+started = time.process_time()
+while time.process_time() - started < float(os.environ.get('FAKE_FFMPEG_CPU', '0')):
+    pass
+if 'pipe:0' in sys.argv:
+    sys.stdin.buffer.read()
+sys.stderr.write('fake ffmpeg log\\n')
+open(sys.argv[-1], 'w').write('x')
+sys.exit(int(os.environ.get('FAKE_FFMPEG_EXIT', '0')))
+'''
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='stand-in ffmpeg is a POSIX script')
+
+
+@pytest.fixture
+def ffmpeg_dir(tmp_path):
+    path = tmp_path / 'ffmpeg'
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    path.chmod(0o755)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def active_profiler(tmp_path):
+    active = profiler.Profiler(directory=str(tmp_path / 'profiles')).start()
+    yield active
+    active.stop()
+
+
+def test_run_ffmpeg_returns_stderr(ffmpeg_dir, tmp_path):
+    target = str(tmp_path / 'out.mp3')
+    proc = transcoder.run_ffmpeg(['-i', 'in.webm', target], ffmpeg_dir)
+    assert proc.returncode == 0
+    assert b'fake ffmpeg log' in proc.stderr
+    assert os.path.exists(target)
+
+
+def test_run_ffmpeg_raises_on_failure(ffmpeg_dir, tmp_path, monkeypatch):
+    monkeypatch.setenv('FAKE_FFMPEG_EXIT', '3')
+    with pytest.raises(transcoder.TranscodeError, match='fake ffmpeg log'):
+        transcoder.run_ffmpeg(['-i', 'in.webm', str(tmp_path / 'out.mp3')], ffmpeg_dir)
+
+
+def test_encode_job_streams_into_stdin(ffmpeg_dir, tmp_path):
+    target = str(tmp_path / 'out.mp3')
+    mode, written = transcoder.EncodeJob('mp3', '192').stream(iter([b'a' * 10, b'b' * 5]), target, ffmpeg_dir)
+    assert (mode, written) == ('encode', 15)
+    assert os.path.exists(target)
+
+
+def test_encode_job_copies_a_matching_source(ffmpeg_dir, tmp_path):
+    job = transcoder.EncodeJob('opus', '160')
+    assert job.run('in.webm', str(tmp_path / 'out.opus'), ffmpeg_dir, source_acodec='opus', source_abr=150) == 'copy'
+    assert job.run('in.webm', str(tmp_path / 'out.opus'), ffmpeg_dir, source_acodec='opus', source_abr=256) == 'encode'
+
+
+def test_ffmpeg_missing(tmp_path):
+    with pytest.raises(transcoder.TranscodeError, match='not found'):
+        transcoder.run_ffmpeg(['-i', 'in.webm', 'out.mp3'], str(tmp_path / 'nowhere'))
+
+
+def test_profiler_records_ffmpeg_cpu_time(ffmpeg_dir, tmp_path, monkeypatch, active_profiler):
+    monkeypatch.setenv('FAKE_FFMPEG_CPU', '0.2')
+    transcoder.run_ffmpeg(['-i', 'in.webm', str(tmp_path / 'a.mp3')], ffmpeg_dir)
+    transcoder.EncodeJob('mp3', '192').stream(iter([b'x' * 10]), str(tmp_path / 'b.mp3'), ffmpeg_dir)
+    active_profiler.stop()
+
+    report = active_profiler.report()
+    assert report['thread_seconds'].get('ffmpeg', 0) > 0
+    ffmpeg = report['ffmpeg']
+    assert ffmpeg['calls'] == 2
+    assert [p['output'] for p in ffmpeg['slowest']] in (['a.mp3', 'b.mp3'], ['b.mp3', 'a.mp3'])
+    for process in ffmpeg['slowest']:
+        assert process['user_seconds'] + process['system_seconds'] >= 0.15
+    assert ffmpeg['cpu_seconds'] >= 0.3
+
+
+def test_only_piped_writes_count_as_ffmpeg(active_profiler):
+    def spin():
+        started = time.time()
+        while time.time() - started < 0.2:
+            transcoder.audio_args('mp3', '192', {'title': 'x'})
+
+    thread = threading.Thread(target=spin, name='transcode_0')
+    thread.start()
+    thread.join()
+    active_profiler.stop()
+    states = active_profiler.report()['thread_seconds']
+    assert states.get('python', 0) > 0
+    assert 'ffmpeg' not in states
@@ -0,0 +1,126 @@
+"""
+test_url_parser.py - url_parser.parse against a corpus of URL shapes
+
+Every accepted form, tracking parameters, timestamps, look-alike hosts and
+malformed IDs.
+"""
+import pytest
+
+import url_parser
+from batch_processor import extract_video_id
+
+ID = 'dQw4w9WgXcQ'
+PL = 'PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+UC = 'UCuAXFkgsw1L7xaCfnd5JJOw'
+
+# (url, expected (kind, video_id, playlist_id, start) or None for rejected)
+CORPUS = [
+    # Watch URLs on every host form
+    (f'https://www.youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'http://www.youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'https://youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'www.youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'https://m.youtube.com/watch?v={ID}', ('video', ID, None, None)),
+    (f'https://music.youtube.com/watch?v={ID}&feature=share', ('video', ID, None, None)),
+    (f'HTTPS://WWW.YOUTUBE.COM/watch?v={ID}', ('video', ID, None, None)),
+    (f'  https://www.youtube.com/watch?v={ID}  ', ('video', ID, None, None)),
+    (f'https://www.youtube.com/watch/?v={ID}', ('video', ID, None, None)),
+    # Parameter order, tracking parameters, playlists and timestamps
+    (f'https://www.youtube.com/watch?feature=youtu.be&v={ID}', ('video', ID, None, None)),
+    (f'https://www.youtube.com/watch?v={ID}&si=AbCdEf123', ('video', ID, None, None)),
+    (f'https://www.youtube.com/watch?v={ID}&list={PL}&index=4', ('video', ID, PL, None)),
+    (f'https://www.youtube.com/watch?list={PL}&v={ID}', ('video', ID, PL, None)),
+    (f'https://www.youtube.com/watch?v={ID}&t=42', ('video', ID, None, 42)),
+    (f'https://www.youtube.com/watch?v={ID}&t=42s', ('video', ID, None, 42)),
+    (f'https://www.youtube.com/watch?v={ID}&t=1m30s', ('video', ID, None, 90)),
+    (f'https://www.youtube.com/watch?v={ID}&t=1h2m3s', ('video', ID, None, 3723)),
+    (f'https://www.youtube.com/watch?v={ID}#t=2m', ('video', ID, None, 120)),
+    (f'https://www.youtube.com/watch?v={ID}&t=soon', ('video', ID, None, None)),
+    (f'https://www.youtube.com/watch?v={ID}&time_continue=15', ('video', ID, None, 15)),
+    # Short links
+    (f'https://youtu.be/{ID}', ('video', ID, None, None)),
+    (f'youtu.be/{ID}', ('video', ID, None, None)),
+    (f'https://youtu.be/{ID}?t=10', ('video', ID, None, 10)),
+    (f'https://youtu.be/{ID}?si=tracking&t=5', ('video', ID, None, 5)),
+    (f'https://youtu.be/{ID}?list={PL}', ('video', ID, PL, None)),
+    (f'https://youtu.be/{ID}/', ('video', ID, None, None)),
+    # Path forms
+    (f'https://www.youtube.com/shorts/{ID}', ('video', ID, None, None)),
+    (f'https://youtube.com/shorts/{ID}?feature=share', ('video', ID, None, None)),
+    (f'https://m.youtube.com/shorts/{ID}/', ('video', ID, None, None)),
+    (f'https://www.youtube.com/embed/{ID}', ('video', ID, None, None)),
+    (f'https://www.youtube.com/embed/{ID}?start=30', ('video', ID, None, 30)),
+    (f'https://www.youtube-nocookie.com/embed/{ID}', ('video', ID, None, None)),
+    (f'https://www.youtube.com/live/{ID}', ('video', ID, None, None)),
+    (f'https://www.youtube.com/live/{ID}?si=x&t=600', ('video', ID, None, 600)),
+    (f'https://www.youtube.com/v/{ID}', ('video', ID, None, None)),
+    (f'https://www.youtube.com/e/{ID}', ('video', ID, None, None)),
+    # Playlists
+    (f'https://www.youtube.com/playlist?list={PL}', ('playlist', None, PL, None)),
+    (f'https://youtube.com/playlist?list={PL}&si=abc', ('playlist', None, PL, None)),
+    (f'https://music.youtube.com/playlist?list=OLAK5uy_abc123', ('playlist', None, 'OLAK5uy_abc123', None)),
+    (f'https://www.youtube.com/playlist?feature=share&list={PL}', ('playlist', None, PL, None)),
+    (f'https://www.youtube.com/embed/videoseries?list={PL}', ('playlist', None, PL, None)),
+    (f'https://www.youtube.com/watch?list={PL}', ('playlist', None, PL, None)),
+    # Channels
+    ('https://www.youtube.com/@SomeHandle', ('channel', None, None, None)),
+    ('https://www.youtube.com/@some.handle/videos', ('channel', None, None, None)),
+    ('https://www.youtube.com/@SomeHandle/shorts', ('channel', None, None, None)),
+    ('https://m.youtube.com/@SomeHandle/streams?view=0', ('channel', None, None, None)),
+    (f'https://www.youtube.com/channel/{UC}', ('channel', None, None, None)),
+    (f'https://www.youtube.com/channel/{UC}/playlists', ('channel', None, None, None)),
+    ('https://www.youtube.com/c/SomeName', ('channel', None, None, None)),
+    ('https://www.youtube.com/user/SomeUser/videos', ('channel', None, None, None)),
+    # Rejected: wrong host, look-alikes, malformed IDs, unsupported pages
+    ('', None),
+    ('not a url', None),
+    (ID, None),
+    (f'https://example.com/watch?v={ID}', None),
+    (f'https://www.youtube.com.evil.example/watch?v={ID}', None),
+    (f'https://notyoutube.com/watch?v={ID}', None),
+    (f'https://youtu.be.evil.example/{ID}', None),
+    (f'https://vimeo.com/{ID}', None),
+    ('https://www.youtube.com/watch?v=short', None),
+    (f'https://www.youtube.com/watch?v={ID}X', None),
+    (f'https://youtu.be/{ID}X', None),
+    (f'https://www.youtube.com/watch?vv={ID}', None),
+    ('https://www.youtube.com/watch', None),
+    ('https://www.youtube.com/', None),
+    ('https://www.youtube.com/results?search_query=music', None),
+    ('https://www.youtube.com/feed/subscriptions', None),
+    ('https://www.youtube.com/playlist', None),
+    ('https://www.youtube.com/channel/UCtooShort', None),
+    (f'https://www.youtube.com/shorts/{ID}X', None),
+]
+
+
+def _ids(corpus):
+    return [url or '<empty>' for url, expected in corpus]
+
+
+@pytest.mark.parametrize('url, expected', CORPUS, ids=_ids(CORPUS))
+def test_parse(url, expected):
+    parsed = url_parser.parse(url)
+    got = None if parsed is None else (parsed.kind, parsed.video_id, parsed.playlist_id, parsed.start)
+    assert got == expected
+
+
+@pytest.mark.parametrize('url, expected', CORPUS, ids=_ids(CORPUS))
+def test_extract_video_id(url, expected):
+    assert extract_video_id(url) == (expected[1] if expected else None)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('dQw4w9WgXcQ', True),
+    ('-_-_-_-_-_-', True),
+    ('dQw4w9WgXc', False),
+    ('dQw4w9WgXcQQ', False),
+    ('UCuAXFkgsw1L7xaCfnd5JJOw', False),
+    ('PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf', False),
+    ('dQw4w9WgX!Q', False),
+    ('', False),
+    (None, False),
+])
+def test_is_video_id(value, expected):
+    assert url_parser.is_video_id(value) is expected
@@ -0,0 +1,504 @@
+"""
+tracing.py - Per-job stage spans, Prometheus metrics and OpenTelemetry JSON traces
+
+Each conversion job (keyed by URL, like progress) gets a trace. The stages
+open spans around the work they do:
+
+    extract    metadata extraction (metadata cache hits don't count)
+    download   fetching one source stream (bytes = file size)
+    transcode  the FFmpeg encode, stream copy or MP4 merge (bytes = output size)
+    archive    checksumming the output and writing its download archive row
+    move       moving a fresh download into the source cache
+
+Spans opened while retry_policy.call is retrying carry the attempt number,
+and the ones after the first attempt count as retries. Spans opened inside
+another span on the same thread become its children; the rest hang off the
+job's root span.
+
+Every finished span feeds the process-wide Metrics registry (per-stage
+histograms and byte/error/retry counters, rendered in the Prometheus text
+format). finish(result) closes the job. It adds per-stage totals to the
+result as 'stages', so they end up in batch_results.json, and it appends
+the trace to the trace file, if one is configured, as one OTLP/JSON
+ExportTraceServiceRequest per line.
+"""
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+EXTRACT = 'extract'
+DOWNLOAD = 'download'
+TRANSCODE = 'transcode'
+ARCHIVE = 'archive'
+MOVE = 'move'
+STAGES = (EXTRACT, DOWNLOAD, TRANSCODE, ARCHIVE, MOVE)
+
+# Histogram bucket bounds in seconds (Prometheus 'le')
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+MAX_ACTIVE_TRACES = 10000  # jobs nobody called finish() for are dropped beyond this
+SERVICE_NAME = 'yt2mp3'
+PERCENTILE_RESOLUTION = 1.02  # StageSummary p50/p95 are within 2%
+
+
+class Span:
+    """One timed piece of work; set() attaches attributes (bytes, mode, ...)"""
+
+    def __init__(self, name, job, trace_id, parent_id, attributes):
+        self.name = name
+        self.job = job
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.seconds = None
+        self._started = time.perf_counter()
+        self.set(**attributes)
+
+    def set(self, **attributes):
+        self.attributes.update((k, v) for k, v in attributes.items() if v is not None)
+
+    def end(self):
+        if self.end_ns is None:
+            self.seconds = time.perf_counter() - self._started
+            self.end_ns = self.start_ns + int(self.seconds * 1e9)
+
+    def otlp(self):
+        """The span as an OTLP/JSON span object"""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _Trace:
+    def __init__(self, job):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span('job', job, self.trace_id, None, {'url': job})
+        self.spans = []
+
+
+class Metrics:
+    """
+    Process-wide counters and histograms, rendered as Prometheus text
+
+    Args:
+        buckets: Upper bounds (seconds) of the duration histogram buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._jobs = {}
+        self._job_seconds = self._histogram()
+        self._lock = threading.Lock()
+
+    def observe_span(self, span):
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = dict(self._histogram(), bytes=0, errors=0, retries=0)
+            self._observe(stage, span.seconds)
+            stage['bytes'] += span.attributes.get('bytes') or 0
+            stage['errors'] += bool(span.error)
+            stage['retries'] += (span.attributes.get('attempt') or 1) > 1
+
+    def observe_job(self, outcome, seconds=None):
+        """outcome: 'succeeded', 'failed' or 'skipped'"""
+        with self._lock:
+            self._jobs[outcome] = self._jobs.get(outcome, 0) + 1
+            if seconds is not None:
+                self._observe(self._job_seconds, seconds)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            stages = {name: dict(stage, counts=list(stage['counts'])) for name, stage in self._stages.items()}
+            jobs = dict(self._jobs)
+            job_seconds = dict(self._job_seconds, counts=list(self._job_seconds['counts']))
+
+        lines = ['# HELP yt2mp3_jobs_total Finished conversion jobs by outcome',
+                 '# TYPE yt2mp3_jobs_total counter']
+        lines += [f'yt2mp3_jobs_total{{outcome="{outcome}"}} {count}' for outcome, count in sorted(jobs.items())]
+        lines += ['# HELP yt2mp3_job_seconds Wall time of converted jobs (archive hits excluded)',
+                  '# TYPE yt2mp3_job_seconds histogram']
+        lines += self._render_histogram('yt2mp3_job_seconds', '', job_seconds)
+        lines += ['# HELP yt2mp3_stage_seconds Time spent per conversion stage',
+                  '# TYPE yt2mp3_stage_seconds histogram']
+        for name, stage in sorted(stages.items()):
+            lines += self._render_histogram('yt2mp3_stage_seconds', f'stage="{name}"', stage)
+        for metric, key, text in (('bytes', 'bytes', 'Bytes downloaded, written or moved per stage'),
+                                  ('errors', 'errors', 'Failed stage spans'),
+                                  ('retries', 'retries', 'Stage spans run by a retry')):
+            lines += [f'# HELP yt2mp3_stage_{metric}_total {text}',
+                      f'# TYPE yt2mp3_stage_{metric}_total counter']
+            lines += [f'yt2mp3_stage_{metric}_total{{stage="{name}"}} {stage[key]}'
+                      for name, stage in sorted(stages.items())]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write render() to a file atomically (e.g. for node_exporter's textfile collector)"""
+        temp = f'{path}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp, path)
+
+    def _histogram(self):
+        return {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+
+    def _observe(self, histogram, seconds):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        histogram['counts'][index] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+    def _render_histogram(self, metric, labels, histogram):
+        prefix = f'{labels},' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), histogram['counts']):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f"{metric}_sum{suffix} {histogram['sum']:.6f}")
+        lines.append(f"{metric}_count{suffix} {histogram['count']}")
+        return lines
+
+
+class Tracer:
+    """
+    Open traces per job, feeding finished spans to a Metrics registry
+
+    Args:
+        metrics: Registry to feed (default: a new one)
+        trace_file: Append each finished job's trace here as OTLP/JSON, one
+                    request per line (default: traces are not kept)
+        max_active: Unfinished traces kept before the oldest are dropped
+    """
+
+    def __init__(self, metrics=None, trace_file=None, max_active=MAX_ACTIVE_TRACES):
+        self.metrics = metrics or Metrics()
+        self.trace_file = trace_file
+        self.max_active = max_active
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, job=None, **attributes):
+        """
+        Time the enclosed block as a span of job's trace
+
+        job defaults to the job of the enclosing span on this thread. An
+        exception raised through the block marks the span failed.
+        """
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        if job is None and parent is not None:
+            job = parent.job
+        trace = self._trace(job) if job is not None else None
+        if parent is not None and parent.job == job:
+            parent_id = parent.span_id
+        else:
+            parent_id = trace.root.span_id if trace is not None else None
+        attributes.setdefault('attempt', getattr(_bound, 'attempt', None))
+        span = Span(name, job, trace.trace_id if trace is not None else secrets.token_hex(16),
+                    parent_id, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            if not stack:
+                _open_spans.pop(threading.get_ident(), None)
+            span.end()
+            self.metrics.observe_span(span)
+            if trace is not None:
+                with self._lock:
+                    trace.spans.append(span)
+
+    def finish(self, result):
+        """
+        Close the trace of a finished job result and return the result
+
+        The result gets 'stages' (see stage_totals; empty when no stage
+        ran). A result that already has them is returned as is, so nested
+        entry points can each finish the job.
+        """
+        if 'stages' in result:
+            return result
+        result['stages'] = {}
+        job = result.get('url')
+        with self._lock:
+            trace = self._traces.pop(job, None)
+        if result.get('skipped') and trace is None:
+            self.metrics.observe_job('skipped')
+            return result
+        outcome = 'succeeded' if result.get('success') else 'failed'
+        if trace is None:
+            self.metrics.observe_job(outcome)
+            return result
+
+        root = trace.root
+        root.end()
+        root.set(success=bool(result.get('success')), title=result.get('title'),
+                 retries=result.get('retries'))
+        if not result.get('success'):
+            root.error = result.get('error') or 'failed'
+        self.metrics.observe_job(outcome, root.seconds)
+        result['stages'] = stage_totals(trace.spans)
+        if self.trace_file:
+            self._export(trace)
+        return result
+
+    def _trace(self, job):
+        with self._lock:
+            trace = self._traces.get(job)
+            if trace is None:
+                trace = self._traces[job] = _Trace(job)
+                while len(self._traces) > self.max_active:
+                    self._traces.popitem(last=False)
+            return trace
+
+    def _export(self, trace):
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [trace.root.otlp()] + [span.otlp() for span in trace.spans],
+            }],
+        }]}
+        line = json.dumps(request, ensure_ascii=False, default=str) + '\n'
+        with self._file_lock:
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+def stage_totals(spans):
+    """
+    Per-stage totals of one job's spans
+
+    Returns:
+        dict: stage -> {'seconds', 'count', 'bytes', 'retries', 'errors'};
+              seconds are summed, so streams fetched in parallel add up
+    """
+    stages = {}
+    for span in spans:
+        stage = stages.setdefault(span.name, {'seconds': 0.0, 'count': 0, 'bytes': 0,
+                                              'retries': 0, 'errors': 0})
+        stage['seconds'] += span.seconds
+        stage['count'] += 1
+        stage['bytes'] += span.attributes.get('bytes') or 0
+        stage['retries'] += (span.attributes.get('attempt') or 1) > 1
+        stage['errors'] += bool(span.error)
+    for stage in stages.values():
+        stage['seconds'] = round(stage['seconds'], 3)
+    return stages
+
+
+class StageSummary:
+    """
+    Running per-stage totals over job results, in constant memory
+
+    add() each result as it finishes; summary() can be read at any point.
+    Durations go into log-spaced buckets PERCENTILE_RESOLUTION apart, so
+    p50/p95 are exact to within that ratio whatever the number of jobs.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, result):
+        with self._lock:
+            for name, stage in (result.get('stages') or {}).items():
+                totals = self._stages.get(name)
+                if totals is None:
+                    totals = self._stages[name] = {'jobs': 0, 'seconds': 0.0, 'max': 0.0, 'bytes': 0,
+                                                   'retries': 0, 'errors': 0, 'buckets': {}}
+                seconds = stage['seconds']
+                totals['jobs'] += 1
+                totals['seconds'] += seconds
+                totals['max'] = max(totals['max'], seconds)
+                for key in ('bytes', 'retries', 'errors'):
+                    totals[key] += stage[key]
+                bucket = _log_bucket(seconds)
+                totals['buckets'][bucket] = totals['buckets'].get(bucket, 0) + 1
+
+    def summary(self):
+        """
+        Returns:
+            dict: stage -> {'jobs', 'seconds', 'p50', 'p95', 'max', 'bytes',
+                  'retries', 'errors'}, in pipeline order
+        """
+        with self._lock:
+            summary = {}
+            for name in sorted(self._stages, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+                totals = self._stages[name]
+                summary[name] = {
+                    'jobs': totals['jobs'],
+                    'seconds': round(totals['seconds'], 3),
+                    'p50': _bucket_percentile(totals, 0.5),
+                    'p95': _bucket_percentile(totals, 0.95),
+                    'max': totals['max'],
+                    'bytes': totals['bytes'],
+                    'retries': totals['retries'],
+                    'errors': totals['errors'],
+                }
+            return summary
+
+
+def stage_summary(results):
+    """
+    Aggregate the 'stages' of many job results (see StageSummary)
+
+    Returns:
+        dict: stage -> {'jobs', 'seconds', 'p50', 'p95', 'max', 'bytes',
+              'retries', 'errors'}, in pipeline order
+    """
+    summary = StageSummary()
+    for result in results:
+        summary.add(result)
+    return summary.summary()
+
+
+def format_summary(summary):
+    """'download 1.2s p50 / 3.4s p95 (12.0 min total), ...' for stage_summary()"""
+    parts = []
+    for name, stage in summary.items():
+        part = f"{name} {stage['p50']:.2f}s p50 / {stage['p95']:.2f}s p95 ({_duration(stage['seconds'])} total"
+        if stage['retries']:
+            part += f", {stage['retries']} retries"
+        parts.append(part + ')')
+    return ', '.join(parts) or 'no stages ran'
+
+
+def _log_bucket(seconds):
+    """Index of the log-spaced bucket holding seconds (None for zero)"""
+    if seconds <= 0:
+        return None
+    return math.ceil(math.log(seconds, PERCENTILE_RESOLUTION))
+
+
+def _bucket_percentile(totals, fraction):
+    """Nearest-rank percentile from StageSummary buckets, as the bucket's upper bound"""
+    rank = min(totals['jobs'], max(1, round(fraction * totals['jobs'])))
+    seen = 0
+    for bucket in sorted(totals['buckets'], key=lambda b: float('-inf') if b is None else b):
+        seen += totals['buckets'][bucket]
+        if seen >= rank:
+            return 0.0 if bucket is None else min(totals['max'], PERCENTILE_RESOLUTION ** bucket)
+    return totals['max']
+
+
+def _duration(seconds):
+    if seconds >= 3600:
+        return f'{seconds / 3600:.1f} h'
+    if seconds >= 60:
+        return f'{seconds / 60:.1f} min'
+    return f'{seconds:.1f}s'
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+_bound = threading.local()
+# Thread ident -> open spans, innermost last. A plain dict rather than
+# thread-local state so a sampling profiler can see every thread's stage.
+_open_spans = {}
+
+
+def _stack():
+    return _open_spans.setdefault(threading.get_ident(), [])
+
+
+def active_stages():
+    """Thread ident -> name of the innermost span open on that thread"""
+    stages = {}
+    for ident, stack in list(_open_spans.items()):
+        top = stack[-1:]  # the owning thread may pop it meanwhile
+        if top:
+            stages[ident] = top[0].name
+    return stages
+
+
+def current_span():
+    """Innermost span open on this thread, or None"""
+    stack = _open_spans.get(threading.get_ident())
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def attempt(number):
+    """Tag spans opened on this thread with a retry_policy attempt number"""
+    previous = getattr(_bound, 'attempt', None)
+    _bound.attempt = number
+    try:
+        yield
+    finally:
+        _bound.attempt = previous
+
+
+def current_attempt():
+    """Attempt number bound to this thread, for work handed to other threads"""
+    return getattr(_bound, 'attempt', None)
+
+
+_default_tracer = Tracer()
+
+
+def get_tracer():
+    """Shared process-wide tracer"""
+    return _default_tracer
+
+
+def get_metrics():
+    """Shared process-wide metrics registry"""
+    return _default_tracer.metrics
+
+
+def span(name, job=None, **attributes):
+    """Tracer.span on the shared tracer"""
+    return _default_tracer.span(name, job, **attributes)
+
+
+def finish(result):
+    """Tracer.finish on the shared tracer"""
+    return _default_tracer.finish(result)
+
+
+def configure(trace_file=None, metrics=None):
+    """
+    Replace the shared tracer, e.g. to start writing traces
+
+    The metrics registry is kept (counters keep counting) unless one is passed.
+    """
+    global _default_tracer
+    _default_tracer = Tracer(metrics or _default_tracer.metrics, trace_file)
+    return _default_tracer
@@ -0,0 +1,529 @@
+"""
+transcoder.py - FFmpeg helpers used by the conversion pipeline
+"""
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import profiler
+
+
+class TranscodeError(Exception):
+    """Raised when an FFmpeg invocation fails"""
+
+
+def ffmpeg_binary(ffmpeg_location=None):
+    """Return the ffmpeg executable to run, honouring an optional folder"""
+    if ffmpeg_location:
+        for name in ('ffmpeg.exe', 'ffmpeg'):
+            candidate = os.path.join(ffmpeg_location, name)
+            if os.path.exists(candidate):
+                return candidate
+    return 'ffmpeg'
+
+
+_ffmpeg_checks = {}
+_ffmpeg_checks_lock = threading.Lock()
+
+
+def ffmpeg_available(ffmpeg_location=None):
+    """
+    True if ffmpeg can be run, checked once per location and cached
+
+    A binary that isn't on PATH (or in ffmpeg_location) is reported missing
+    without spawning anything; otherwise 'ffmpeg -version' runs one time.
+    """
+    with _ffmpeg_checks_lock:
+        if ffmpeg_location in _ffmpeg_checks:
+            return _ffmpeg_checks[ffmpeg_location]
+        binary = ffmpeg_binary(ffmpeg_location)
+        available = False
+        if os.path.exists(binary) or shutil.which(binary):
+            try:
+                available = subprocess.run([binary, '-version'], capture_output=True).returncode == 0
+            except OSError:
+                pass
+        _ffmpeg_checks[ffmpeg_location] = available
+        return available
+
+
+def metadata_args(metadata):
+    """Build -metadata arguments from a dict, skipping empty values"""
+    args = []
+    for key, value in (metadata or {}).items():
+        if value:
+            args += ['-metadata', f'{key}={value}']
+    return args
+
+
+def run_ffmpeg(args, ffmpeg_location=None, loglevel='error'):
+    """
+    Run ffmpeg with the given arguments
+
+    Pass loglevel='info' to get filter reports (e.g. loudnorm's
+    measurements) in the returned process's stderr.
+
+    Raises:
+        TranscodeError: if ffmpeg is missing or exits non-zero
+    """
+    cmd = ffmpeg_command(args, ffmpeg_location, loglevel)
+    started = time.perf_counter()
+    try:
+        child = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise TranscodeError('FFmpeg not found in PATH')
+    try:
+        with child.stderr:
+            stderr = child.stderr.read()
+        rusage = _reap(child)
+    except BaseException:
+        child.kill()
+        child.wait()
+        raise
+    _profile(cmd, started, rusage)
+    proc = subprocess.CompletedProcess(cmd, child.returncode, None, stderr)
+    if proc.returncode != 0:
+        raise TranscodeError(_error_message(proc.returncode, proc.stderr))
+    return proc
+
+
+def _run_piped(chunks, args, ffmpeg_location=None, loglevel='error'):
+    """
+    Run ffmpeg reading its input from stdin, fed from an iterable of bytes
+
+    args must use 'pipe:0' as the input. Encoding starts with the first
+    chunk, so a network download and the encode overlap.
+
+    Returns:
+        tuple: (bytes written to ffmpeg, ffmpeg's stderr)
+
+    Raises:
+        TranscodeError: if ffmpeg is missing, exits non-zero, or stops
+                        reading early
+    """
+    cmd = ffmpeg_command(args, ffmpeg_location, loglevel)
+    started = time.perf_counter()
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise TranscodeError('FFmpeg not found in PATH')
+
+    # Drain stderr on the side so a chatty ffmpeg can't block on a full pipe
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), name='ffmpeg-stderr',
+                             daemon=True)
+    drain.start()
+
+    written = 0
+    broken = False
+    try:
+        for chunk in chunks:
+            try:
+                proc.stdin.write(chunk)
+            except (BrokenPipeError, OSError):
+                broken = True
+                break
+            written += len(chunk)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        rusage = _reap(proc)
+        drain.join()
+        _profile(cmd, started, rusage)
+
+    if proc.returncode != 0:
+        raise TranscodeError(_error_message(proc.returncode, b''.join(stderr)))
+    if broken:
+        raise TranscodeError('ffmpeg stopped reading its input')
+    return written, b''.join(stderr)
+
+
+def _reap(proc):
+    """
+    Wait for ffmpeg to exit, returning its resource usage where available
+
+    On POSIX the child is reaped with os.wait4, which reports the child's
+    own CPU time (Popen.wait discards it); the exit code is set on proc.
+    """
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        return None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def _profile(cmd, started, rusage):
+    """Report a finished ffmpeg run to the active profiler, if any"""
+    active = profiler.active()
+    if active is not None:
+        active.record_process(cmd, time.perf_counter() - started, rusage)
+
+
+def ffmpeg_command(args, ffmpeg_location=None, loglevel='error'):
+    # -nostats keeps progress lines out of a more verbose log
+    verbosity = ['-loglevel', loglevel] + (['-nostats'] if loglevel != 'error' else [])
+    return [ffmpeg_binary(ffmpeg_location), '-hide_banner'] + verbosity + ['-y'] + list(args)
+
+
+def _error_message(returncode, stderr):
+    message = (stderr or b'').decode('utf-8', 'replace').strip()
+    return message or f'ffmpeg exited with code {returncode}'
+
+
+# Output codec -> encoder settings. 'acodecs' are the yt-dlp acodec prefixes
+# that can be stream-copied into the output container unchanged, and
+# 'format' is the yt-dlp selector that prefers such a source. Lossless
+# encoders take no bitrate.
+AUDIO_CODECS = {
+    'mp3': {'ext': 'mp3', 'acodecs': ('mp3',), 'encoder': 'libmp3lame',
+            'format': 'bestaudio[acodec=mp3]/bestaudio/best'},
+    'm4a': {'ext': 'm4a', 'acodecs': ('mp4a', 'aac'), 'encoder': 'aac',
+            'format': 'bestaudio[ext=m4a]/bestaudio/best'},
+    'opus': {'ext': 'opus', 'acodecs': ('opus',), 'encoder': 'libopus',
+             'format': 'bestaudio[acodec=opus]/bestaudio/best'},
+    'flac': {'ext': 'flac', 'acodecs': ('flac',), 'encoder': 'flac', 'lossless': True,
+             'format': 'bestaudio/best'},
+}
+
+# Copying a source this much above the requested bitrate would produce a
+# noticeably bigger file than asked for, so it is re-encoded instead
+COPY_BITRATE_TOLERANCE = 1.1
+
+
+def codec_info(codec):
+    """Settings for an output codec, raising ValueError for unknown ones"""
+    try:
+        return AUDIO_CODECS[codec.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown audio codec: {codec} (use {', '.join(AUDIO_CODECS)})")
+
+
+def can_copy(codec, source_acodec, source_abr=None, quality=None):
+    """
+    True if the source audio can be remuxed into the output without encoding
+
+    The source codec has to match the output codec. If the source bitrate is
+    known, it must also not be far above the requested quality. Pass
+    quality=None or 'best' to keep the source as it is.
+    """
+    if not source_acodec:
+        return False
+    family = source_acodec.lower().split('.')[0]
+    settings = codec_info(codec)
+    if family not in settings['acodecs']:
+        return False
+    if quality in (None, 'best') or not source_abr or settings.get('lossless'):
+        return True
+    try:
+        return float(source_abr) <= float(quality) * COPY_BITRATE_TOLERANCE
+    except (TypeError, ValueError):
+        return True
+
+
+def audio_args(codec='mp3', quality='192', metadata=None, copy=False, filters=None):
+    """
+    Output arguments: remux with -c:a copy, or encode at the given bitrate
+
+    filters is an -af filter graph applied while encoding (ignored with copy).
+    """
+    args = ['-vn']
+    if copy:
+        args += ['-c:a', 'copy']
+    else:
+        settings = codec_info(codec)
+        if filters:
+            args += ['-af', filters]
+        args += ['-c:a', settings['encoder']]
+        if quality not in (None, 'best') and not settings.get('lossless'):
+            args += ['-b:a', f'{quality}k']
+    return args + metadata_args(metadata)
+
+
+# EBU R128 loudness normalization (FFmpeg loudnorm). Integrated loudness in
+# LUFS, true peak in dBTP, loudness range in LU.
+LOUDNESS_TARGET = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0}
+# loudnorm resamples to 192 kHz internally; every output codec takes 48 kHz
+LOUDNESS_SAMPLE_RATE = 48000
+# Values loudnorm reports about its input, needed for a linear (second) pass
+LOUDNESS_KEYS = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+
+SINGLE_PASS = 'single'
+TWO_PASS = 'two-pass'
+NORMALIZE_MODES = (SINGLE_PASS, TWO_PASS)
+
+_LOUDNORM_REPORT = re.compile(rb'\{[^{}]*"input_i"[^{}]*\}')
+
+
+def normalize_mode(normalize):
+    """
+    None (off), SINGLE_PASS or TWO_PASS from a normalize option
+
+    True means SINGLE_PASS; False, None and '' mean off.
+
+    Raises:
+        ValueError: for anything else
+    """
+    if normalize in (None, False, ''):
+        return None
+    if normalize is True:
+        return SINGLE_PASS
+    if normalize not in NORMALIZE_MODES:
+        raise ValueError(f"normalize must be one of {', '.join(NORMALIZE_MODES)}")
+    return normalize
+
+
+def loudness_target_key(target=None):
+    """Stable string for a loudness target, e.g. 'I=-16.0:TP=-1.5:LRA=11.0'"""
+    target = target or LOUDNESS_TARGET
+    return ':'.join(f'{key}={float(target[key])}' for key in ('I', 'TP', 'LRA'))
+
+
+def loudnorm_filter(measured=None, target=None):
+    """
+    loudnorm filter graph for one output
+
+    Without measurements loudnorm runs in dynamic mode: it measures the
+    input as it normalizes it and prints the measurements when done. With
+    measurements from an earlier pass it applies one linear gain instead,
+    which keeps the dynamics intact.
+    """
+    target = target or LOUDNESS_TARGET
+    graph = f"loudnorm=I={target['I']}:TP={target['TP']}:LRA={target['LRA']}"
+    if measured:
+        graph += (f":measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+                  f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+                  f":offset={measured['target_offset']}:linear=true")
+    else:
+        graph += ':print_format=json'
+    return f'{graph},aresample={LOUDNESS_SAMPLE_RATE}'
+
+
+def parse_loudnorm(stderr):
+    """
+    Input measurements from loudnorm's print_format=json report
+
+    Returns:
+        dict or None: LOUDNESS_KEYS -> float
+    """
+    reports = _LOUDNORM_REPORT.findall(stderr or b'')
+    if not reports:
+        return None
+    try:
+        report = json.loads(reports[-1])
+        measured = {key: float(report[key]) for key in LOUDNESS_KEYS}
+    except (ValueError, KeyError):
+        return None
+    # Silence measures as -inf, which a linear pass can't use
+    return measured if all(map(math.isfinite, measured.values())) else None
+
+
+def analyze_loudness(source, ffmpeg_location=None, target=None):
+    """
+    Measure a file's loudness without writing any output (first pass)
+
+    Raises:
+        TranscodeError: if ffmpeg fails or reports nothing
+    """
+    target = target or LOUDNESS_TARGET
+    graph = f"loudnorm=I={target['I']}:TP={target['TP']}:LRA={target['LRA']}:print_format=json"
+    proc = run_ffmpeg(['-i', source, '-vn', '-af', graph, '-f', 'null', '-'],
+                      ffmpeg_location, loglevel='info')
+    measured = parse_loudnorm(proc.stderr)
+    if measured is None:
+        raise TranscodeError('loudnorm reported no measurements')
+    return measured
+
+
+class EncodeJob:
+    """
+    One audio output: codec, bitrate, tags and its filter graph, run as one FFmpeg pass
+
+    With normalize set, the source is never stream-copied. If measurements
+    are passed in (e.g. from loudness_cache), loudnorm applies them in linear
+    mode and nothing is analyzed. Otherwise SINGLE_PASS measures while it
+    encodes, so the audio is decoded once. TWO_PASS runs a separate analysis
+    first and then a linear encode (file sources only; a stream can't be read
+    twice, so it measures while encoding like SINGLE_PASS).
+
+    After run/stream, loudness holds the measurements used or taken and
+    analysis says where they came from: 'cached', SINGLE_PASS, TWO_PASS or
+    None.
+
+    Args:
+        codec: Output codec (see AUDIO_CODECS)
+        quality: Bitrate in kbps, or 'best'
+        metadata: Optional dict of tags
+        normalize: None, True, SINGLE_PASS or TWO_PASS
+        measured: Cached LOUDNESS_KEYS measurements of this source
+        target: Loudness target (default LOUDNESS_TARGET)
+    """
+
+    def __init__(self, codec='mp3', quality='192', metadata=None, normalize=None, measured=None,
+                 target=None):
+        self.codec = codec
+        self.quality = quality
+        self.metadata = metadata
+        self.normalize = normalize_mode(normalize)
+        self.target = target or LOUDNESS_TARGET
+        self.loudness = measured if self.normalize else None
+        self.analysis = 'cached' if self.loudness else None
+
+    def filters(self):
+        """The -af graph for the encode, or None"""
+        if not self.normalize:
+            return None
+        return loudnorm_filter(self.loudness, self.target)
+
+    def can_copy(self, source_acodec=None, source_abr=None):
+        return not self.normalize and can_copy(self.codec, source_acodec, source_abr, self.quality)
+
+    def run(self, source, target, ffmpeg_location=None, source_acodec=None, source_abr=None):
+        """
+        Produce the output file from a source file
+
+        Returns:
+            str: 'copy' if the audio was remuxed, 'encode' if it was transcoded
+        """
+        if self.can_copy(source_acodec, source_abr):
+            try:
+                run_ffmpeg(['-i', source] + self.args(copy=True) + [target], ffmpeg_location)
+                return 'copy'
+            except TranscodeError:
+                # Container refused the stream as-is; encode instead
+                pass
+        self._analyze(source, ffmpeg_location)
+        proc = run_ffmpeg(['-i', source] + self.args() + [target], ffmpeg_location,
+                          self._loglevel())
+        self._measured(proc.stderr)
+        return 'encode'
+
+    def stream(self, chunks, target, ffmpeg_location=None, source_acodec=None, source_abr=None):
+        """
+        Like run, reading the source from an iterable of bytes
+
+        Returns:
+            tuple: ('copy' or 'encode', bytes read from the stream)
+        """
+        mode = 'copy' if self.can_copy(source_acodec, source_abr) else 'encode'
+        args = ['-i', 'pipe:0'] + self.args(copy=mode == 'copy') + [target]
+        written, stderr = _run_piped(chunks, args, ffmpeg_location, self._loglevel())
+        self._measured(stderr)
+        return mode, written
+
+    def args(self, copy=False):
+        return audio_args(self.codec, self.quality, self.metadata, copy, self.filters())
+
+    def _analyze(self, source, ffmpeg_location, measured=None):
+        """TWO_PASS first pass (or reuse measured from a job with the same target)"""
+        if self.normalize == TWO_PASS and self.loudness is None:
+            self.loudness = measured or analyze_loudness(source, ffmpeg_location, self.target)
+            self.analysis = TWO_PASS
+        return self.loudness
+
+    def _loglevel(self):
+        # loudnorm prints its report at info level; only ask for it when measuring
+        return 'info' if self.normalize and self.loudness is None else 'error'
+
+    def _measured(self, stderr):
+        if self.normalize and self.loudness is None:
+            self.loudness = parse_loudnorm(stderr)
+            self.analysis = SINGLE_PASS if self.loudness else None
+
+
+def encode_outputs(source, outputs, ffmpeg_location=None, source_acodec=None, source_abr=None):
+    """
+    Produce several audio outputs from one source in a single FFmpeg run
+
+    Each output keeps its own codec, bitrate, tags and filter graph, but
+    the source is read and decoded once for all of them. Outputs that can
+    be stream-copied are copied in the same run; if a container refuses a
+    copy, the run is repeated with every output encoded. A TWO_PASS
+    analysis (or cached measurements) is shared by every normalized output
+    with the same loudness target.
+
+    Args:
+        outputs: List of (EncodeJob, target path)
+
+    Returns:
+        list: 'copy' or 'encode' per output
+    """
+    analyzed = {}
+    for job, _ in outputs:
+        key = loudness_target_key(job.target)
+        analyzed[key] = job._analyze(source, ffmpeg_location, analyzed.get(key)) or analyzed.get(key)
+    for job, _ in outputs:
+        # Once the source has been measured, every normalized output can use it
+        if job.normalize and job.loudness is None and analyzed.get(loudness_target_key(job.target)):
+            job.loudness = analyzed[loudness_target_key(job.target)]
+            job.analysis = TWO_PASS
+
+    def run(copies):
+        args = ['-i', source]
+        for (job, target), copy in zip(outputs, copies):
+            args += job.args(copy) + [target]
+        loglevel = 'info' if any(not copy and job._loglevel() == 'info'
+                                 for (job, _), copy in zip(outputs, copies)) else 'error'
+        return run_ffmpeg(args, ffmpeg_location, loglevel)
+
+    copies = [job.can_copy(source_acodec, source_abr) for job, _ in outputs]
+    try:
+        proc = run(copies)
+    except TranscodeError:
+        if not any(copies):
+            raise
+        copies = [False] * len(outputs)
+        proc = run(copies)
+    for (job, _), copy in zip(outputs, copies):
+        if not copy:
+            job._measured(proc.stderr)
+    return ['copy' if copy else 'encode' for copy in copies]
+
+
+# Codecs the MP4 container can carry as-is (yt-dlp vcodec/acodec prefixes)
+MP4_VIDEO_CODECS = ('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'av01', 'vp09', 'vp9')
+MP4_AUDIO_CODECS = ('mp4a', 'aac', 'mp3', 'opus', 'ac-3', 'ec-3')
+
+
+def mp4_compatible(codec, allowed):
+    """True if a yt-dlp codec string names a codec MP4 can hold without re-encoding"""
+    return bool(codec) and codec.lower().split('.')[0] in allowed
+
+
+def mux_mp4(video, target, audio=None, vcodec=None, acodec=None, ffmpeg_location=None):
+    """
+    Put a video (plus an optional separate audio file) into an MP4
+
+    Streams are copied when MP4 can carry them and re-encoded (H.264/AAC)
+    otherwise. If FFmpeg refuses a copy, everything is re-encoded.
+
+    Returns:
+        str: 'copy' if nothing was re-encoded, 'encode' otherwise
+    """
+    inputs = ['-i', video] + (['-i', audio] if audio else [])
+    maps = ['-map', '0:v:0', '-map', '1:a:0' if audio else '0:a:0?']
+    copy_video = mp4_compatible(vcodec, MP4_VIDEO_CODECS)
+    copy_audio = mp4_compatible(acodec, MP4_AUDIO_CODECS) or acodec == 'none'
+
+    def run(video_codec, audio_codec):
+        run_ffmpeg(inputs + maps + ['-c:v', video_codec, '-c:a', audio_codec,
+                                    '-movflags', '+faststart', target], ffmpeg_location)
+
+    if copy_video and copy_audio:
+        try:
+            run('copy', 'copy')
+            return 'copy'
+        except TranscodeError:
+            copy_video = copy_audio = False
+    run('copy' if copy_video else 'libx264', 'copy' if copy_audio else 'aac')
+    return 'encode'
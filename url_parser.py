@@ -0,0 +1,144 @@
+"""
+url_parser.py - Parse YouTube URLs into canonical video, playlist and channel keys
+
+One precompiled pattern matches the scheme, host and path of every URL
+shape we accept, and a second walks the query string once for v=, list=
+and timestamps:
+
+    youtube.com/watch?v=ID, youtu.be/ID, /shorts/ID, /embed/ID, /live/ID,
+    /v/ID, /e/ID on www., m., music. and youtube-nocookie.com;
+    /playlist?list=ID and /embed/videoseries?list=ID;
+    /@handle, /channel/UC..., /c/name, /user/name, optionally on a tab.
+
+Everything else (other hosts, watch URLs without a valid 11-character ID)
+is rejected, so callers can dedup on the canonical key alone.
+"""
+import re
+from collections import namedtuple
+
+VIDEO = 'video'
+PLAYLIST = 'playlist'
+CHANNEL = 'channel'
+
+WATCH_URL = 'https://www.youtube.com/watch?v={}'
+PLAYLIST_URL = 'https://www.youtube.com/playlist?list={}'
+CHANNEL_URL = 'https://www.youtube.com/{}'
+
+ParsedUrl = namedtuple('ParsedUrl', 'kind video_id playlist_id channel tab start canonical key')
+ParsedUrl.__doc__ = """
+A parsed YouTube URL
+
+    kind: VIDEO, PLAYLIST or CHANNEL
+    video_id: 11-character ID (videos only)
+    playlist_id: list= ID; a video URL keeps the playlist it was opened from
+    channel: '@handle', 'channel/UC...', 'c/name' or 'user/name'
+    tab: Channel tab ('videos', 'shorts', ...) or None
+    start: Timestamp in seconds from t=, start= or #t=, or None
+    canonical: URL to hand to yt-dlp (no tracking or timestamp parameters)
+    key: Dedup key: the video ID, 'playlist:<id>' or 'channel:<name>[/<tab>]'
+"""
+
+_URL_PATTERN = re.compile(r"""
+    \s*(?i:https?://)?
+    (?:
+        (?i:youtu\.be)/(?P<short_id>[A-Za-z0-9_-]{11})
+      | (?i:(?:www\.|m\.|music\.)?youtube(?:-nocookie)?\.com)
+        (?:
+            /(?P<playlist>playlist|embed/videoseries)
+          | /(?:shorts|embed|live|v|e)/(?P<path_id>[A-Za-z0-9_-]{11})
+          | /(?P<watch>watch)
+          | /(?P<channel>@[\w.-]+|channel/UC[\w-]{22}|c/[\w.-]+|user/[\w.-]+)
+            (?:/(?P<tab>videos|shorts|streams|playlists|featured))?
+        )
+    )
+    /?(?:\?(?P<query>[^\#\s]*))?(?:\#(?P<fragment>\S*))?\s*
+""", re.X)
+
+_PARAM_PATTERN = re.compile(r'(?:^|&)(v|list|t|start|time_continue)=([^&]*)')
+_VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+_PLAYLIST_ID = re.compile(r'[\w-]{2,}')
+_TIMESTAMP = re.compile(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?')
+_WATCH_PREFIX = WATCH_URL.format('')
+_CANONICAL_LENGTH = len(_WATCH_PREFIX) + 11
+
+
+def parse(url):
+    """
+    Parse a YouTube URL
+
+    Returns:
+        ParsedUrl, or None if url isn't a recognised video, playlist or channel URL
+    """
+    if not url:
+        return None
+    if url.startswith(_WATCH_PREFIX) and len(url) == _CANONICAL_LENGTH:
+        # Our own canonical form, which is re-parsed all along the pipeline
+        video_id = url[len(_WATCH_PREFIX):]
+        if _VIDEO_ID.fullmatch(video_id):
+            return ParsedUrl(VIDEO, video_id, None, None, None, None, url, video_id)
+    match = _URL_PATTERN.fullmatch(url)
+    if match is None:
+        return None
+    short_id, playlist, path_id, watch, channel, tab, query, fragment = match.groups()
+
+    params = {}
+    if query or fragment:
+        # Reversed so the first occurrence of a repeated parameter wins
+        found = _PARAM_PATTERN.findall(query) if query else []
+        if fragment:
+            found += _PARAM_PATTERN.findall(fragment)
+        params = dict(reversed(found))
+
+    playlist_id = params.get('list')
+    if playlist_id is not None and not _PLAYLIST_ID.fullmatch(playlist_id):
+        playlist_id = None
+
+    video_id = short_id or path_id
+    if watch:
+        video_id = params.get('v')
+        if video_id is None or not _VIDEO_ID.fullmatch(video_id):
+            if playlist_id is None:
+                return None
+            # watch?list=... without a video plays the playlist
+            return _playlist(playlist_id)
+
+    if video_id is not None:
+        start = params.get('t') or params.get('start') or params.get('time_continue')
+        return ParsedUrl(VIDEO, video_id, playlist_id, None, None, start and _seconds(start),
+                         WATCH_URL.format(video_id), video_id)
+
+    if playlist:
+        return _playlist(playlist_id) if playlist_id else None
+
+    path = f'{channel}/{tab}' if tab else channel
+    # Handles are case-insensitive; UC... channel IDs are not
+    key = path.lower() if channel.startswith('@') else path
+    return ParsedUrl(CHANNEL, None, None, channel, tab, None,
+                     CHANNEL_URL.format(path), f'channel:{key}')
+
+
+def video_id(url):
+    """The video ID of a video URL, or None"""
+    parsed = parse(url)
+    return parsed.video_id if parsed is not None else None
+
+
+def is_video_id(value):
+    """True for a well-formed 11-character video ID (not a playlist or channel ID)"""
+    return isinstance(value, str) and _VIDEO_ID.fullmatch(value) is not None
+
+
+def _playlist(playlist_id):
+    return ParsedUrl(PLAYLIST, None, playlist_id, None, None, None,
+                     PLAYLIST_URL.format(playlist_id), f'playlist:{playlist_id}')
+
+
+def _seconds(value):
+    """'90', '90s', '1m30s', '1h2m3s' -> seconds; None if absent or malformed"""
+    if not value:
+        return None
+    match = _TIMESTAMP.fullmatch(value)
+    if match is None or not any(match.groups()):
+        return None
+    hours, minutes, seconds = (int(part) if part else 0 for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds